@@ -0,0 +1,240 @@
+"""
+asyncio flavored sending. Requires Python 3.5+ and ``aiohttp``, which
+is why none of this lives in ``grapevine.engines``.
+
+    GRAPEVINE = {
+        'SENDER_CLASS': 'grapevine.aio.AsyncioSender',
+    }
+"""
+from __future__ import unicode_literals
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Django
+from django.db import connections
+
+# 3rd Party
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Local Apps
+from grapevine.emails.utils import ConnectionRepo
+from grapevine.settings import grapevine_settings
+
+
+class AsyncSendMixin(object):
+    """
+    Gives ``GrapevineEmailBackend`` asyncio counterparts to ``send_messages``
+    and ``send``, for backends that describe their provider calls with
+    ``get_request`` and interpret the results with ``handle_response``.
+    """
+
+    async def async_send_messages(self, email_messages, session):
+        """
+        Arguments:
+        @email_messages  {list}                   Messages built by this backend.
+        @session         {aiohttp.ClientSession}
+
+        Returns  {int}  The number of messages sent.
+        """
+        results = await asyncio.gather(*[
+            self.async_send_message(email_message, session) for email_message in email_messages
+        ])
+        return len([is_sent for is_sent in results if is_sent])
+
+    async def async_send_message(self, email_message, session):
+        url, request_kwargs = self.get_request(email_message)
+        try:
+            async with session.post(url, **as_aiohttp_kwargs(request_kwargs)) as response:
+                content = await response.read()
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return False
+
+        return self.handle_response(email_message, response.status, content)
+
+
+def as_aiohttp_kwargs(request_kwargs):
+    """
+    Translates ``requests.post`` style keyword arguments into their
+    ``aiohttp`` equivalents.
+    """
+    request_kwargs = dict(request_kwargs)
+
+    auth = request_kwargs.pop('auth', None)
+    if auth is not None:
+        request_kwargs['auth'] = aiohttp.BasicAuth(*auth)
+
+    files = request_kwargs.pop('files', None)
+    if files:
+        form = aiohttp.FormData()
+        for key, value in (request_kwargs.pop('data', None) or {}).items():
+            form.add_field(key, value)
+        for key, value in files.items():
+            form.add_field(key, value, filename=key)
+        request_kwargs['data'] = form
+
+    return request_kwargs
+
+
+class AsyncioSender(object):
+    """
+    Keeps up to ``SENDER_ASYNC_CONCURRENCY`` provider calls in flight at once
+    from a single event loop. Rendering and all other DB work runs on a small
+    pool of ``SENDER_THREADS`` threads, because the ORM would otherwise block
+    the loop.
+
+    Emails whose backend does not implement ``get_request`` are sent
+    start to finish on that thread pool instead.
+
+    Like ``grapevine.engines.ThreadedSender``, ``send()`` only collects the
+    sendable and ``wait()`` does the actual work.
+    """
+
+    def __init__(self, concurrency=None, num_threads=None):
+        self.concurrency = concurrency or grapevine_settings.SENDER_ASYNC_CONCURRENCY
+        self.num_threads = num_threads or grapevine_settings.SENDER_THREADS
+        self.pending = []
+
+    def send(self, sendable, *args, **kwargs):
+        if aiohttp is None:
+            raise ValueError("aiohttp is not installed, which means the AsyncioSender is unavailable.")
+
+        self.pending.append((sendable, args, kwargs,))
+
+    def wait(self):
+        """
+        Sends everything handed to ``send()``.
+
+        Returns  {int}  How many sendables were sent since the last ``wait()``.
+        Re-raises the first error hit, after everything else has been sent.
+        """
+        pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        try:
+            results = loop.run_until_complete(self.send_all(loop, executor, pending))
+        finally:
+            self.close_connections(executor)
+            executor.shutdown(wait=True)
+            loop.close()
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return len([is_sent for is_sent in results if is_sent])
+
+    async def send_all(self, loop, executor, pending):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(fnc, *args, **kwargs):
+            return await loop.run_in_executor(executor, functools.partial(fnc, *args, **kwargs))
+
+        async with aiohttp.ClientSession() as session:
+            return await asyncio.gather(*[
+                self.send_one(run, semaphore, session, sendable, args, kwargs)
+                for sendable, args, kwargs in pending
+            ], return_exceptions=True)
+
+    async def send_one(self, run, semaphore, session, sendable, args, kwargs):
+        async with semaphore:
+            try:
+                prepared = await run(self.prepare, sendable, *args, **kwargs)
+            except Exception:
+                # Let the next run have another go at it
+                await run(sendable.delete_from_queue)
+                raise
+
+            if not isinstance(prepared, tuple):
+                # Already dealt with, one way or another
+                return prepared
+
+            transport, connection, msg = prepared
+            start = time.time()
+            try:
+                is_sent = await connection.async_send_message(msg, session)
+            except Exception as e:
+                await run(transport.fail_send, e)
+                return False
+
+            await run(self.finish, transport, connection, msg, is_sent, time.time() - start)
+            return is_sent
+
+    def prepare(self, sendable, recipient_address=None, is_test=False, **kwargs):
+        """
+        Runs on the thread pool. Mirrors ``SendableMixin.send`` and
+        ``EmailBackend.send`` up to the point of talking to the provider.
+
+        Returns  (transport, connection, message)  when the provider call is
+                                                   left to the event loop.
+                 {bool}                            when the sendable was sent,
+                                                   or skipped, right here.
+        """
+        # Already sent messages shouldn't be resent.
+        if not is_test and sendable.is_sent and not kwargs.pop('force_resend', False):
+            return False
+
+        if not is_test and not sendable.renew_claim():
+            return False
+
+        transport = sendable.transport = sendable.as_transport(
+            recipient_address=recipient_address, is_test=is_test, **kwargs)
+
+        backend = getattr(transport, 'backend', None)
+        connection = backend.get_connection() if backend is not None else None
+        if not hasattr(connection, 'get_request'):
+            return transport.send()
+
+        try:
+            msg = backend.prepare_message(transport)
+        except Exception as e:
+            transport.fail_send(e)
+            return False
+
+        if msg is None:
+            transport.finish_send(False, None)
+            return False
+
+        return transport, connection, msg
+
+    def finish(self, transport, connection, msg, is_sent, communication_time):
+        """
+        Runs on the thread pool. Mirrors the bookkeeping at the end of
+        ``EmailBackend.send`` and ``Transport.send``.
+        """
+        try:
+            if not is_sent:
+                msg.failure_reason = getattr(connection, 'failure_reason', None)
+                transport.backend.log_failure(transport, msg)
+            transport.finish_send(is_sent, communication_time)
+        except Exception as e:
+            transport.fail_send(e)
+
+    def close_connections(self, executor):
+        """
+        Django opens a separate DB connection for each thread, and nothing
+        else will ever close the ones opened on our pool (nor the pooled
+        email backend connections). The barrier makes
+        sure every pool thread runs exactly one of these.
+        """
+        barrier = threading.Barrier(self.num_threads)
+
+        def close():
+            try:
+                barrier.wait(timeout=5)
+            except threading.BrokenBarrierError:
+                pass
+            connections.close_all()
+            ConnectionRepo().close_thread_connections()
+
+        for future in [executor.submit(close) for i in range(self.num_threads)]:
+            future.result()
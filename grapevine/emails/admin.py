@@ -164,18 +164,19 @@ class EmailBackendAdmin(BaseModelAdmin):
 
 class RawEventAdmin(BaseModelAdmin):
 
-    readonly_fields = ['backend', 'admin_detail_payload', 'processed_on', 'processed_in',
-                       'is_queued', 'is_broken', 'remote_ip', 'created_at']
+    readonly_fields = ['backend', 'admin_detail_payload', 'state', 'queued_at', 'processed_on', 'processed_in',
+                       'remote_ip', 'created_at']
 
-    list_display = ['id', 'backend', 'admin_list_payload', 'processed_on', 'processed_in',
+    list_display = ['id', 'backend', 'admin_list_payload', 'state', 'processed_on', 'processed_in',
                     'remote_ip', 'created_at']
+    list_filter = ['state']
 
     fieldsets = (
         ('Event',
             {'fields': ('backend', 'admin_detail_payload', 'remote_ip',)},
          ),
         ('Status',
-            {'fields': ('processed_on', 'processed_in', 'is_queued', 'is_broken', 'created_at',)},
+            {'fields': ('state', 'queued_at', 'processed_on', 'processed_in', 'created_at',)},
          )
     )
 
@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 import datetime
 
 # Django
+from django.conf import settings
 from django.conf.urls import url
 from django.core.mail.backends.base import BaseEmailBackend
 from django.http import HttpResponse
@@ -11,10 +12,17 @@ from django.views.decorators.csrf import csrf_exempt
 # Local Apps
 import grapevine
 from grapevine.settings import grapevine_settings
-from grapevine.emails.utils import parse_email
+from grapevine.emails.spool import EventSpool
+from grapevine.emails.utils import normalize_email, BackendRepo, UnsubscribedRepo
 
+try:
+    from grapevine.aio import AsyncSendMixin
+except SyntaxError:
+    # No asyncio syntax in this version of Python
+    AsyncSendMixin = object
 
-class GrapevineEmailBackend(BaseEmailBackend):
+
+class GrapevineEmailBackend(AsyncSendMixin, BaseEmailBackend):
     # Used to register a callback url for the 3rd party
     DISPLAY_NAME = None
 
@@ -23,6 +31,12 @@ class GrapevineEmailBackend(BaseEmailBackend):
 
     LISTENS_FOR_EVENTS = True
 
+    # Backends that talk to their provider over plain HTTP can also implement
+    # ``get_request(email_message)``, returning a ``(url, kwargs)`` pair for
+    # ``requests.post``, and ``handle_response(email_message, status_code, content)``.
+    # Doing so lets ``async_send_messages()`` and ``grapevine.aio.AsyncioSender``
+    # make those calls over asyncio.
+
     def get_urls(self):
         urls = []
         if self.LISTENS_FOR_EVENTS:
@@ -45,6 +59,9 @@ class GrapevineEmailBackend(BaseEmailBackend):
         something like this: datetime.datetime(2012, 5, 16, 15, 46, 40, tzinfo=<UTC>)
         """
         datetime_obj = datetime.datetime.utcfromtimestamp(timestamp)
+        if not settings.USE_TZ:
+            # Databases like SQLite refuse aware datetimes in this case
+            return datetime_obj
         return timezone.make_aware(datetime_obj, timezone.get_default_timezone())
 
     @classmethod
@@ -64,32 +81,58 @@ class GrapevineEmailBackend(BaseEmailBackend):
         as the SendGrid ``mail.Mail()`` class, as the two store recipients
         internally the same way.
         """
+        return cls.finalize_messages([message])[0]
+
+    @classmethod
+    def finalize_messages(cls, messages):
+        """
+        Batch version of ``finalize_message``, which checks every recipient
+        of every message against the unsubscribe list in a single query.
+        """
         # Strip out all recipients if this is a (localhost-style)
         # TEST_EMAIL.
         if grapevine_settings.DEBUG:
-            message = cls.debugify_message(message)
-
-        # Compile a grand list of all recipient lists
-        recipient_lists = [getattr(message, 'to', []), getattr(message, 'cc', []), getattr(message, 'bcc', [])]
-        for recipient_list in recipient_lists:
-            indicies_to_pop = []
-            for index, recipient in enumerate(recipient_list):
-                try:
-                    # Remove any remaining unsubscribed emails
-                    name, address = parse_email(recipient)
-                    unsubscribed = grapevine.emails.models.UnsubscribedAddress.objects.get(
-                        address=address
-                    )
-                    indicies_to_pop.append(index)
-                except grapevine.emails.models.UnsubscribedAddress.DoesNotExist:
-                    pass
-
-            # Must loop over this list in reverse to not change
-            # the indicies of elements after the one's we remove
-            indicies_to_pop.reverse()
-            for index in indicies_to_pop:
-                recipient_list.pop(index)
+            messages = [cls.debugify_message(message) for message in messages]
+
+        unsubscribed_addresses = cls.get_unsubscribed_addresses(
+            [recipient for message in messages for recipient in cls.get_all_recipients(message)])
+
+        for message in messages:
+            cls.remove_unsubscribed(message, unsubscribed_addresses)
+
+        return messages
+
+    @staticmethod
+    def get_recipient_lists(message):
+        return [getattr(message, 'to', []), getattr(message, 'cc', []), getattr(message, 'bcc', [])]
 
+    @classmethod
+    def get_all_recipients(cls, message):
+        return [recipient for recipient_list in cls.get_recipient_lists(message) for recipient in recipient_list]
+
+    @staticmethod
+    def get_unsubscribed_addresses(recipients):
+        """
+        Returns the normalized addresses among ``recipients`` that
+        have unsubscribed.
+        """
+        addresses = set(normalize_email(recipient) for recipient in recipients)
+        if not addresses:
+            return set()
+
+        if grapevine_settings.USE_UNSUBSCRIBE_INDEX:
+            return UnsubscribedRepo().get_unsubscribed_addresses(addresses)
+
+        return set(grapevine.emails.models.UnsubscribedAddress.objects.
+                   filter(address__in=addresses).values_list('address', flat=True))
+
+    @classmethod
+    def remove_unsubscribed(cls, message, unsubscribed_addresses):
+        # Lists are altered in place, as some message classes keep
+        # references to them elsewhere
+        for recipient_list in cls.get_recipient_lists(message):
+            recipient_list[:] = [recipient for recipient in recipient_list
+                                 if normalize_email(recipient) not in unsubscribed_addresses]
         return message
 
     @csrf_exempt
@@ -101,10 +144,12 @@ class GrapevineEmailBackend(BaseEmailBackend):
         if request.method != 'POST':
             return HttpResponse(status=405)
 
-        try:
-            backend = grapevine.emails.models.EmailBackend.objects.filter(path=self.IMPORT_PATH)[0]
-        except IndexError:
-            backend = grapevine.emails.models.EmailBackend.objects.create(path=self.IMPORT_PATH)
+        if grapevine_settings.EVENT_SPOOL_DIR:
+            # Leave the database to ``drain_event_spool``
+            EventSpool().append(self.IMPORT_PATH, request.body, request.META['REMOTE_ADDR'])
+            return HttpResponse(status=200)
+
+        backend = BackendRepo().get_backend(self.IMPORT_PATH)
 
         # Pull out the payload from request.POST as per
         # https://docs.djangoproject.com/en/1.6/ref/request-response/#django.http.HttpRequest.POST
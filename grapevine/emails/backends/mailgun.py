@@ -1,19 +1,15 @@
 # Sys
 import json
 import requests
+from email.utils import parseaddr
 
-try:
-    from cStringIO import StringIO
-except ImportError:
-    try:
-        from StringIO import StringIO
-    except:
-        from io import StringIO
+from email import generator
 
 
 # Django
 from django.conf import settings
 from django.core.mail.message import sanitize_address
+from django.utils import six
 
 # Local
 from grapevine.emails.backends.base import GrapevineEmailBackend
@@ -29,9 +25,13 @@ class EmailBackend(GrapevineEmailBackend):
     DISPLAY_NAME = "mailgun"
     IMPORT_PATH = "grapevine.emails.backends.MailGunEmailBackend"
 
+    # Mailgun's cap on recipients in a single batch send
+    MAX_BATCH_RECIPIENTS = 1000
+
     def __init__(self, fail_silently=False, *args, **kwargs):
-        access_key, server_name = (kwargs.pop('access_key', None),
-                                   kwargs.pop('server_name', None))
+        access_key, server_name, api_url = (kwargs.pop('access_key', None),
+                                            kwargs.pop('server_name', None),
+                                            kwargs.pop('api_url', None))
 
         super(EmailBackend, self).__init__(
                         fail_silently=fail_silently,
@@ -46,17 +46,28 @@ class EmailBackend(GrapevineEmailBackend):
             else:
                 raise
 
-        self._api_url = "https://api.mailgun.net/v2/%s/" % self._server_name
+        api_url = api_url or getattr(settings, 'MAILGUN_API_URL', "https://api.mailgun.net/v2/")
+        self._api_url = "%s%s/" % (api_url, self._server_name,)
+
+        # Set by ``open()`` to reuse one keep-alive connection across sends
+        self.session = None
 
     def open(self):
-        """Stub for open connection, all sends are done over HTTP POSTs
+        """Opens a keep-alive HTTP session to the API server. Without one,
+        each send makes its own one-off request.
         """
-        pass
+        if self.session is not None:
+            return False
+
+        self.session = requests.Session()
+        return True
 
     def close(self):
         """Close any open HTTP connections to the API server.
         """
-        pass
+        if self.session is not None:
+            self.session.close()
+            self.session = None
 
     def _send(self, email_message):
         """A helper method that does the actual sending."""
@@ -72,12 +83,18 @@ class EmailBackend(GrapevineEmailBackend):
                 raise
             return False
 
-        if self.r.status_code != 200:
-            failure_dict = json.loads(self.r.content)
-            failure_dict['status'] = self.r.status_code
-            self.failure_reason = json.dumps(failure_dict)
+        return self.handle_response(email_message, self.r.status_code, self.r.content)
+
+    def handle_response(self, email_message, status_code, content):
+        """
+        Interprets Mailgun's answer to a send, however it was made.
+        """
+        if status_code != 200:
+            failure_dict = json.loads(content)
+            failure_dict['status'] = status_code
+            self.failure_reason = email_message.failure_reason = json.dumps(failure_dict)
             if not self.fail_silently:
-                raise MailgunAPIError(self.r)
+                raise MailgunAPIError(status_code, content)
             return False
 
         return True
@@ -118,14 +135,42 @@ class EmailBackend(GrapevineEmailBackend):
 
         return data
 
+    def get_request(self, email_message, data=None):
+        """
+        Describes the API call that sends ``email_message`` as a
+        ``(url, kwargs)`` pair in the style of ``requests.post``, so that
+        asyncio engines can make the same call.
+        """
+        if data is None:
+            data = self.prepare_data(email_message)
+
+        return self._api_url + "messages.mime", {
+            "auth": ("api", self._access_key),
+            "data": data,
+            "files": {
+                "message": self.get_mime_file(email_message),
+            },
+        }
+
+    @staticmethod
+    def get_mime_file(email_message):
+        """
+        Renders ``email_message`` as MIME bytes straight into a buffer that
+        can be uploaded as is. Going through ``as_string()`` would hold an
+        extra full copy of the message, and a text one at that, which
+        mangles non-ASCII bodies on Python 3.
+        """
+        mime_file = six.BytesIO()
+        if six.PY2:
+            generator.Generator(mime_file, mangle_from_=False).flatten(email_message.message())
+        else:
+            generator.BytesGenerator(mime_file, mangle_from_=False).flatten(email_message.message())
+        mime_file.seek(0)
+        return mime_file
+
     def post(self, email_message, data):
-        return requests.post(self._api_url + "messages.mime",
-            auth=("api", self._access_key),
-            data=data,
-            files={
-                "message": StringIO(email_message.message().as_string()),
-            }
-        )
+        url, request_kwargs = self.get_request(email_message, data)
+        return (self.session or requests).post(url, **request_kwargs)
 
     def send_messages(self, email_messages):
         """Sends one or more EmailMessage objects and returns the number of
@@ -135,8 +180,120 @@ class EmailBackend(GrapevineEmailBackend):
             return
 
         num_sent = 0
-        for message in email_messages:
-            if self._send(message):
-                num_sent += 1
+        for batch in self.get_batches(email_messages):
+            if len(batch) > 1:
+                self.send_batch(batch)
+            else:
+                # Lets ``EmailBackend.send_many`` tell which ones made it
+                batch[0].is_sent = self._send(batch[0])
+
+            num_sent += len([message for message in batch if message.is_sent])
 
         return num_sent
+
+    def get_batch_key(self, email_message):
+        """
+        Returns a key shared by every message that could go out in the same
+        batch send as ``email_message``, or ``None`` if it must go alone.
+
+        Batch sends give each ``to`` address its own copy, so only messages
+        with a single recipient and no attachments qualify.
+        """
+        if len(email_message.to) != 1 or email_message.cc or email_message.bcc or \
+                email_message.attachments or not hasattr(email_message, '_email'):
+            return None
+
+        return json.dumps([
+            email_message.from_email, email_message.subject, email_message.body,
+            getattr(email_message, 'alternatives', []), email_message.extra_headers,
+            getattr(email_message, 'reply_to', []),
+        ], sort_keys=True)
+
+    def get_batches(self, email_messages):
+        """
+        Splits ``email_messages`` into lists that can each be sent with a
+        single request. A recipient can only appear once per batch, as
+        recipient variables are keyed by address.
+        """
+        batches = []
+        open_batches = {}
+        for email_message in email_messages:
+            key = self.get_batch_key(email_message)
+            if key is None:
+                batches.append([email_message])
+                continue
+
+            address = self.get_batch_address(email_message)
+            batch, addresses = open_batches.get(key, (None, None,))
+            if batch is None or address in addresses or len(batch) == self.MAX_BATCH_RECIPIENTS:
+                batch, addresses = [], set()
+                open_batches[key] = (batch, addresses,)
+                batches.append(batch)
+
+            batch.append(email_message)
+            addresses.add(address)
+
+        return batches
+
+    @staticmethod
+    def get_batch_address(email_message):
+        """
+        The bare address, which is what recipient variables are keyed by.
+        """
+        return parseaddr(email_message.to[0])[1].lower()
+
+    def send_batch(self, email_messages):
+        """
+        Sends messages with identical content in one request. Mailgun's
+        recipient variables fill in each recipient's Grapevine guid, so
+        events can still be tied back to the right ``Email``.
+        """
+        url, request_kwargs = self.get_batch_request(email_messages)
+
+        try:
+            response = (self.session or requests).post(url, **request_kwargs)
+            is_sent = self.handle_response(email_messages[0], response.status_code, response.content)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            is_sent = False
+
+        for email_message in email_messages:
+            email_message.is_sent = is_sent
+            if not is_sent:
+                email_message.failure_reason = getattr(email_messages[0], 'failure_reason', None)
+
+        return is_sent
+
+    def get_batch_request(self, email_messages):
+        """
+        Like ``get_request``, but for a whole batch from ``get_batches``.
+        """
+        first = email_messages[0]
+
+        data = {
+            "to": [sanitize_address(email_message.to[0], email_message.encoding) for email_message in email_messages],
+            "from": sanitize_address(first.from_email, first.encoding),
+            "subject": first.subject,
+            "text": first.body,
+            "recipient-variables": json.dumps(dict(
+                (self.get_batch_address(email_message), {"guid": email_message._email.guid},)
+                for email_message in email_messages)),
+            "v:grapevine-guid": "%recipient.guid%",
+        }
+
+        for content, mimetype in getattr(first, "alternatives", []):
+            if mimetype == "text/html":
+                data["html"] = content
+                break
+
+        if getattr(first, "reply_to", None):
+            data["h:Reply-To"] = ", ".join(first.reply_to)
+        for name, value in first.extra_headers.items():
+            if value:
+                data["h:%s" % (name,)] = value
+
+        return self._api_url + "messages", {
+            "auth": ("api", self._access_key),
+            "data": data,
+        }
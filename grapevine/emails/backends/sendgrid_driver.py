@@ -1,11 +1,14 @@
 from __future__ import unicode_literals
 import time
 import json
+import requests
 
 # Django
 from django.conf import settings
 from django.core.mail.message import EmailMessage
 from django.db import transaction
+from django.utils import six
+from django.utils.six.moves.urllib.parse import urlencode
 
 # 3rd Party
 # from celery import shared_task
@@ -20,6 +23,7 @@ except ImportError:
 # Local Apps
 import grapevine
 from .base import GrapevineEmailBackend
+from grapevine.emails.utils import normalize_email, EventRepo, UnsubscribedRepo
 from grapevine.settings import grapevine_settings
 
 
@@ -46,6 +50,18 @@ class EmailBackend(GrapevineEmailBackend):
 
     UNIQUE_ARG_NAME = 'grapevine-guid'
 
+    # SendGrid's v3 API caps both of these per request
+    MAX_PERSONALIZATIONS = 1000
+    MAX_RECIPIENTS = 1000
+
+    # v2 filter names mapped to their v3 ``tracking_settings`` names
+    TRACKING_SETTINGS_MAP = {
+        "subscriptiontrack": "subscription_tracking",
+        "clicktrack": "click_tracking",
+        "opentrack": "open_tracking",
+        "ganalytics": "ganalytics",
+    }
+
     def __init__(self, fail_silently=False, username=None, password=None, **kwargs):
         # Sets ``self.fail_silently``
         super(EmailBackend, self).__init__(fail_silently=fail_silently)
@@ -59,6 +75,9 @@ class EmailBackend(GrapevineEmailBackend):
             else:
                 raise
 
+        # Set by ``open()`` to reuse one keep-alive connection across sends
+        self.session = None
+
         self.driver = sendgrid.SendGridClient(
             self.username, self.password,
             # Don't pass ``not self.fail_silently`` here, as that triggers
@@ -66,6 +85,22 @@ class EmailBackend(GrapevineEmailBackend):
             # returning the response, which we would strongly prefer.
             raise_errors=False)
 
+    def open(self):
+        """
+        Opens a keep-alive HTTP session to SendGrid. Without one, each
+        send makes its own one-off request.
+        """
+        if self.session is not None:
+            return False
+
+        self.session = requests.Session()
+        return True
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
     @classmethod
     def debugify_message(cls, message):
         message.set_tos([grapevine_settings.DEBUG_EMAIL_ADDRESS])
@@ -123,9 +158,11 @@ class EmailBackend(GrapevineEmailBackend):
 
         email = grapevine.models.Email.objects.create(**initial_data)
 
-        email.add_tos(django_message.to)
-        email.add_ccs(django_message.cc)
-        email.add_bccs(django_message.bcc)
+        email.add_recipients({
+            'to': django_message.to,
+            'cc': django_message.cc,
+            'bcc': django_message.bcc,
+        })
 
         return self.as_message(email)
 
@@ -134,17 +171,182 @@ class EmailBackend(GrapevineEmailBackend):
         Loops over a list (or single instance) of a Message object
         and sends said message using SendGrid's officially provided
         Python library.
+
+        With an API key, messages that only differ by recipient are
+        grouped into v3 API requests instead (see ``get_batches``).
         """
         if not isinstance(email_messages, list):
             email_messages = [email_messages]
 
         num_sent = 0
-        for email_message in email_messages:
-            if self.send(email_message):
-                num_sent += 1
+        for batch in self.get_batches(email_messages):
+            if self.can_batch and self.get_batch_key(batch[0]) is not None:
+                self.send_batch(batch)
+            else:
+                # Lets ``EmailBackend.send_many`` tell which ones made it
+                batch[0].is_sent = self.send(batch[0])
+
+            num_sent += len([email_message for email_message in batch if email_message.is_sent])
 
         return num_sent
 
+    @property
+    def can_batch(self):
+        """
+        Batches go through SendGrid's v3 API, which only takes API keys.
+        """
+        return self.driver.username is None
+
+    def get_batch_key(self, email_message):
+        """
+        Returns a key shared by every message that could go out in the same
+        v3 request as ``email_message``, or ``None`` if it must go alone.
+
+        Messages may only differ in their recipients and unique args.
+        """
+        if not isinstance(email_message, sendgrid.Mail) or email_message.files or email_message.content:
+            return None
+
+        smtpapi = dict(email_message.smtpapi.data)
+        if smtpapi.pop('to', None) or any(len(values) != 1 for values in smtpapi.pop('sub', {}).values()):
+            # Already fanned out with the SMTP API
+            return None
+        smtpapi.pop('unique_args', None)
+
+        return json.dumps([
+            email_message.from_email, email_message.from_name, email_message.reply_to,
+            email_message.subject, email_message.text, email_message.html,
+            email_message.headers, smtpapi,
+        ], sort_keys=True)
+
+    def get_batches(self, email_messages):
+        """
+        Splits ``email_messages`` into lists that can each be sent with a
+        single request, keeping within SendGrid's per-request limits.
+        """
+        if not self.can_batch:
+            return [[email_message] for email_message in email_messages]
+
+        groups = []
+        groups_by_key = {}
+        for email_message in email_messages:
+            key = self.get_batch_key(email_message)
+            if key is None:
+                groups.append([email_message])
+            else:
+                if key not in groups_by_key:
+                    groups_by_key[key] = []
+                    groups.append(groups_by_key[key])
+                groups_by_key[key].append(email_message)
+
+        batches = []
+        for group in groups:
+            batch, num_recipients = [], 0
+            for email_message in group:
+                message_recipients = len(self.get_all_recipients(email_message))
+                if batch and (len(batch) == self.MAX_PERSONALIZATIONS or
+                              num_recipients + message_recipients > self.MAX_RECIPIENTS):
+                    batches.append(batch)
+                    batch, num_recipients = [], 0
+                batch.append(email_message)
+                num_recipients += message_recipients
+            batches.append(batch)
+
+        return batches
+
+    def send_batch(self, email_messages):
+        """
+        Sends messages with identical content in one v3 API request, with a
+        personalization per message. Each personalization carries its
+        message's unique args, so events still arrive tagged with the right
+        Grapevine guid.
+        """
+        url, request_kwargs = self.get_batch_request(email_messages)
+        try:
+            response = (self.session or requests).post(url, timeout=self.driver.timeout, **request_kwargs)
+            status_code, content = response.status_code, response.text
+        except requests.RequestException as e:
+            status_code, content = 408, str(e)
+
+        # The v3 API answers "202 Accepted"
+        is_sent = self.handle_response(email_messages[0], 200 if status_code == 202 else status_code, content)
+        for email_message in email_messages:
+            email_message.send_response_code, email_message.send_response_body = status_code, content
+            email_message.is_sent = is_sent
+
+        return is_sent
+
+    def get_batch_request(self, email_messages):
+        """
+        Like ``get_request``, but for a whole batch from ``get_batches``.
+        """
+        first = email_messages[0]
+
+        body = {
+            'personalizations': [self.as_personalization(email_message) for email_message in email_messages],
+            'from': self.as_v3_address(first.from_email, first.from_name),
+            'subject': first.subject,
+            'content': [{'type': mimetype, 'value': value}
+                        for mimetype, value in (('text/plain', first.text,), ('text/html', first.html,),)
+                        if value],
+        }
+        if first.reply_to:
+            body['reply_to'] = self.as_v3_address(first.reply_to)
+        if first.headers:
+            body['headers'] = first.headers
+
+        smtpapi = first.smtpapi.data
+        if smtpapi.get('category'):
+            body['categories'] = smtpapi['category']
+
+        tracking_settings = {}
+        for name, app in smtpapi.get('filters', {}).items():
+            if name in self.TRACKING_SETTINGS_MAP:
+                app_settings = dict((key, value,) for key, value in app['settings'].items() if key != 'enabled')
+                app_settings['enable'] = bool(int(app['settings'].get('enabled', 1)))
+                tracking_settings[self.TRACKING_SETTINGS_MAP[name]] = app_settings
+        if tracking_settings:
+            body['tracking_settings'] = tracking_settings
+
+        return getattr(settings, 'SENDGRID_V3_MAIL_URL', "https://api.sendgrid.com/v3/mail/send"), {
+            'data': json.dumps(body),
+            'headers': {
+                'User-Agent': self.driver.useragent,
+                'Authorization': 'Bearer ' + self.driver.password,
+                'Content-Type': 'application/json',
+            },
+        }
+
+    def as_personalization(self, email_message):
+        # The library only records names for addresses that had one, so
+        # they can only be matched up when every address did
+        names = email_message.to_name if len(email_message.to_name) == len(email_message.to) else []
+
+        personalization = {
+            'to': [self.as_v3_address(address, name) for address, name in
+                   six.moves.zip_longest(email_message.to, names)],
+        }
+        if email_message.cc:
+            personalization['cc'] = [self.as_v3_address(address) for address in email_message.cc]
+        if email_message.bcc:
+            personalization['bcc'] = [self.as_v3_address(address) for address in email_message.bcc]
+
+        substitutions = email_message.smtpapi.data.get('sub')
+        if substitutions:
+            personalization['substitutions'] = dict((key, values[0],) for key, values in substitutions.items())
+
+        unique_args = email_message.smtpapi.data.get('unique_args')
+        if unique_args:
+            personalization['custom_args'] = dict((key, six.text_type(value),) for key, value in unique_args.items())
+
+        return personalization
+
+    @staticmethod
+    def as_v3_address(address, name=None):
+        if name:
+            return {'email': address, 'name': name}
+        return {'email': address}
+
     def send(self, email_message):
         """
         Sends a payload to SendGrid. Note that if ``self.fail_silently`` is False
@@ -158,8 +360,78 @@ class EmailBackend(GrapevineEmailBackend):
         if isinstance(email_message, EmailMessage):
             email_message = self.from_django_message(email_message)
 
-        # Finally... we pass the email_message object to SendGrid's library
-        self.send_response_code, self.send_response_body = self.driver.send(email_message)
+        # Finally... we make the same call SendGrid's library would, but over
+        # our own session so that the connection can be reused
+        url, request_kwargs = self.get_request(email_message)
+        try:
+            response = (self.session or requests).post(url, timeout=self.driver.timeout, **request_kwargs)
+        except requests.RequestException as e:
+            # SendGrid's library reports connection failures and timeouts this way
+            return self.handle_response(email_message, 408, str(e))
+
+        return self.handle_response(email_message, response.status_code, response.text)
+
+    def get_request(self, email_message):
+        """
+        Describes the call SendGrid's library would make for ``email_message``
+        as a ``(url, kwargs)`` pair in the style of ``requests.post``, so that
+        asyncio engines can make the same call.
+        """
+        headers = {
+            'User-Agent': self.driver.useragent,
+            'Accept': '*/*',
+            'Content-Type': 'application/x-www-form-urlencoded',
+        }
+        if self.driver.username is None:
+            # Using an API key
+            headers['Authorization'] = 'Bearer ' + self.driver.password
+
+        return getattr(settings, 'SENDGRID_MAIL_URL', "https://api.sendgrid.com/api/mail.send.json"), {
+            'data': urlencode(self.build_body(email_message), True),
+            'headers': headers,
+        }
+
+    def build_body(self, email_message):
+        """
+        The form fields SendGrid's Web API expects for ``email_message``, a
+        ``sendgrid.Mail``. Built from its public attributes, rather than
+        by SendGrid's library, which keeps that to itself.
+        """
+        body = {
+            'to[]': email_message.to or [email_message.from_email],
+            'toname[]': email_message.to_name,
+            'cc[]': email_message.cc,
+            'bcc[]': email_message.bcc,
+            'from': email_message.from_email,
+            'fromname': email_message.from_name,
+            'subject': email_message.subject,
+            'text': email_message.text,
+            'html': email_message.html,
+            'replyto': email_message.reply_to,
+            'headers': json.dumps(email_message.headers) if email_message.headers else '',
+            'date': email_message.date,
+            'x-smtpapi': email_message.json_string(),
+        }
+        # SendGrid's library moves an API key given as the username over to
+        # ``password``, so only it knows which of the two was configured
+        if self.driver.username is not None:
+            body['api_user'] = self.driver.username
+            body['api_key'] = self.driver.password
+
+        for filename, value in email_message.files.items():
+            body['files[%s]' % (filename,)] = value
+        for content_id, value in email_message.content.items():
+            body['content[%s]' % (content_id,)] = value
+
+        if six.PY2:
+            # ``urlencode`` only copes with bytes
+            body = dict((key, value.encode('utf-8') if isinstance(value, six.text_type) else value,)
+                        for key, value in body.items())
+
+        return dict((key, value,) for key, value in body.items() if value)
+
+    def handle_response(self, email_message, status_code, content):
+        self.send_response_code, self.send_response_body = status_code, content
 
         # Arbitrarily return True if ``self.fail_silently``, otherwise
         # only return True if SendGrid agrees that it worked
@@ -172,35 +444,17 @@ class EmailBackend(GrapevineEmailBackend):
             return sendgrid_event_name.capitalize()
 
     def process_events(self, limit=300):
-        self.get_logger().debug("Beginning async_process_events with limit=%s" % limit)
-        try:
-            # Get the backend obj
-            sendgrid_backend = grapevine.models.EmailBackend.objects.filter(path="grapevine.emails.backends.SendGridEmailBackend")[0]
-        except IndexError:
-            # If there's not even a SendGrid record in the DB then we haven't sent any emails
-            # through it and we don't have to worry about processing events
-            return None
-
-        with transaction.atomic():
-            event_pks = grapevine.models.RawEvent.objects.filter(
-                backend=sendgrid_backend,
-                processed_on=None,
-                is_queued=False).exclude(is_broken=True).values_list('pk', flat=True)[:limit]
-
-            # We must turn this queryset into a raw list of IDs, lest our
-            # update to queue the events means eventual outright evaluation
-            # of the queryset will re-run the query and return incorrect  records
-            event_pks = [event_pk for event_pk in event_pks]
-
-            grapevine.models.RawEvent.objects.filter(pk__in=event_pks).update(is_queued=True)
+        """
+        Claims and processes up to ``limit`` of SendGrid's unprocessed events.
 
-        for event_pk in event_pks:
-            grapevine.models.RawEvent.async_process.delay(event_pk)
+        Returns  {int}  How many events were processed
+        """
+        return grapevine.emails.jobs.process_raw_events(limit, backend__path=self.IMPORT_PATH)
 
     def process_event(self, raw_event):
         """
         Arguments:
-        @raw_event  {grapevine.models.RawEvent}  That which we shall process.
+        @raw_event  {grapevine.emails.models.RawEvent}  That which we shall process.
 
         Returns  (bool, float,)   Success flag, time_taken
         """
@@ -213,40 +467,73 @@ class EmailBackend(GrapevineEmailBackend):
         except:
             return False, None
 
+        # Pair each event with its type, skipping those we can't record
+        events = []
         for raw_event_dict in payload:
-
-            try:
-                # We can only process an event containing a
-                # known Grapevine guid
-                guid = raw_event_dict[self.UNIQUE_ARG_NAME]
-            except KeyError:
+            # We can only process an event containing a
+            # known Grapevine guid
+            if self.UNIQUE_ARG_NAME not in raw_event_dict:
                 continue
 
             # Figure out which event it is that happened
-            event_name = self.get_event(raw_event_dict['event'])
             try:
-                event_type = grapevine.models.Event.objects.get(name=event_name)
-            except grapevine.models.Event.DoesNotExist:
-                continue
-
-            # To which email in our system does this correspond?
-            try:
-                email = grapevine.models.Email.objects.get(guid=guid)
-            except grapevine.models.Email.DoesNotExist:
-                # Alarming, but not really anything to do.
-                # STOP DELETING RECORDS!
+                event_type = EventRepo().get_event_by_name(self.get_event(raw_event_dict['event']))
+            except KeyError:
                 continue
 
-            # Mint the event record
-            email_event, created = grapevine.models.EmailEvent.objects.get_or_create(
-                email=email, event=event_type, raw_event=raw_event, happened_at=self.datetime_from_seconds(raw_event_dict['timestamp']))
+            events.append((raw_event_dict, event_type,))
 
-            # Mark the email address as "Unsubscribed" if it's that kind of Event
-            if event_type.should_stop_sending and raw_event_dict.get('email', None):
-                grapevine.models.UnsubscribedAddress.objects.create(
-                    address=raw_event_dict['email'], email=email)
+        # To which emails in our system do these correspond? Any guid that
+        # is missing is alarming, but not really anything to do.
+        # STOP DELETING RECORDS!
+        email_pks = dict(grapevine.emails.models.Email.objects.filter(
+            guid__in=set(raw_event_dict[self.UNIQUE_ARG_NAME] for raw_event_dict, event_type in events)
+        ).values_list('guid', 'pk'))
 
-            # Note the event in the Email's direct log
-            email.append_to_log(json.dumps(raw_event_dict))
+        with transaction.atomic():
+            # Reprocessing a payload must not record its events twice
+            seen = set(grapevine.emails.models.EmailEvent.objects.filter(raw_event=raw_event).
+                       values_list('email_id', 'event_id', 'happened_at'))
+            email_events = []
+            unsubscribes = {}
+            logs = {}
+
+            for raw_event_dict, event_type in events:
+                email_pk = email_pks.get(raw_event_dict[self.UNIQUE_ARG_NAME], None)
+                if email_pk is None:
+                    continue
+
+                # Mint the event record
+                happened_at = self.datetime_from_seconds(raw_event_dict['timestamp'])
+                if (email_pk, event_type.pk, happened_at,) not in seen:
+                    seen.add((email_pk, event_type.pk, happened_at,))
+                    email_events.append(grapevine.emails.models.EmailEvent(
+                        email_id=email_pk, event=event_type, raw_event=raw_event, happened_at=happened_at))
+
+                # Mark the email address as "Unsubscribed" if it's that kind of Event
+                if event_type.should_stop_sending and raw_event_dict.get('email', None):
+                    unsubscribes.setdefault(normalize_email(raw_event_dict['email']), email_pk)
+
+                # Note the event in the Email's direct log
+                logs.setdefault(email_pk, []).append(json.dumps(raw_event_dict))
+
+            grapevine.emails.models.EmailEvent.objects.bulk_create(email_events)
+
+            if unsubscribes:
+                # Addresses that are already unsubscribed are left alone
+                for address in grapevine.emails.models.UnsubscribedAddress.objects.filter(
+                        address__in=unsubscribes.keys()).values_list('address', flat=True):
+                    unsubscribes.pop(address, None)
+
+            if unsubscribes:
+                # ``bulk_create`` skips ``save()`` and its signals
+                grapevine.emails.models.UnsubscribedAddress.objects.bulk_create([
+                    grapevine.emails.models.UnsubscribedAddress(address=address, email_id=email_pk)
+                    for address, email_pk in unsubscribes.items()
+                ])
+                # Not before other processes can see the new rows
+                transaction.on_commit(UnsubscribedRepo.bump_version)
+
+            grapevine.emails.models.Email.bulk_append_to_log(logs)
 
         return True, (time.time() - start)
@@ -1,17 +1,122 @@
 from __future__ import unicode_literals
-import inspect
+import datetime
+import gzip
+import json
+import os
+
+# Django
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 # 3rd Party
 # from celery import shared_task
 
 # Local Apps
-from . import backends
+from grapevine.settings import grapevine_settings
+
+
+def process_raw_events(limit=None, batch_size=None, **filters):
+    """
+    Claims unprocessed ``RawEvent`` rows a batch at a time and processes
+    them in this process, until ``limit`` have been handled or none are
+    left. Safe to run from any number of workers at once.
+
+    Arguments:
+    @limit       {int}  Stop after this many events. ``None`` for no limit.
+    @batch_size  {int}  How many events to claim at once. Defaults to
+                        ``GRAPEVINE['PROCESS_EVENTS_BATCH_SIZE']``.
+    @filters     {dict} Narrows which events are claimed, ex: ``backend__path``.
+
+    Returns  {int}  How many events were processed
+    """
+    from grapevine.emails.models import RawEvent
+
+    batch_size = batch_size or grapevine_settings.PROCESS_EVENTS_BATCH_SIZE
+
+    # Pick up whatever workers that died mid-batch left behind
+    RawEvent.objects.requeue_stale()
+
+    num_processed = 0
+    while limit is None or num_processed < limit:
+        if limit is not None:
+            batch_size = min(batch_size, limit - num_processed)
+
+        raw_events = RawEvent.objects.claim(batch_size, **filters)
+        if not raw_events:
+            break
+
+        # One backend instance per backend, rather than per event
+        backends = {}
+        for raw_event in raw_events:
+            if raw_event.backend_id not in backends:
+                backends[raw_event.backend_id] = raw_event.backend.kls()
+
+            try:
+                raw_event.process(backends[raw_event.backend_id])
+            except Exception:
+                # Don't let one bad payload stall the rest, or keep its claim
+                RawEvent.objects.filter(pk=raw_event.pk).update(state=RawEvent.BROKEN)
+
+        num_processed += len(raw_events)
+
+    return num_processed
 
 
 # @shared_task
 def async_process_events(limit=300):
-    for attr_name in dir(backends):
-        attr = getattr(backends, attr_name)
-        if inspect.isclass(attr) and issubclass(attr, backends.base.GrapevineEmailBackend) and hasattr(attr, 'process_events'):
-            backend = attr()
-            backend.process_events(limit)
+    return process_raw_events(limit)
+
+
+def prune_raw_events(days=None, archive_dir=None, batch_size=1000):
+    """
+    Removes processed and broken ``RawEvent`` rows older than ``days``,
+    ``batch_size`` at a time, first appending each batch to a gzipped
+    JSON-lines file in ``archive_dir`` when one is given. The ``EmailEvent``
+    rows they produced are kept.
+
+    Each batch is written as its own gzip member and only deleted once that
+    member is complete, so an interrupted run loses nothing, and the archive
+    still reads as one file with ``gzip.open`` or ``zcat``.
+
+    Arguments:
+    @days         {int}  Defaults to ``GRAPEVINE['RAW_EVENT_RETENTION_DAYS']``.
+    @archive_dir  {str}  Defaults to ``GRAPEVINE['RAW_EVENT_ARCHIVE_DIR']``.
+    @batch_size   {int}  How many rows to archive and delete at once.
+
+    Returns  {int}  How many rows were removed
+    """
+    from grapevine.emails.models import RawEvent
+
+    days = days if days is not None else grapevine_settings.RAW_EVENT_RETENTION_DAYS
+    archive_dir = archive_dir or grapevine_settings.RAW_EVENT_ARCHIVE_DIR
+    if days is None:
+        raise ValueError("No retention period given, and GRAPEVINE['RAW_EVENT_RETENTION_DAYS'] is not set.")
+
+    now = timezone.now()
+    queryset = RawEvent.objects.filter(
+        state__in=[RawEvent.PROCESSED, RawEvent.BROKEN],
+        created_at__lt=now - datetime.timedelta(days=days)).order_by('pk')
+
+    archive_filename = None
+    if archive_dir:
+        if not os.path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        archive_filename = os.path.join(archive_dir, 'raw-events-%s.jsonl.gz' % (now.strftime('%Y%m%dT%H%M%S'),))
+
+    num_pruned = 0
+    while True:
+        rows = [row for row in queryset.values(
+            'pk', 'backend__path', 'payload', 'state', 'processed_on', 'processed_in',
+            'remote_ip', 'created_at')[:batch_size]]
+        if not rows:
+            break
+
+        if archive_filename:
+            with gzip.open(archive_filename, 'ab') as archive_file:
+                for row in rows:
+                    archive_file.write((json.dumps(row, cls=DjangoJSONEncoder) + '\n').encode('utf-8'))
+
+        RawEvent.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+        num_pruned += len(rows)
+
+    return num_pruned
@@ -1,10 +1,13 @@
 from __future__ import unicode_literals
+import datetime
 
 # Django
-from django.db import models
+from django.db import connections, models, transaction
+from django.utils import timezone
 
 # Local Apps
 from grapevine.emails.utils import parse_email
+from grapevine.settings import grapevine_settings
 
 
 class EmailManager(models.Manager):
@@ -31,13 +34,101 @@ class EmailManager(models.Manager):
 
 class EmailRecipientManager(models.Manager):
 
-    def create(self, **kwargs):
+    def build(self, **kwargs):
         """
-        Handles normal `create` duties, plus some additional "address" parsing
+        Returns an unsaved recipient with its "address" parsed and its
+        domain derived, ready for ``bulk_create``, which skips ``save()``.
         """
         address = kwargs.get('address', '')
         name, address = parse_email(address)
         kwargs["name"] = name
         kwargs["address"] = address
 
-        return super(EmailRecipientManager, self).create(**kwargs)
+        recipient = self.model(**kwargs)
+        recipient.determine_domain()
+        return recipient
+
+    def create(self, **kwargs):
+        """
+        Handles normal `create` duties, plus some additional "address" parsing
+        """
+        recipient = self.build(**kwargs)
+        recipient.save(force_insert=True, using=self.db)
+        return recipient
+
+
+class RawEventManager(models.Manager):
+
+    def in_state(self, state):
+        """
+        The state is written into the SQL rather than passed as a parameter,
+        as SQLite only uses the partial indexes on pending and queued rows
+        when it can see the value being compared against.
+        """
+        quote_name = connections[self.db].ops.quote_name
+        return self.extra(where=['%s.%s = %d' % (
+            quote_name(self.model._meta.db_table), quote_name(self.model._meta.get_field('state').column),
+            state,)])
+
+    def unprocessed(self):
+        return self.in_state(self.model.PENDING)
+
+    def requeue_stale(self, lease_seconds=None):
+        """
+        Returns events claimed more than ``lease_seconds`` ago to ``PENDING``,
+        as the worker that claimed them has most likely died. The lease must
+        be longer than it takes a worker to process one batch.
+
+        Arguments:
+        @lease_seconds  {int}  Defaults to ``GRAPEVINE['PROCESS_EVENTS_LEASE_SECONDS']``.
+
+        Returns  {int}  How many events were returned
+        """
+        if lease_seconds is None:
+            lease_seconds = grapevine_settings.PROCESS_EVENTS_LEASE_SECONDS
+        expired_at = timezone.now() - datetime.timedelta(seconds=lease_seconds)
+
+        return self.in_state(self.model.QUEUED).filter(
+            models.Q(queued_at__lt=expired_at) | models.Q(queued_at=None)
+        ).update(state=self.model.PENDING, queued_at=None)
+
+    def claim(self, limit, **filters):
+        """
+        Alert: Evaluates the queryset!
+
+        Moves up to ``limit`` pending raw events to ``QUEUED``, such that
+        exactly one process can hold a given event, so any number of workers
+        can run side by side without processing anything twice.
+
+        Returns the claimed ``RawEvent`` objects, oldest first, with their
+        backends already loaded. Only empty once no pending events are left.
+        """
+        queryset = self.unprocessed().filter(**filters).order_by('pk')
+        now = timezone.now()
+
+        features = connections[self.db].features
+        with transaction.atomic(using=self.db):
+            if getattr(features, 'has_select_for_update_skip_locked', False):
+                # Concurrent workers walk disjoint rows
+                pks = [pk for pk in queryset.select_for_update(skip_locked=True).
+                       values_list('pk', flat=True)[:limit]]
+                self.filter(pk__in=pks).update(state=self.model.QUEUED, queued_at=now)
+            else:
+                # Without row locks, each row gets its own conditional
+                # UPDATE, which only one process can win. Concurrent workers
+                # read the same rows, so the losers move on past them rather
+                # than coming back empty handed.
+                pks = []
+                last_pk = None
+                while len(pks) < limit:
+                    candidate_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+                    candidate_pks = [pk for pk in candidate_queryset.values_list('pk', flat=True)[:limit - len(pks)]]
+                    if not candidate_pks:
+                        break
+                    last_pk = candidate_pks[-1]
+
+                    pks.extend([pk for pk in candidate_pks
+                                if self.filter(pk=pk, state=self.model.PENDING).update(
+                                    state=self.model.QUEUED, queued_at=now)])
+
+        return [raw_event for raw_event in self.filter(pk__in=pks).select_related('backend').order_by('pk')]
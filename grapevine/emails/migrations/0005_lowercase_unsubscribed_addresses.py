@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models.functions import Lower
+
+
+def lowercase_unsubscribed_addresses(apps, schema_editor):
+    """
+    Unsubscribe lookups are now made against lower-cased addresses.
+    """
+    UnsubscribedAddress = apps.get_model('emails', 'UnsubscribedAddress')
+    UnsubscribedAddress.objects.update(address=Lower('address'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0004_blankable_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_unsubscribed_addresses, migrations.RunPython.noop),
+    ]
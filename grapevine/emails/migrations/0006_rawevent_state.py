@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# Copied from ``RawEvent``, as migrations must not import models
+PENDING, QUEUED, PROCESSED, BROKEN = 1, 2, 3, 4
+
+
+def set_states(apps, schema_editor):
+    """
+    Folds ``is_queued``, ``processed_on``, and ``is_broken`` into ``state``,
+    later flags winning.
+    """
+    RawEvent = apps.get_model('emails', 'RawEvent')
+    RawEvent.objects.filter(is_queued=True).update(state=QUEUED)
+    RawEvent.objects.exclude(processed_on=None).update(state=PROCESSED)
+    RawEvent.objects.filter(is_broken=True).update(state=BROKEN)
+
+
+def unset_states(apps, schema_editor):
+    RawEvent = apps.get_model('emails', 'RawEvent')
+    RawEvent.objects.filter(state=QUEUED).update(is_queued=True)
+    RawEvent.objects.filter(state=BROKEN).update(is_broken=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0005_lowercase_unsubscribed_addresses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawevent',
+            name='state',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Queued'), (3, 'Processed'), (4, 'Broken')], default=1),
+        ),
+        migrations.RunPython(set_states, unset_states),
+    ]
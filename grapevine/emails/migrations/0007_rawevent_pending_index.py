@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+PENDING = 1
+
+INDEX_NAME = 'emails_rawevent_pending'
+
+# Databases that can index only the rows matching a WHERE clause
+PARTIAL_INDEX_VENDORS = ('postgresql', 'sqlite',)
+
+
+def create_pending_index(apps, schema_editor):
+    """
+    Workers look for pending rows in ``pk`` order. Where the database
+    allows it, only those rows are indexed, so the index stays as small as
+    the backlog. Elsewhere a (state, id) index serves the same lookup.
+    """
+    RawEvent = apps.get_model('emails', 'RawEvent')
+    quote_name = schema_editor.quote_name
+    table = quote_name(RawEvent._meta.db_table)
+    state = quote_name(RawEvent._meta.get_field('state').column)
+    pk = quote_name(RawEvent._meta.pk.column)
+
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute('CREATE INDEX %s ON %s (%s) WHERE %s = %s' % (
+            quote_name(INDEX_NAME), table, pk, state, PENDING,))
+    else:
+        schema_editor.execute('CREATE INDEX %s ON %s (%s, %s)' % (
+            quote_name(INDEX_NAME), table, state, pk,))
+
+
+def drop_pending_index(apps, schema_editor):
+    RawEvent = apps.get_model('emails', 'RawEvent')
+    quote_name = schema_editor.quote_name
+
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX %s ON %s' % (
+            quote_name(INDEX_NAME), quote_name(RawEvent._meta.db_table),))
+    else:
+        schema_editor.execute('DROP INDEX %s' % (quote_name(INDEX_NAME),))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0006_rawevent_state'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='rawevent',
+            name='is_broken',
+        ),
+        migrations.RemoveField(
+            model_name='rawevent',
+            name='is_queued',
+        ),
+        migrations.RunPython(create_pending_index, drop_pending_index),
+    ]
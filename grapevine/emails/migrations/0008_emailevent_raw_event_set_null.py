@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.2 on 2026-10-18 03:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0007_rawevent_pending_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailevent',
+            name='raw_event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='email_events', to='emails.RawEvent', verbose_name='Raw Event'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+PENDING, QUEUED = 1, 2
+
+INDEX_NAME = 'emails_rawevent_queued'
+PENDING_INDEX_NAME = 'emails_rawevent_pending'
+
+# Databases that can index only the rows matching a WHERE clause
+PARTIAL_INDEX_VENDORS = ('postgresql', 'sqlite',)
+
+
+def restore_pending_index(apps, schema_editor):
+    """
+    SQLite adds and removes columns by rebuilding the table, which drops the
+    index ``0007_rawevent_pending_index`` created by hand.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    RawEvent = apps.get_model('emails', 'RawEvent')
+    quote_name = schema_editor.quote_name
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s) WHERE %s = %s' % (
+        quote_name(PENDING_INDEX_NAME), quote_name(RawEvent._meta.db_table),
+        quote_name(RawEvent._meta.pk.column), quote_name(RawEvent._meta.get_field('state').column), PENDING,))
+
+
+def create_queued_index(apps, schema_editor):
+    """
+    Workers look for queued rows whose claim has expired. As with pending
+    rows, only those are indexed where the database allows it.
+    """
+    RawEvent = apps.get_model('emails', 'RawEvent')
+    quote_name = schema_editor.quote_name
+    table = quote_name(RawEvent._meta.db_table)
+    state = quote_name(RawEvent._meta.get_field('state').column)
+    queued_at = quote_name(RawEvent._meta.get_field('queued_at').column)
+
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute('CREATE INDEX %s ON %s (%s) WHERE %s = %s' % (
+            quote_name(INDEX_NAME), table, queued_at, state, QUEUED,))
+    else:
+        schema_editor.execute('CREATE INDEX %s ON %s (%s, %s)' % (
+            quote_name(INDEX_NAME), table, state, queued_at,))
+
+
+def drop_queued_index(apps, schema_editor):
+    RawEvent = apps.get_model('emails', 'RawEvent')
+    quote_name = schema_editor.quote_name
+
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX %s ON %s' % (
+            quote_name(INDEX_NAME), quote_name(RawEvent._meta.db_table),))
+    else:
+        schema_editor.execute('DROP INDEX %s' % (quote_name(INDEX_NAME),))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0008_emailevent_raw_event_set_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_pending_index),
+        # Rows already queued are left without one, which counts as expired
+        migrations.AddField(
+            model_name='rawevent',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, default=None, null=True, verbose_name='Queued At'),
+        ),
+        migrations.RunPython(restore_pending_index, migrations.RunPython.noop),
+        migrations.RunPython(create_queued_index, drop_queued_index),
+    ]
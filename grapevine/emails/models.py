@@ -1,24 +1,31 @@
 from __future__ import unicode_literals
+import logging
+import time
 
 # Django
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.conf import settings
 from django.core.mail import get_connection, EmailMultiAlternatives
 from django.core.urlresolvers import reverse
-from django.utils import timezone, six, module_loading
+from django.utils import timezone, six
 
 # 3rd Party
 # from celery import shared_task
 
 # Local Apps
 from grapevine.decorators import memoize
-from grapevine.emails.utils import parse_email, EventRepo
-from grapevine.emails.managers import EmailManager, EmailRecipientManager
+from grapevine.emails.utils import normalize_email, BackendRepo, ConnectionRepo, EventRepo, UnsubscribedRepo
+from grapevine.emails.managers import EmailManager, EmailRecipientManager, RawEventManager
 from grapevine.models.base import GrapevineModel
 from grapevine.models import Transport
 from grapevine.settings import grapevine_settings
 
 
+logger = logging.getLogger(__name__)
+
+
 class Email(Transport):
     """
     The grand central email table.
@@ -85,19 +92,43 @@ class Email(Transport):
             return self.main_recipient
 
         try:
-            self.main_recipient = self.recipients.all()[0]
+            self.main_recipient = self.cached_recipients[0]
         except IndexError:
             self.main_recipient = None
 
         return self.main_recipient
 
+    @property
+    def cached_recipients(self):
+        """
+        Every recipient of this email, loaded with a single query. Honors
+        ``prefetch_related('recipients')``, in which case no query is run.
+        """
+        if not hasattr(self, '_cached_recipients'):
+            if self.pk:
+                self._cached_recipients = [recipient for recipient in self.recipients.all()]
+            else:
+                self._cached_recipients = []
+        return self._cached_recipients
+
+    def get_recipients_of_type(self, recipient_type):
+        return [recipient for recipient in self.cached_recipients if recipient.type == recipient_type]
+
+    def clear_recipients_cache(self):
+        for attr_name in ('_cached_recipients', 'main_recipient',):
+            if hasattr(self, attr_name):
+                delattr(self, attr_name)
+
+        # Also drop anything ``prefetch_related`` left behind
+        getattr(self, '_prefetched_objects_cache', {}).pop('recipients', None)
+
     def save(self, *args, **kwargs):
         self.ensure_from_email()
         self.ensure_reply_to()
         self.ensure_subject()
 
         if not self.backend_id:
-            self.backend, created = EmailBackend.objects.get_or_create(path=grapevine_settings.EMAIL_BACKEND)
+            self.backend = BackendRepo().get_backend(grapevine_settings.EMAIL_BACKEND)
 
         super(Email, self).save(*args, **kwargs)
 
@@ -109,7 +140,7 @@ class Email(Transport):
         elif 'backend' in kwargs.keys():
             key = 'backend'
             if isinstance(kwargs['backend'], six.string_types):
-                backend, created = EmailBackend.objects.get_or_create(path=kwargs['backend'])
+                backend = BackendRepo().get_backend(kwargs['backend'])
             else:
                 backend = kwargs['backend']
         else:
@@ -136,36 +167,21 @@ class Email(Transport):
         Args:
         @recipients  {list}   A list of email addresses (strings) that should receive ziss email
         """
-        # Cast to a list
-        if not isinstance(recipients, list):
-            recipients = [recipients]
-
-        for recipient in recipients:
-            self.add_recipient(recipient, EmailRecipient.TO)
+        return self.add_recipients({'to': recipients})
 
     def add_ccs(self, recipients):
         """
         Args:
         @recipients  {list}   A list of email addresses (strings) that should receive ziss email
         """
-        # Cast to a list
-        if not isinstance(recipients, list):
-            recipients = [recipients]
-
-        for recipient in recipients:
-            self.add_recipient(recipient, EmailRecipient.CC)
+        return self.add_recipients({'cc': recipients})
 
     def add_bccs(self, recipients):
         """
         Args:
         @recipients  {list}   A list of email addresses (strings) that should receive ziss email
         """
-        # Cast to a list
-        if not isinstance(recipients, list):
-            recipients = [recipients]
-
-        for recipient in recipients:
-            self.add_recipient(recipient, EmailRecipient.BCC)
+        return self.add_recipients({'bcc': recipients})
 
     def add_recipient(self, recipient, recipient_type):
         """
@@ -173,38 +189,51 @@ class Email(Transport):
         @recipient      {str}   The email to receive this msg
         @recipient_type {int}   Maps to EmailRecipient.TYPES
         """
+        self.clear_recipients_cache()
         return EmailRecipient.objects.create(email=self, address=recipient, type=recipient_type)
 
     def add_recipients(self, recipients):
         """
-        Accepts and saves recipients in a smorgasboard of formats
+        Accepts and saves recipients in a smorgasboard of formats, all
+        with a single INSERT.
         """
         if isinstance(recipients, six.string_types):
-            return self.add_tos([recipients])
+            recipients = {'to': [recipients]}
         elif isinstance(recipients, list):
-            return self.add_tos(recipients)
-        elif isinstance(recipients, dict):
-            # Dicts should have keys "to", "cc", and "bcc"
-            self.add_tos(recipients.get('to', []))
-            self.add_ccs(recipients.get('cc', []))
-            self.add_bccs(recipients.get('bcc', []))
-        else:
+            recipients = {'to': recipients}
+        elif not isinstance(recipients, dict):
             raise ValueError("`recipients` must be a str, list, or dict")
 
+        email_recipients = []
+        # Dicts should have keys "to", "cc", and "bcc"
+        for key, recipient_type in (('to', EmailRecipient.TO,), ('cc', EmailRecipient.CC,),
+                                    ('bcc', EmailRecipient.BCC,),):
+            addresses = recipients.get(key, [])
+            # Cast to a list
+            if not isinstance(addresses, list):
+                addresses = [addresses]
+
+            for address in addresses:
+                email_recipients.append(
+                    EmailRecipient.objects.build(email=self, address=address, type=recipient_type))
+
+        self.clear_recipients_cache()
+        return EmailRecipient.objects.bulk_create(email_recipients)
+
     def add_variable(self, key, value):
         return EmailVariable.objects.create(email=self, key=key, value=value)
 
     @property
     def to(self):
-        return [er.prepare_for_email() for er in EmailRecipient.objects.filter(email=self, type=EmailRecipient.TO)]
+        return [er.prepare_for_email() for er in self.get_recipients_of_type(EmailRecipient.TO)]
 
     @property
     def cc(self):
-        return [er.prepare_for_email() for er in EmailRecipient.objects.filter(email=self, type=EmailRecipient.CC)]
+        return [er.prepare_for_email() for er in self.get_recipients_of_type(EmailRecipient.CC)]
 
     @property
     def bcc(self):
-        return [er.prepare_for_email() for er in EmailRecipient.objects.filter(email=self, type=EmailRecipient.BCC)]
+        return [er.prepare_for_email() for er in self.get_recipients_of_type(EmailRecipient.BCC)]
 
     def _send(self, backend=None, fail_silently=False, **kwargs):
         """
@@ -299,7 +328,7 @@ class EmailBackend(GrapevineModel):
 
     @property
     def kls(self):
-        return module_loading.import_string(dotted_path=self.path)
+        return BackendRepo().get_class(self.path)
 
     def __str__(self):
         if self.name:
@@ -321,6 +350,25 @@ class EmailBackend(GrapevineModel):
 
         return get_connection(backend=self.path, fail_silently=fail_silently, **kwargs)
 
+    def open_connection(self, **kwargs):
+        """
+        Like ``get_connection``, but hands back this process's pooled,
+        already open connection when ``POOL_CONNECTIONS`` is on.
+        """
+        if grapevine_settings.POOL_CONNECTIONS:
+            return ConnectionRepo().get_connection(self, **kwargs)
+        return self.get_connection(**kwargs)
+
+    def release_connection(self, connection, is_broken=False):
+        """
+        The counterpart to ``open_connection``. Pooled connections stay open
+        for the next send, unless something went wrong while using them.
+        """
+        if not grapevine_settings.POOL_CONNECTIONS:
+            connection.close()
+        elif is_broken:
+            ConnectionRepo().discard(connection)
+
     def get_headers(self, email):
         return {
             'reply_to': email.reply_to,
@@ -372,6 +420,16 @@ class EmailBackend(GrapevineModel):
             from . import backends
             return backends.base.GrapevineEmailBackend.finalize_message(message)
 
+    def finalize_messages(self, messages):
+        """
+        Batch version of ``finalize_message``.
+        """
+        if hasattr(self.kls, 'finalize_messages'):
+            return self.kls.finalize_messages(messages)
+        else:
+            from . import backends
+            return backends.base.GrapevineEmailBackend.finalize_messages(messages)
+
     def send(self, email, fail_silently=False, **kwargs):
         """
         Does a handful of things seen in Django's own wrapper around
@@ -379,38 +437,153 @@ class EmailBackend(GrapevineModel):
         """
         kwargs.setdefault('fail_silently', fail_silently)
 
-        # Convert our Grapevine ``Email`` obj into something this
-        # specific backend can use
-        msg = self.as_message(email)
-
-        # Pass old school EmailMessage instances to
-        # the Base finalizer to honor Unsubscribes and such
-        msg = self.finalize_message(msg)
-
-        if len(msg.to) == 0:
-            self.get_logger().info("Not sending Email Id:%s due to all `TO` recipients having unsubscribed.", email.pk)
-            email.status = email.UNSUBSCRIBED
-            email.save()
+        msg = self.prepare_message(email)
+        if msg is None:
             return False
 
         # Initialize an instance of the Backend class
-        msg.connection = self.get_connection(**kwargs)
+        msg.connection = self.open_connection(**kwargs)
 
         # Fly birdies!
         # http://img3.wikia.nocookie.net/__cb20110615180140/gameofthrones/images/1/18/Bronn_defeats_Vardis.jpg
-        is_sent = self._send(msg, **kwargs)
+        try:
+            is_sent = self._send(msg, **kwargs)
+        except Exception:
+            self.release_connection(msg.connection, is_broken=True)
+            raise
 
-        msg.connection.close()
+        self.release_connection(msg.connection)
 
         if not is_sent:
-            if getattr(msg, "failure_reason", False):
-                print(msg.failure_reason)
-                email.append_to_log(msg.failure_reason)
-            else:
-                print("no failure_reason")
+            self.log_failure(email, msg)
 
         return is_sent
 
+    def send_many(self, emails, fail_silently=False, **kwargs):
+        """
+        Batch version of ``send``. The whole batch shares one connection and
+        one unsubscribe lookup, Grapevine backends get it in one call (see
+        ``send_messages``), and the outcomes are written back with one UPDATE
+        per status.
+
+        Arguments:
+        @emails         {list}  ``Email`` objects that all use this backend.
+        @fail_silently  {bool}  Whether or not to raise problems.
+
+        Returns  {int}  How many of ``emails`` were sent.
+        """
+        kwargs.setdefault('fail_silently', fail_silently)
+
+        messages = self.prepare_messages(emails)
+        if not messages:
+            return 0
+
+        connection = self.open_connection(**kwargs)
+
+        start = time.time()
+        try:
+            num_sent = self.send_messages(connection, messages)
+        except Exception:
+            self.release_connection(connection, is_broken=True)
+            # Whatever went out before the error still went out
+            self.update_statuses([message._email for message in messages if getattr(message, 'is_sent', False)],
+                                 Email.SENT, sent_at=timezone.now())
+            self.update_statuses([message._email for message in messages if not getattr(message, 'is_sent', False)],
+                                 Email.SEND_TIME_ERROR)
+            raise
+        communication_time = round((time.time() - start) / len(messages), 5)
+
+        self.release_connection(connection)
+
+        sent, failed = [], []
+        for message in messages:
+            is_sent = getattr(message, 'is_sent', num_sent == len(messages))
+            if is_sent:
+                sent.append(message._email)
+            else:
+                failed.append(message)
+
+        self.update_statuses(sent, Email.SENT, sent_at=timezone.now(),
+                             communication_time=communication_time)
+        # Honor any status set while sending
+        self.update_statuses([message._email for message in failed if message._email.status == Email.UNSENT],
+                             Email.FAILED, communication_time=communication_time)
+        for message in failed:
+            self.log_failure(message._email, message)
+
+        return len(sent)
+
+    def send_messages(self, connection, messages):
+        """
+        Grapevine backends say how each message went, so they get the whole
+        batch at once. Anything else only says how many made it, so it gets
+        one message at a time over the same connection, which is all that
+        Django's SMTP backend does with a batch anyway.
+
+        Returns  {int}  How many of ``messages`` were sent.
+        """
+        from . import backends
+        if isinstance(connection, backends.base.GrapevineEmailBackend):
+            return connection.send_messages(messages) or 0
+
+        connection.open()
+        num_sent = 0
+        for message in messages:
+            message.is_sent = bool(connection.send_messages([message]))
+            if message.is_sent:
+                num_sent += 1
+        return num_sent
+
+    def update_statuses(self, emails, status, **fields):
+        """
+        Sets ``status`` and any other ``fields`` on every one of ``emails``,
+        both in memory and with a single UPDATE.
+        """
+        if not emails:
+            return
+
+        fields.update({
+            'status': status,
+            'updated_at': timezone.now(),
+        })
+        Email.objects.filter(pk__in=[email.pk for email in emails]).update(**fields)
+
+        for email in emails:
+            for key, value in fields.items():
+                setattr(email, key, value)
+
+    def prepare_message(self, email):
+        """
+        Everything ``send`` does before talking to the provider.
+
+        Returns the finalized message, or ``None`` if every ``TO``
+        recipient has unsubscribed.
+        """
+        messages = self.prepare_messages([email])
+        return messages[0] if messages else None
+
+    def prepare_messages(self, emails):
+        """
+        Batch version of ``prepare_message``. Emails whose ``TO`` recipients
+        have all unsubscribed are marked as such and left out.
+        """
+        # Convert our Grapevine ``Email`` objs into something this
+        # specific backend can use, then pass them to the finalizer
+        # to honor Unsubscribes and such
+        messages = self.finalize_messages([self.as_message(email) for email in emails])
+
+        self.update_statuses([message._email for message in messages if len(message.to) == 0],
+                             Email.UNSUBSCRIBED)
+
+        return [message for message in messages if len(message.to) > 0]
+
+    def log_failure(self, email, msg):
+        if getattr(msg, "failure_reason", False):
+            logger.warning("Email %s was not sent: %s", email.pk, msg.failure_reason)
+            email.append_to_log(msg.failure_reason)
+        else:
+            logger.warning("Email %s was not sent, for no given reason", email.pk)
+
     def _send(self, msg, **kwargs):
         """
         Like ``as_message``, this is a hook for a specific driver to
@@ -447,22 +620,42 @@ class EmailVariable(GrapevineModel):
 
 
 class RawEvent(GrapevineModel):
+    PENDING = 1
+    QUEUED = 2
+    PROCESSED = 3
+    # Email providers do not often send payloads in formats that match
+    # their documentation
+    BROKEN = 4
+    STATE_CHOICES = (
+        (PENDING, 'Pending',),
+        (QUEUED, 'Queued',),
+        (PROCESSED, 'Processed',),
+        (BROKEN, 'Broken',),
+    )
 
     backend = models.ForeignKey(EmailBackend)
     payload = models.TextField()
+    # Pending rows are indexed on their own by migration
+    # ``0007_rawevent_pending_index``, and queued ones by
+    # ``0009_rawevent_queued_at``, so finding work doesn't slow down as
+    # processed rows pile up. Django doesn't know about either index, and
+    # SQLite drops both whenever a migration rebuilds this table, so such
+    # migrations must recreate them (as 0009 does).
+    state = models.PositiveSmallIntegerField(choices=STATE_CHOICES, default=PENDING)
+    # When a worker claimed this event. Claims older than
+    # ``PROCESS_EVENTS_LEASE_SECONDS`` are assumed abandoned.
+    queued_at = models.DateTimeField(null=True, default=None, blank=True,
+        verbose_name="Queued At")
     processed_on = models.DateTimeField(null=True, default=None, blank=True,
         verbose_name="Processed On")
     processed_in = models.DecimalField(max_digits=5, decimal_places=4, blank=True,
         null=True, default=None, verbose_name="Processed In")
-    is_queued = models.BooleanField(default=False, db_index=True, verbose_name="Is Queued")
-
-    # Email providers do not often send payloads in formats that match
-    # their documentation
-    is_broken = models.NullBooleanField(default=None, db_index=True, verbose_name="Is Broken")
 
     # Bookkeeping
     remote_ip = models.GenericIPAddressField(db_index=True, verbose_name="Remote IP")
 
+    objects = RawEventManager()
+
     class Meta:
         app_label = "emails"
         verbose_name = "Raw Event"
@@ -474,16 +667,22 @@ class RawEvent(GrapevineModel):
         raw_event = RawEvent.objects.get(pk=raw_event_id)
         raw_event.process()
 
-    def process(self):
-        is_processed, time_taken = self.backend.kls().process_event(self)
-        # Not queued anymore, obviously
-        self.is_queued = False
+    def process(self, backend=None):
+        """
+        Arguments:
+        @backend  {GrapevineEmailBackend}  An instance of this event's backend
+                                           class, to share across many events.
+                                           Optional.
+        """
+        backend = backend or self.backend.kls()
+        is_processed, time_taken = backend.process_event(self)
 
         if is_processed:
+            self.state = self.PROCESSED
             self.processed_on = timezone.now()
             self.processed_in = time_taken
         else:
-            self.is_broken = True
+            self.state = self.BROKEN
         self.save()
 
 
@@ -505,7 +704,9 @@ class EmailEvent(GrapevineModel):
 
     email = models.ForeignKey(Email, related_name="events")
     event = models.ForeignKey(Event, related_name="email_events")
-    raw_event = models.ForeignKey(RawEvent, verbose_name="Raw Event", related_name="email_events")
+    # Outlives its ``RawEvent`` once ``prune_raw_events`` removes it
+    raw_event = models.ForeignKey(RawEvent, null=True, blank=True, on_delete=models.SET_NULL,
+        verbose_name="Raw Event", related_name="email_events")
     happened_at = models.DateTimeField(db_index=True, verbose_name="Happened At")
 
     class Meta:
@@ -533,7 +734,27 @@ class UnsubscribedAddress(GrapevineModel):
 
     def save(self, *args, **kwargs):
         """
-        Parses out formatted email addresses into raw thangs
+        Parses out formatted email addresses into raw, lower-cased thangs
         """
-        name, self.address = parse_email(self.address)
+        self.address = normalize_email(self.address)
         return super(UnsubscribedAddress, self).save(*args, **kwargs)
+
+
+@receiver(post_save, sender=EmailBackend)
+@receiver(post_delete, sender=EmailBackend)
+def invalidate_backend_repo(sender, **kwargs):
+    BackendRepo().clear()
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_event_repo(sender, **kwargs):
+    EventRepo().clear()
+
+
+@receiver(post_save, sender=UnsubscribedAddress)
+@receiver(post_delete, sender=UnsubscribedAddress)
+def invalidate_unsubscribed_repo(sender, **kwargs):
+    # Other processes rebuild their index as soon as the stamp changes, so
+    # it must not change before they can see this row
+    transaction.on_commit(UnsubscribedRepo.bump_version)
@@ -0,0 +1,149 @@
+from __future__ import unicode_literals
+import io
+import json
+import os
+import threading
+import time
+
+# Django
+from django.db import transaction
+
+# Local Apps
+import grapevine
+from grapevine.settings import grapevine_settings
+from grapevine.emails.utils import BackendRepo
+
+
+class EventSpool(object):
+    """
+    Append-only files of raw webhook payloads, which let webhooks answer
+    their provider without touching the database.
+
+    Each process appends to its own file, and starts a new one every
+    ``EVENT_SPOOL_ROTATE_SECONDS``. ``drain()`` only reads files nobody
+    can still be writing to, and turns them into ``RawEvent`` rows in bulk.
+    Only one drainer should run at a time.
+
+    Usage:
+        # In the webhook
+        EventSpool().append(backend_path, request.body, remote_ip)
+
+        # Elsewhere, on a schedule
+        EventSpool().drain()
+    """
+    PREFIX = 'events-'
+    SUFFIX = '.jsonl'
+    DRAINING_SUFFIX = '.draining'
+
+    # Shared by every instance, as webhooks build a new one per request
+    lock = threading.Lock()
+
+    def __init__(self, path=None, rotate_seconds=None):
+        self.path = path or grapevine_settings.EVENT_SPOOL_DIR
+        self.rotate_seconds = rotate_seconds or grapevine_settings.EVENT_SPOOL_ROTATE_SECONDS
+
+    def get_bucket(self, now=None):
+        return int((now or time.time()) // self.rotate_seconds)
+
+    def get_filename(self, bucket):
+        return os.path.join(self.path, '%s%s-%s%s' % (self.PREFIX, bucket, os.getpid(), self.SUFFIX,))
+
+    def append(self, backend_path, payload, remote_ip):
+        """
+        Arguments:
+        @backend_path  {str}    The ``IMPORT_PATH`` of the receiving backend.
+        @payload       {bytes}  The request body, as the provider sent it.
+        @remote_ip     {str}    Where the request came from.
+        """
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8', 'replace')
+
+        line = json.dumps({'backend': backend_path, 'payload': payload, 'remote_ip': remote_ip})
+        with self.lock:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with io.open(self.get_filename(self.get_bucket()), 'ab') as spool_file:
+                spool_file.write((line + '\n').encode('utf-8'))
+
+    def get_drainable_files(self, should_drain_all=False):
+        """
+        Files left behind by an interrupted drain come first. Spool files
+        from the current and previous periods are skipped, unless
+        ``should_drain_all``, as a webhook may still be appending to them.
+        """
+        if not os.path.isdir(self.path):
+            return []
+
+        current_bucket = self.get_bucket()
+        filenames = []
+        for filename in sorted(os.listdir(self.path)):
+            if not filename.startswith(self.PREFIX):
+                continue
+
+            if filename.endswith(self.DRAINING_SUFFIX):
+                filenames.insert(0, filename)
+            elif filename.endswith(self.SUFFIX):
+                bucket = int(filename[len(self.PREFIX):].split('-')[0])
+                if should_drain_all or bucket < current_bucket - 1:
+                    filenames.append(filename)
+
+        return [os.path.join(self.path, filename) for filename in filenames]
+
+    def drain(self, batch_size=500, should_drain_all=False):
+        """
+        Inserts a ``RawEvent`` for every spooled payload, ``batch_size``
+        at a time, and deletes each file once it is in the database.
+
+        Returns  {int}  How many ``RawEvent`` rows were created
+        """
+        num_created = 0
+        backends = {}
+        for filename in self.get_drainable_files(should_drain_all):
+            if not filename.endswith(self.DRAINING_SUFFIX):
+                # Claim the file, so that it's never read twice
+                os.rename(filename, filename + self.DRAINING_SUFFIX)
+                filename += self.DRAINING_SUFFIX
+
+            with transaction.atomic():
+                with io.open(filename, 'rb') as spool_file:
+                    raw_events = []
+                    for line in spool_file:
+                        raw_event = self.as_raw_event(line, backends)
+                        if raw_event is not None:
+                            raw_events.append(raw_event)
+
+                        if len(raw_events) >= batch_size:
+                            num_created += len(self.bulk_create(raw_events))
+                            raw_events = []
+
+                    num_created += len(self.bulk_create(raw_events))
+
+            os.remove(filename)
+
+        return num_created
+
+    @staticmethod
+    def as_raw_event(line, backends):
+        """
+        Arguments:
+        @line      {bytes}  One line of a spool file.
+        @backends  {dict}   ``EmailBackend`` rows already looked up, by path.
+        """
+        try:
+            data = json.loads(line.decode('utf-8'))
+        except ValueError:
+            # Blank, or cut short by a crash mid-write
+            return None
+
+        if data['backend'] not in backends:
+            backends[data['backend']] = BackendRepo().get_backend(data['backend'])
+
+        return grapevine.emails.models.RawEvent(
+            backend=backends[data['backend']],
+            payload=data['payload'], remote_ip=data['remote_ip'])
+
+    @staticmethod
+    def bulk_create(raw_events):
+        if not raw_events:
+            return []
+        return grapevine.emails.models.RawEvent.objects.bulk_create(raw_events)
@@ -1,4 +1,18 @@
 from __future__ import unicode_literals
+import atexit
+import hashlib
+import math
+import threading
+import time
+import uuid
+
+# Django
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import module_loading
+
+# Local Apps
+from grapevine.settings import grapevine_settings
 
 
 def parse_email(address):
@@ -17,9 +31,22 @@ def parse_email(address):
         return "", address
 
 
+def normalize_email(address):
+    """
+    Returns "marco@polo.com" from "Marco Polo <Marco@Polo.com>", which is
+    the form unsubscribe lookups are made in.
+    """
+    name, address = parse_email(address)
+    return address.strip().lower()
+
+
 class EventRepo(object):
+    """
+    Every ``Event`` row, by name and by pk, loaded lazily and reloaded
+    whenever an ``Event`` is saved or deleted in this process, or once
+    ``REPO_TTL`` seconds have passed.
+    """
     _instance = None
-    name_map = {}
 
     def __new__(cls, *args, **kwargs):
         """
@@ -27,17 +54,326 @@ class EventRepo(object):
         """
         if not cls._instance:
             cls._instance = super(EventRepo, cls).__new__(cls, *args, **kwargs)
-            cls._instance.seed_name_map()
+            cls._instance.name_map = {}
+            cls._instance.pk_map = {}
+            cls._instance.loaded_at = None
+            cls._instance.lock = threading.Lock()
         return cls._instance
 
+    def ensure_fresh(self):
+        with self.lock:
+            ttl = grapevine_settings.REPO_TTL
+            if self.loaded_at is None or (ttl is not None and time.time() - self.loaded_at >= ttl):
+                self.seed_name_map()
+
     def seed_name_map(self):
-        from models import Event
-        self.name_map = {}
-        for ev in Event.objects.all():
-            self._instance.name_map[ev.name] = ev
+        from .models import Event
+
+        events = list(Event.objects.all())
+        # Swapped in whole so readers never see a half-built map
+        self.name_map = dict((event.name, event,) for event in events)
+        self.pk_map = dict((event.pk, event,) for event in events)
+        self.loaded_at = time.time()
 
     def get_event_by_name(self, name):
+        self.ensure_fresh()
         return self.name_map[name]
 
+    def get_event_by_pk(self, pk):
+        self.ensure_fresh()
+        return self.pk_map[pk]
+
+    def clear(self):
+        with self.lock:
+            self.loaded_at = None
+
     def __getitem__(self, name):
         return self.get_event_by_name(name)
+
+
+class BackendRepo(object):
+    """
+    ``EmailBackend`` rows by path, and the backend classes they point to,
+    so that finding and importing an email's backend costs nothing after
+    the first time.
+
+    Rows are forgotten whenever an ``EmailBackend`` is saved or deleted in
+    this process, and after ``REPO_TTL`` seconds regardless, so that edits
+    made by other processes are eventually picked up too.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Singleton implementation
+        """
+        if not cls._instance:
+            cls._instance = super(BackendRepo, cls).__new__(cls, *args, **kwargs)
+            cls._instance.backends = {}
+            cls._instance.classes = {}
+            cls._instance.loaded_at = time.time()
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def ensure_fresh(self):
+        ttl = grapevine_settings.REPO_TTL
+        if ttl is not None and time.time() - self.loaded_at >= ttl:
+            self.clear()
+
+    def get_backend(self, path):
+        """
+        Returns the ``EmailBackend`` for ``path``, creating it if need be.
+        """
+        from .models import EmailBackend
+
+        self.ensure_fresh()
+        with self.lock:
+            backend = self.backends.get(path, None)
+        if backend is not None:
+            return backend
+
+        backend = EmailBackend.objects.filter(path=path).order_by('pk').first()
+        if backend is None:
+            backend = EmailBackend.objects.create(path=path)
+            # Should the caller's transaction roll back, this row never existed
+            transaction.on_commit(lambda: self.remember(path, backend))
+        else:
+            self.remember(path, backend)
+        return backend
+
+    def remember(self, path, backend):
+        with self.lock:
+            self.backends[path] = backend
+
+    def get_class(self, path):
+        """
+        Imports the backend class at ``path``, once.
+        """
+        with self.lock:
+            kls = self.classes.get(path, None)
+        if kls is None:
+            kls = module_loading.import_string(path)
+            with self.lock:
+                self.classes[path] = kls
+        return kls
+
+    def clear(self):
+        with self.lock:
+            self.backends.clear()
+            self.loaded_at = time.time()
+
+
+class BloomFilter(object):
+    """
+    A fixed-size set that answers "definitely not here" exactly and
+    "maybe here" with roughly ``error_rate`` false positives, in a
+    fraction of the memory a real set would take.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def get_positions(self, key):
+        # Double hashing: every position is derived from two halves of one digest
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        first, second = int(digest[:16], 16), int(digest[16:32], 16)
+        for i in range(self.num_hashes):
+            yield (first + i * second) % self.num_bits
+
+    def add(self, key):
+        for position in self.get_positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+        for position in self.get_positions(key):
+            if not self.bits[position // 8] & (1 << (position % 8)):
+                return False
+        return True
+
+
+class UnsubscribedRepo(object):
+    """
+    An in-process index of every ``UnsubscribedAddress``, so that the
+    overwhelmingly common "not unsubscribed" answer costs no query at all.
+
+    Addresses the bloom filter flags are still confirmed against the DB.
+    The index is rebuilt whenever the version stamp kept in the
+    ``UNSUBSCRIBE_INDEX_CACHE`` cache changes, which happens every time an
+    ``UnsubscribedAddress`` is saved or deleted. Use a cache shared by all
+    processes (memcached, redis, etc.) when running more than one.
+    """
+    _instance = None
+    VERSION_KEY = 'grapevine:unsubscribed-addresses:version'
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Singleton implementation
+        """
+        if not cls._instance:
+            cls._instance = super(UnsubscribedRepo, cls).__new__(cls, *args, **kwargs)
+            cls._instance.bloom_filter = None
+            cls._instance.version = None
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    @classmethod
+    def get_cache(cls):
+        return caches[grapevine_settings.UNSUBSCRIBE_INDEX_CACHE]
+
+    @classmethod
+    def get_version(cls):
+        cache = cls.get_cache()
+        # ``add`` is a no-op if another process set it first
+        cache.add(cls.VERSION_KEY, uuid.uuid4().hex, None)
+        return cache.get(cls.VERSION_KEY)
+
+    @classmethod
+    def bump_version(cls):
+        """
+        Invalidates the index in every process. A fresh random stamp, rather
+        than a counter, can't be mistaken for an old one after a cache eviction.
+        """
+        cls.get_cache().set(cls.VERSION_KEY, uuid.uuid4().hex, None)
+
+    def seed_bloom_filter(self):
+        from .models import UnsubscribedAddress
+
+        # Read the stamp first, so that any change made while we load
+        # triggers another reload next time around
+        version = self.get_version()
+
+        addresses = UnsubscribedAddress.objects.values_list('address', flat=True)
+        # Leave room to grow before the error rate degrades
+        bloom_filter = BloomFilter(capacity=max(addresses.count() * 2, 1000))
+        for address in addresses.iterator():
+            bloom_filter.add(address)
+
+        self.bloom_filter, self.version = bloom_filter, version
+
+    def ensure_fresh(self):
+        with self.lock:
+            if self.bloom_filter is None or self.version != self.get_version():
+                self.seed_bloom_filter()
+
+    def get_unsubscribed_addresses(self, addresses):
+        """
+        Returns the subset of the normalized ``addresses`` that have unsubscribed.
+        """
+        from .models import UnsubscribedAddress
+
+        self.ensure_fresh()
+        candidates = set(address for address in addresses if address in self.bloom_filter)
+        if not candidates:
+            return set()
+
+        return set(UnsubscribedAddress.objects.filter(address__in=candidates).values_list('address', flat=True))
+
+
+class ConnectionRepo(object):
+    """
+    Keeps backend connections (SMTP sessions, keep-alive HTTP sessions and
+    the like) open across sends instead of paying for a fresh one every
+    time. There is one connection per ``EmailBackend`` row per thread, since
+    Django email backends are not thread-safe. Everything still open is
+    closed when the process exits.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Singleton implementation
+        """
+        if not cls._instance:
+            cls._instance = super(ConnectionRepo, cls).__new__(cls, *args, **kwargs)
+            cls._instance.local = threading.local()
+            cls._instance.all_connections = []
+            cls._instance.lock = threading.Lock()
+            atexit.register(cls._instance.close_all)
+        return cls._instance
+
+    def get_thread_connections(self):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        return self.local.connections
+
+    def get_connection(self, email_backend, **kwargs):
+        """
+        Arguments:
+        email_backend   {grapevine.emails.models.EmailBackend}
+        kwargs          Passed along to ``email_backend.get_connection``
+
+        Returns an open connection, reusing this thread's existing one if
+        nothing about the backend has changed since it was opened.
+        """
+        key = (email_backend.pk, email_backend.path, email_backend.username,
+               email_backend.password, tuple(sorted(kwargs.items())),)
+
+        connections = self.get_thread_connections()
+        if key in connections and not self.is_alive(connections[key]):
+            # The server hung up while it sat idle
+            self.discard(connections[key])
+
+        if key not in connections:
+            connection = email_backend.get_connection(**kwargs)
+            connection.open()
+            connections[key] = connection
+            with self.lock:
+                self.all_connections.append(connection)
+
+        return connections[key]
+
+    @staticmethod
+    def is_alive(connection):
+        """
+        Pings SMTP connections with a NOOP, as servers drop idle sessions.
+        HTTP sessions already reconnect on their own.
+        """
+        smtp = getattr(connection, 'connection', None)
+        if smtp is None or not hasattr(smtp, 'noop'):
+            return True
+
+        try:
+            return smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def discard(self, connection):
+        """
+        Closes and forgets a connection that can no longer be trusted.
+        """
+        connections = self.get_thread_connections()
+        for key, value in list(connections.items()):
+            if value is connection:
+                del connections[key]
+        self.close(connection)
+
+    def close_thread_connections(self):
+        """
+        Closes every connection opened by the current thread. Worker
+        threads should call this before they exit.
+        """
+        connections = self.get_thread_connections()
+        for connection in list(connections.values()):
+            self.close(connection)
+        connections.clear()
+
+    def close_all(self):
+        with self.lock:
+            all_connections, self.all_connections = self.all_connections, []
+
+        for connection in all_connections:
+            self.close(connection, should_forget=False)
+
+    def close(self, connection, should_forget=True):
+        if should_forget:
+            with self.lock:
+                self.all_connections = [c for c in self.all_connections if c is not connection]
+
+        try:
+            connection.close()
+        except Exception:
+            # Whatever was on the other end is gone either way
+            pass
@@ -1,4 +1,13 @@
 from __future__ import unicode_literals
+import threading
+
+# Django
+from django.db import connections
+from django.utils.six.moves import queue
+
+# Local Apps
+from grapevine.emails.utils import ConnectionRepo
+from grapevine.settings import grapevine_settings
 
 
 class SynchronousSender(object):
@@ -23,3 +32,182 @@ class AsynchronousSender(object):
 
         sendable.denote_as_queued()
         return sendable.async_send.delay(sendable.__class__, sendable.pk, *args, **kwargs)
+
+
+class BatchSender(object):
+    """
+    Builds each sendable's transport as it is handed over, then delivers the
+    whole batch from ``wait()`` with one ``EmailBackend.send_many`` call per
+    backend, rather than one provider call and several status writes per
+    message.
+
+    ``send()`` returns ``None``; ``wait()`` returns the number sent.
+    """
+
+    def __init__(self):
+        self.sendables = []
+
+    def send(self, sendable, recipient_address=None, is_test=False, **kwargs):
+        """
+        Builds the transport now and queues it for ``wait()``.
+        """
+        if not is_test and (sendable.is_sent or not sendable.renew_claim()):
+            return False
+
+        sendable.transport = sendable.as_transport(recipient_address=recipient_address,
+                                                   is_test=is_test, **kwargs)
+        self.sendables.append(sendable)
+
+    def wait(self):
+        """
+        Delivers everything handed to ``send()`` since the last ``wait()``.
+
+        Returns  {int}  How many sendables were sent.
+        Re-raises the first error a backend hit, after every other backend
+        has had its turn.
+        """
+        sendables, self.sendables = self.sendables, []
+
+        # Transports without a backend to batch through are sent one by one
+        batches = {}
+        for sendable in sendables:
+            batches.setdefault(getattr(sendable.transport, 'backend_id', None), []).append(sendable.transport)
+
+        num_sent = 0
+        errors = []
+        try:
+            for backend_id, transports in batches.items():
+                try:
+                    if backend_id is None:
+                        num_sent += len([transport for transport in transports if transport.send()])
+                    else:
+                        num_sent += transports[0].backend.send_many(transports)
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            # Delivered or not, these no longer need their claims
+            sendables_by_class = {}
+            for sendable in sendables:
+                sendables_by_class.setdefault(sendable.__class__, []).append(sendable.pk)
+            for cls, pks in sendables_by_class.items():
+                cls.objects.filter(pk__in=pks).release()
+
+        if errors:
+            raise errors[0]
+        return num_sent
+
+
+class ThreadedSender(object):
+    """
+    Puts bits on the wire from a bounded pool of worker threads, so that
+    many provider round-trips can be in flight at once without Celery.
+
+    ``send()`` only hands the sendable to the pool and returns ``None``.
+    Call ``wait()`` once everything has been handed over to block until
+    the pool drains and collect the number actually sent.
+
+    Settings:
+    SENDER_THREADS              {int}   Size of the pool.
+    SENDER_BACKEND_CONCURRENCY  {dict}  Maps EMAIL_BACKEND paths to the most
+                                        sends allowed in flight against them
+                                        at once.
+    """
+
+    def __init__(self, num_threads=None, backend_concurrency=None):
+        self.num_threads = num_threads or grapevine_settings.SENDER_THREADS
+
+        if backend_concurrency is None:
+            backend_concurrency = grapevine_settings.SENDER_BACKEND_CONCURRENCY or {}
+        self.backend_semaphores = dict((path, threading.BoundedSemaphore(limit),)
+                                       for path, limit in backend_concurrency.items())
+
+        # Bounded, so a fast producer can't load every sendable into memory
+        # ahead of the threads actually sending them
+        self.tasks = queue.Queue(maxsize=self.num_threads * 2)
+        self.threads = []
+
+        self.lock = threading.Lock()
+        self.num_sent = 0
+        self.errors = []
+
+    def send(self, sendable, *args, **kwargs):
+        """
+        Hands the sendable off to the pool. Results are reported by ``wait()``.
+        """
+        if not self.threads:
+            self.start()
+
+        self.tasks.put((sendable, args, kwargs,))
+
+    def start(self):
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self.work, name="grapevine-sender-%s" % (i,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def wait(self):
+        """
+        Blocks until every sendable handed to ``send()`` has been processed,
+        then shuts the pool down.
+
+        Returns  {int}  How many sendables were sent since the last ``wait()``.
+        Re-raises the first error a worker hit, after the pool has drained.
+        """
+        for thread in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+        with self.lock:
+            num_sent, self.num_sent = self.num_sent, 0
+            errors, self.errors = self.errors, []
+
+        if errors:
+            raise errors[0]
+        return num_sent
+
+    def work(self):
+        try:
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    return
+
+                sendable, args, kwargs = task
+                try:
+                    is_sent = self._send(sendable, *args, **kwargs)
+                except Exception as e:
+                    # Let the next run have another go at it
+                    sendable.delete_from_queue()
+                    with self.lock:
+                        self.errors.append(e)
+                    continue
+
+                if is_sent:
+                    with self.lock:
+                        self.num_sent += 1
+        finally:
+            # Django opens a separate connection for each thread, and
+            # nothing else will ever close the ones this thread opened.
+            # The same goes for pooled email backend connections.
+            connections.close_all()
+            ConnectionRepo().close_thread_connections()
+
+    def _send(self, sendable, *args, **kwargs):
+        semaphore = self.backend_semaphores.get(self.get_backend_path(sendable, **kwargs))
+        if semaphore is None:
+            return sendable.send(*args, **kwargs)
+
+        with semaphore:
+            return sendable.send(*args, **kwargs)
+
+    def get_backend_path(self, sendable, **kwargs):
+        """
+        Mirrors how ``Email.determine_backend`` picks the backend for a send.
+        """
+        backend = kwargs.get('backend', None)
+        if backend is None:
+            return grapevine_settings.EMAIL_BACKEND
+        return getattr(backend, 'path', backend)
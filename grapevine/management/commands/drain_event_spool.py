@@ -0,0 +1,23 @@
+from __future__ import unicode_literals
+
+# Django
+from django.core.management.base import BaseCommand
+
+# Local Apps
+from grapevine.emails.spool import EventSpool
+
+
+class Command(BaseCommand):
+    help = "Turns webhook payloads spooled to GRAPEVINE['EVENT_SPOOL_DIR'] into RawEvents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=500,
+                            help="How many RawEvents to insert per query.")
+        parser.add_argument('--all', action='store_true', dest='should_drain_all', default=False,
+                            help="Also drain the files webhooks may still be appending to. "
+                            "Only safe while no webhooks are being received.")
+
+    def handle(self, *args, **options):
+        num_created = EventSpool().drain(batch_size=options['batch_size'],
+                                         should_drain_all=options['should_drain_all'])
+        self.stdout.write("Created %s raw events." % (num_created,))
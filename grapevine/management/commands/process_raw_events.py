@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+import time
+
+# Django
+from django.core.management.base import BaseCommand
+
+# Local Apps
+from grapevine.emails.jobs import process_raw_events
+
+
+class Command(BaseCommand):
+    help = "Processes unprocessed RawEvents. Any number of these can run at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=None,
+                            help="How many RawEvents to claim at once. "
+                            "Defaults to GRAPEVINE['PROCESS_EVENTS_BATCH_SIZE'].")
+        parser.add_argument('--limit', action='store', dest='limit', type=int, default=None,
+                            help="Stop after processing this many RawEvents.")
+        parser.add_argument('--forever', action='store_true', dest='should_run_forever', default=False,
+                            help="Keep waiting for new RawEvents instead of exiting once none are left.")
+        parser.add_argument('--sleep', action='store', dest='sleep', type=float, default=5,
+                            help="Seconds to wait between checks for new RawEvents, with --forever.")
+
+    def handle(self, *args, **options):
+        num_processed = 0
+        while True:
+            limit = options['limit'] - num_processed if options['limit'] is not None else None
+            num_processed += process_raw_events(limit=limit, batch_size=options['batch_size'])
+
+            if not options['should_run_forever'] or (limit is not None and num_processed >= options['limit']):
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write("Processed %s raw events." % (num_processed,))
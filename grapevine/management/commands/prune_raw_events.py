@@ -0,0 +1,30 @@
+from __future__ import unicode_literals
+
+# Django
+from django.core.management.base import BaseCommand, CommandError
+
+# Local Apps
+from grapevine.emails.jobs import prune_raw_events
+
+
+class Command(BaseCommand):
+    help = "Removes old processed RawEvents, optionally archiving them to gzipped JSON-lines files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', action='store', dest='days', type=int, default=None,
+                            help="Remove RawEvents older than this many days. "
+                            "Defaults to GRAPEVINE['RAW_EVENT_RETENTION_DAYS'].")
+        parser.add_argument('--archive-dir', action='store', dest='archive_dir', default=None,
+                            help="Directory to archive removed RawEvents to. "
+                            "Defaults to GRAPEVINE['RAW_EVENT_ARCHIVE_DIR'].")
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=1000,
+                            help="How many RawEvents to archive and delete at once.")
+
+    def handle(self, *args, **options):
+        try:
+            num_pruned = prune_raw_events(days=options['days'], archive_dir=options['archive_dir'],
+                                          batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(e.args[0])
+
+        self.stdout.write("Removed %s raw events." % (num_pruned,))
@@ -10,7 +10,12 @@ from grapevine.sender import ScheduledSendableSender
 class Command(BaseCommand):
     help = "Sends or queues all eligible Messages"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=None,
+                            help="How many eligible messages to load into memory at once. "
+                            "Defaults to GRAPEVINE['SEND_BATCH_SIZE'].")
+
     def handle(self, *args, **options):
-        sender = ScheduledSendableSender()
+        sender = ScheduledSendableSender(batch_size=options.get('batch_size'))
         num_sent, num_sendables = sender.deliver_messages()
         self.stdout.write("Sent %s messages from %s total Sendable models." % (num_sent, num_sendables,))
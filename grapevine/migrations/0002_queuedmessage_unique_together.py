@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def delete_duplicate_queued_messages(apps, schema_editor):
+    """
+    Concurrent senders could previously queue the same message twice. Keep
+    the oldest record of each so the unique constraint can be applied.
+    """
+    QueuedMessage = apps.get_model('grapevine', 'QueuedMessage')
+
+    seen = set()
+    duplicate_pks = []
+    for pk, message_type_id, message_id in QueuedMessage.objects.order_by('pk').\
+            values_list('pk', 'message_type_id', 'message_id'):
+        if (message_type_id, message_id) in seen:
+            duplicate_pks.append(pk)
+        else:
+            seen.add((message_type_id, message_id))
+
+    QueuedMessage.objects.filter(pk__in=duplicate_pks).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grapevine', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_queued_messages, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='queuedmessage',
+            unique_together=set([('message_type', 'message_id')]),
+        ),
+    ]
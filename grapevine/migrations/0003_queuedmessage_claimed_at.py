@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.2 on 2026-10-18 03:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grapevine', '0002_queuedmessage_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedmessage',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True, verbose_name='Claimed At'),
+        ),
+    ]
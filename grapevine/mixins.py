@@ -17,8 +17,6 @@ from django.template.loader import get_template
 from django.utils import six
 
 # 3rd Party
-import html2text
-
 try:
     from celery import shared_task
 except ImportError:
@@ -29,7 +27,8 @@ from . import emails
 from . import models as gv_models
 from .managers import SendableManager
 from .querysets import SendableQuerySet
-from grapevine.utils import simple_render
+from grapevine.rendering import RenderOnceRepo
+from grapevine.utils import html_to_text, simple_render
 
 
 class SendableMixin(models.Model):
@@ -49,6 +48,10 @@ class SendableMixin(models.Model):
 
     objects = SendableManager.for_queryset_class(SendableQuerySet)()
 
+    # Opt in to compiling the template once per batch and only re-rendering
+    # the parts that depend on the context. See ``grapevine.rendering``.
+    should_render_once = False
+
     class Meta:
         abstract = True
         index_together = (
@@ -119,6 +122,30 @@ class SendableMixin(models.Model):
             get_or_create(message_type=self.get_content_type(), message_id=self.pk)
         return queued_message
 
+    def renew_claim(self):
+        """
+        Pushes back the expiry of the claim ``SendableQuerySet.claim()`` took
+        on this object, so that a long running batch can't have it taken over
+        (and sent again) by another process.
+
+        Returns False if the claim already expired and was taken over, in
+        which case this object must not be sent. Objects that were never
+        claimed have nothing to renew, and always return True.
+        """
+        claimed_at = getattr(self, '_claimed_at', None)
+        if claimed_at is None:
+            return True
+
+        renewed_at = timezone.now()
+        num_renewed = gv_models.QueuedMessage.objects.filter(
+            message_type=self.get_content_type(), message_id=self.pk,
+            claimed_at=claimed_at).update(claimed_at=renewed_at)
+        if not num_renewed:
+            return False
+
+        self._claimed_at = renewed_at
+        return True
+
     def delete_from_queue(self):
         """
         Once a message has passed through the queue and been delivered,
@@ -228,7 +255,7 @@ class SendableMixin(models.Model):
     @property
     def text_body(self):
         if not hasattr(self, '_text_body'):
-            self._text_body = html2text.HTML2Text().handle(self.html_body)
+            self._text_body = html_to_text(self.html_body)
         return self._text_body
 
     @property
@@ -252,7 +279,10 @@ class SendableMixin(models.Model):
         """
         context = context or self.get_context()
 
-        template = self.get_template(template_name)
+        if self.should_render_once:
+            template = RenderOnceRepo().get_template(self, template_name)
+        else:
+            template = self.get_template(template_name)
         return self._render(template, context)
 
     def _render(self, template, context):
@@ -267,7 +297,7 @@ class SendableMixin(models.Model):
     def alter_transport(self, transport, **kwargs):
         """
         Hook for child classes to execute last-second operations on
-        the Transport object.
+        the Transport object. Unlike during rendering, it has been saved.
         """
         return transport
 
@@ -302,6 +332,9 @@ class SendableMixin(models.Model):
             # self.get_logger(decorated_class=SendableMixin).warning("Attempted to resend %s with Id %s", self.__class__.__name__, self.pk,)
             return False
 
+        if not is_test and not self.renew_claim():
+            return False
+
         self.transport = self.as_transport(recipient_address=recipient_address,
             is_test=is_test, **kwargs)
         return self.transport.send()
@@ -8,13 +8,13 @@ import traceback
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
-# 3rd Party
-import html2text
-
 # Local Apps
 from grapevine.models.base import GrapevineModel
+from grapevine.utils import html_to_text, ContentTypeRepo
 
 
 class Transport(GrapevineModel):
@@ -75,7 +75,7 @@ class Transport(GrapevineModel):
 
     def determine_text_body(self):
         if not bool(self.text_body):
-            self.text_body = html2text.html2text(self.html_body)
+            self.text_body = html_to_text(self.html_body)
 
     def save(self, *args, **kwargs):
         """
@@ -106,33 +106,47 @@ class Transport(GrapevineModel):
             is_sent = self._send(*args, **kwargs)
 
             end = time.time()
-            self.communication_time = (end - start)
-
-            # Now that the message has been sent, delete it from
-            # the queue to keep lookups to that table nice and fast
-            if self.sendable:
-                self.sendable.delete_from_queue()
-
-            if is_sent:
-                self.status = self.SENT
-                self.sent_at = timezone.now()
-            else:
-                # Honor any status setting that may have happened
-                # during ``_send()``
-                if self.status == self.UNSENT:
-                    self.status = self.FAILED
-
-            self.save()
+            self.finish_send(is_sent, (end - start))
             return is_sent
         except Exception as e:
-            stack = traceback.extract_stack()
-            formatted_stack = '\n'.join(traceback.format_list(stack))
-
-            self.status = self.SEND_TIME_ERROR
-            self.append_to_log(formatted_stack, should_save=False, desc=e.args[0])
-            self.save()
+            self.fail_send(e)
             return False
 
+    def finish_send(self, is_sent, communication_time):
+        """
+        Records the outcome of a delivery attempt. Engines that put the bits
+        on the wire themselves (see ``grapevine.aio``) call this directly.
+        """
+        self.communication_time = communication_time
+
+        # Now that the message has been sent, delete it from
+        # the queue to keep lookups to that table nice and fast
+        if self.sendable:
+            self.sendable.delete_from_queue()
+
+        if is_sent:
+            self.status = self.SENT
+            self.sent_at = timezone.now()
+        else:
+            # Honor any status setting that may have happened
+            # during ``_send()``
+            if self.status == self.UNSENT:
+                self.status = self.FAILED
+
+        self.save()
+
+    def fail_send(self, e):
+        """
+        Records a delivery attempt that blew up.
+        """
+        stack = traceback.extract_stack()
+        formatted_stack = '\n'.join(traceback.format_list(stack))
+
+        # Logging reloads this instance, so set the status afterwards
+        self.append_to_log(formatted_stack, should_save=False, desc=e.args[0] if e.args else e.__class__.__name__)
+        self.status = self.SEND_TIME_ERROR
+        self.save()
+
     def _send(self, *args, **kwargs):
         """
         Actual bits onto the wire fun. Must be implemented by non-abstract
@@ -146,6 +160,9 @@ class Transport(GrapevineModel):
         Given an instance of a Sendable, this builds a corresponding instance of
         whichever child ``transport`` class this ultimately is.
 
+        The Sendable renders against the transport before it is saved, so its
+        ``pk`` is still ``None`` by then. ``alter_transport`` runs once it is.
+
         Arguments:
         @sendable           {mixed} An instance of a class using the SendableMixin
         @recipient_address  {str}   A recipient-override option. Useful in conjunction
@@ -153,41 +170,49 @@ class Transport(GrapevineModel):
         @is_test            {bool}  A bookkeeping variable to quickly see if this message
                                     was a test.
         """
-        initial_data = {
-            'type': sendable.get_content_type(),
-            'to': sendable._get_recipients(recipient_address),
-            'status': cls.UNSENT,
-            'is_test': is_test,
-        }
-
-        # Must mint the transport and save it to the Sendable
-        # ASAP in case the Sendable needs it for rendering
-        transport = cls.objects.create(**initial_data)
+        recipients = sendable._get_recipients(recipient_address)
+
+        # Resolve every field before the first write, so that the transport
+        # row is only written once here and once more after sending
+        transport = cls(type=sendable.get_content_type(), status=cls.UNSENT, is_test=is_test).ensure_guid()
         if not is_test:
-            # Save the link between sendable and message
-            sendable.message = transport
-            sendable.save()
+            # The Sendable may need its transport while rendering (for
+            # ``get_absolute_url``, say). Until it is saved below, only
+            # its guid and the fields set above are available.
+            sendable._message = transport
 
-        # Do not render until **AFTER** ``sendable.message``
-        # has been set with the Transport because those details
-        # may be required for rendering.
         transport.html_body = sendable.html_body
         transport.text_body = sendable.text_body
 
-        should_resave = False
         for key, value in cls.extra_transport_data(sendable, **kwargs).items():
-            should_resave = True
             setattr(transport, key, value)
 
+        transport.save(force_insert=True)
+        if recipients:
+            transport.add_recipients(recipients)
+
+        if not is_test:
+            # Save the link between sendable and message
+            sendable.message = transport
+            sendable.save()
+
         # Allow the Sendable object to make last second modifications to the
         # Transport. This may include adding tags, altering attributes, etc.
+        field_values = transport.field_values()
         transport = sendable.alter_transport(transport, **kwargs)
 
-        if should_resave:
+        if transport.field_values() != field_values:
             transport.save()
 
         return transport
 
+    def add_recipients(self, recipients):
+        """
+        Must be implemented by non-abstract Transport subclasses that
+        are built with ``from_sendable``.
+        """
+        raise NotImplementedError("%s class has not implemented ``add_recipients``" % (self.__class__.__name__,))
+
     @staticmethod
     def extra_transport_data(sendable, data, **kwargs):
         """
@@ -208,9 +233,26 @@ class QueuedMessage(GrapevineModel):
 
     message = GenericForeignKey('message_type', 'message_id')
 
+    # Set by ``SendableQuerySet.claim()``, whose claims expire after
+    # ``SEND_CLAIM_LEASE_SECONDS`` in case their sender died. ``None`` for
+    # messages handed to a task queue, which never expire.
+    claimed_at = models.DateTimeField(null=True, default=None, blank=True, db_index=True,
+        verbose_name="Claimed At")
+
     class Meta:
         verbose_name = "Queued Message"
         verbose_name_plural = "Queued Messages"
+        # Doubles as the lock that stops concurrent senders
+        # from claiming the same message
+        unique_together = (
+            ('message_type', 'message_id',),
+        )
 
     def unicode(self):
         return 'Queued Message %s:%s' % (self.message_type_id, self.message_id,)
+
+
+@receiver(post_save, sender=ContentType)
+@receiver(post_delete, sender=ContentType)
+def invalidate_content_type_repo(sender, **kwargs):
+    ContentTypeRepo().clear()
@@ -6,6 +6,7 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 from django.db import models, transaction
+from django.db.models import functions
 from django.utils import timezone
 
 
@@ -104,6 +105,24 @@ class GrapevineLogicModel(models.Model):
     def get_content_type(cls):
         return ContentType.objects.get_for_model(cls)
 
+    @classmethod
+    def field_names(cls):
+        return [field.name for field in cls._meta.get_fields()]
+
+    def field_values(self):
+        """
+        The current value of every concrete field, in a form that can be
+        compared to tell whether anything changed.
+        """
+        return [getattr(self, field.attname) for field in self._meta.concrete_fields]
+
+    def reload(self):
+        """
+        Refreshes every field on this instance from the database.
+        """
+        self.refresh_from_db()
+        return self
+
     def append_to_log(self, log, should_save=True, desc=None, should_use_transaction=True,
                       should_reload=True):
         """
@@ -128,14 +147,26 @@ class GrapevineLogicModel(models.Model):
             self.log = ''
             self.save()
 
-        if isinstance(log, dict):
-            log = json.dumps(log)
-
         if should_reload:
             # Update local data to ensure sure nothing else committed something
             # to this record before we entered this transaction.
             self.reload()
 
+        self.log += self.format_log(log, desc)
+        if should_save:
+            self.save()
+
+        return self
+
+    @staticmethod
+    def format_log(log, desc=None):
+        """
+        Formats a log, optional name, and timestamp into the block of text
+        that gets appended to a ``log`` field.
+        """
+        if isinstance(log, dict):
+            log = json.dumps(log)
+
         pre_log = '##################\n'
         pre_log += '%s\n' % timezone.now().strftime('%b %d, %Y, %I:%M:%S %p UTC')
         if desc:
@@ -143,11 +174,42 @@ class GrapevineLogicModel(models.Model):
 
         post_log = '\n##################\n'
 
-        self.log += '%s%s%s' % (pre_log, log, post_log,)
-        if should_save:
-            self.save()
+        return '%s%s%s' % (pre_log, log, post_log,)
 
-        return self
+    @classmethod
+    def bulk_append_to_log(cls, logs, batch_size=100):
+        """
+        Appends to the ``log`` of many records at once, with one UPDATE per
+        ``batch_size`` records and without loading any of them first.
+
+        Arguments:
+        @logs        {dict}  Lists of logs, as accepted by ``append_to_log()``,
+                             keyed by the pk of the record they belong to.
+        @batch_size  {int}   How many records to update per query.
+
+        Returns  {int}  How many records were updated
+        """
+        assert 'log' in cls.field_names(), "Cannot call ``bulk_append_to_log()`` on \
+            model without a field named ``log``."
+
+        fields = {}
+        if 'updated_at' in cls.field_names():
+            fields['updated_at'] = timezone.now()
+
+        pks = list(logs.keys())
+        num_updated = 0
+        for i in range(0, len(pks), batch_size):
+            whens = [
+                models.When(pk=pk, then=functions.Concat(
+                    functions.Coalesce('log', models.Value('')),
+                    models.Value(''.join(cls.format_log(log) for log in logs[pk])),
+                    output_field=models.TextField()))
+                for pk in pks[i:i + batch_size]
+            ]
+            fields['log'] = models.Case(*whens, output_field=models.TextField())
+            num_updated += cls.objects.filter(pk__in=pks[i:i + batch_size]).update(**fields)
+
+        return num_updated
 
 
 class GrapevineModel(GrapevineLogicModel, GrapevineTimeKeepingModel):
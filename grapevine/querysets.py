@@ -1,11 +1,14 @@
 from __future__ import unicode_literals
+import datetime
 
 # Django
-from django.utils import timezone
+from django.db import connections, transaction, IntegrityError
 from django.db.models.query import QuerySet
+from django.utils import timezone
 
 # Local Apps
 from . import models
+from grapevine.settings import grapevine_settings
 
 
 class SendableQuerySet(QuerySet):
@@ -20,11 +23,25 @@ class SendableQuerySet(QuerySet):
         return self.filter(scheduled_send_time__lte=timezone.now())
 
     def not_queued(self):
-        message_ids = models.QueuedMessage.objects.\
-            filter(message_type=self.model.get_content_type()).\
-            values_list('message_id', flat=True)
+        """
+        Anti-joins against ``QueuedMessage`` with a correlated ``NOT EXISTS``,
+        which the database answers with one probe of the unique
+        (message_type, message_id) index per row, rather than building the
+        full list of queued ids for this content type.
+        """
+        quote_name = connections[self.db].ops.quote_name
+        queued_table = quote_name(models.QueuedMessage._meta.db_table)
 
-        return self.exclude(pk__in=message_ids)
+        not_exists = "NOT EXISTS (SELECT 1 FROM {queued} WHERE {queued}.{message_type} = %s " \
+            "AND {queued}.{message_id} = {table}.{pk})".format(
+                queued=queued_table,
+                message_type=quote_name(models.QueuedMessage._meta.get_field('message_type').column),
+                message_id=quote_name(models.QueuedMessage._meta.get_field('message_id').column),
+                table=quote_name(self.model._meta.db_table),
+                pk=quote_name(self.model._meta.pk.column),
+            )
+
+        return self.extra(where=[not_exists], params=[self.model.get_content_type().pk])
 
     def is_sendable(self):
         """
@@ -36,6 +53,135 @@ class SendableQuerySet(QuerySet):
     def is_eligible(self):
         return self.unsent().ready_to_send().not_queued().is_sendable()
 
+    def skip_locked(self):
+        """
+        Where the database supports it, selects rows with
+        ``SELECT ... FOR UPDATE SKIP LOCKED`` so that concurrent sender
+        processes walk disjoint rows instead of fighting over the same ones.
+        A no-op everywhere else. Only meaningful inside a transaction.
+        """
+        features = connections[self.db].features
+        if getattr(features, 'has_select_for_update_skip_locked', False):
+            return self.select_for_update(skip_locked=True)
+        return self
+
+    def claim(self):
+        """
+        Alert: Evaluates the queryset!
+
+        Writes a ``QueuedMessage`` row for each object in this queryset. The
+        unique constraint on that table means exactly one process can hold
+        the claim on a given object, so any number of sender processes can
+        run side by side without double-sending. Claims expire, so senders
+        must ``renew_claim()`` each object right before sending it.
+
+        Returns the claimed objects, freshly loaded from the database.
+        """
+        content_type = self.model.get_content_type()
+
+        # Before this queryset is evaluated, so abandoned objects are included
+        self.expire_claims()
+
+        claimed_at = timezone.now()
+        claimed_pks = []
+        with transaction.atomic(using=self.db):
+            for pk in self.skip_locked().values_list('pk', flat=True):
+                try:
+                    with transaction.atomic(using=self.db):
+                        models.QueuedMessage.objects.create(message_type=content_type, message_id=pk,
+                                                            claimed_at=claimed_at)
+                except IntegrityError:
+                    # Another process beat us to it
+                    continue
+                claimed_pks.append(pk)
+
+        # Another process may have claimed, sent, and released some of these
+        # rows between our read and our claim. Only hand back what is still
+        # waiting to be sent, and let go of the rest.
+        objs = [obj for obj in self.model.objects.filter(pk__in=claimed_pks).
+                unsent().ready_to_send().is_sendable().order_by('pk')]
+        for obj in objs:
+            # Lets ``renew_claim()`` tell whether the claim is still ours
+            obj._claimed_at = claimed_at
+
+        stale_pks = set(claimed_pks) - set(obj.pk for obj in objs)
+        if stale_pks:
+            self.model.objects.filter(pk__in=stale_pks).release()
+
+        return objs
+
+    def expire_claims(self, lease_seconds=None):
+        """
+        Drops claims on this model's objects that are older than
+        ``lease_seconds``, as the sender holding them has most likely died.
+
+        Arguments:
+        @lease_seconds  {int}  Defaults to ``GRAPEVINE['SEND_CLAIM_LEASE_SECONDS']``.
+
+        Returns  {int}  How many claims were dropped
+        """
+        if lease_seconds is None:
+            lease_seconds = grapevine_settings.SEND_CLAIM_LEASE_SECONDS
+            if lease_seconds is None:
+                return 0
+
+        expired = models.QueuedMessage.objects.filter(
+            message_type=self.model.get_content_type(),
+            claimed_at__lt=timezone.now() - datetime.timedelta(seconds=lease_seconds))
+        num_deleted, num_deleted_by_model = expired.delete()
+        return num_deleted
+
+    def release(self):
+        """
+        Drops any claims held on the objects in this queryset. The inverse
+        of ``claim()``.
+        """
+        models.QueuedMessage.objects.filter(
+            message_type=self.model.get_content_type(),
+            message_id__in=[pk for pk in self.values_list('pk', flat=True)]).delete()
+
+    def in_batches(self, batch_size=None, should_claim=False):
+        """
+        Alert: Evaluates the queryset, one batch at a time!
+
+        Yields lists of at most ``batch_size`` objects, walking the rows in
+        ascending ``pk`` order. Each batch is fetched with a fresh
+        ``pk > last_pk`` query rather than an OFFSET, so rows that drop out
+        of the queryset between batches (because they were just sent) never
+        cause later rows to be skipped. A ``batch_size`` of ``None`` yields
+        everything as a single batch.
+
+        With ``should_claim``, each batch is ``claim()``ed before it is
+        yielded, and only the objects this process won are included. The
+        caller is responsible for releasing claims it does not use.
+        """
+        if should_claim:
+            self.expire_claims()
+
+        queryset = self.order_by('pk')
+        last_pk = None
+        while True:
+            batch_queryset = queryset
+            if last_pk is not None:
+                batch_queryset = batch_queryset.filter(pk__gt=last_pk)
+
+            if should_claim:
+                with transaction.atomic(using=self.db):
+                    pks = [pk for pk in batch_queryset.skip_locked().values_list('pk', flat=True)[:batch_size]]
+                    if not pks:
+                        return
+                    last_pk = pks[-1]
+                    batch = self.model.objects.filter(pk__in=pks).claim()
+            else:
+                batch = [obj for obj in batch_queryset[:batch_size]]
+                if not batch:
+                    return
+                last_pk = batch[-1].pk
+
+            # Every row in this batch may have been claimed elsewhere
+            if batch:
+                yield batch
+
     def with_messages(self, should_preload_events=True):
         """
         Alert: Evaluates the queryset and attaches the ``_message`` attr!
@@ -58,6 +204,9 @@ class SendableQuerySet(QuerySet):
         if should_preload_events and hasattr(transport_class, "events"):
             messages = messages.prefetch_related("events")
 
+        if hasattr(transport_class, "recipients"):
+            messages = messages.prefetch_related("recipients")
+
         for message in messages:
             message_id_map[message.pk]._message = message
 
@@ -0,0 +1,215 @@
+from __future__ import unicode_literals
+import copy
+import threading
+import time
+
+# Django
+from django.template import Context
+from django.template.base import NodeList, TextNode, VariableNode
+from django.template.context import BaseContext
+from django.template.defaulttags import CommentNode, IfNode, LoadNode
+from django.template.loader_tags import BlockNode, ExtendsNode
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
+
+# Local Apps
+from grapevine.settings import grapevine_settings
+
+
+# Nodes that render the same no matter the context
+STATIC_NODES = (TextNode, CommentNode, LoadNode,)
+
+
+class CannotFlatten(Exception):
+    """
+    Raised for templates whose inheritance can only be worked out while
+    rendering, which are then rendered the regular way.
+    """
+    pass
+
+
+class RenderOnceTemplate(object):
+    """
+    A compiled template split into the fragments that come out the same for
+    every render, which are joined up front, and the nodes that depend on
+    the context, which are the only thing evaluated per render.
+
+    ``{% extends %}`` chains are resolved up front too, with each
+    ``{% block %}`` replaced by the content that would end up in it, and
+    static content inside ``{% if %}``, ``{% for %}`` and the like is joined
+    the same way. Templates whose parent is only known at render time, or
+    that use ``{{ block.super }}``, keep their inheritance as is.
+
+    Usage:
+        template = RenderOnceTemplate(get_template("emails/welcome.html"))
+        for sendable in sendables:
+            template.render(sendable.get_context())
+    """
+
+    def __init__(self, template):
+        # Django's template backends wrap the compiled template
+        self.template = getattr(template, 'template', template)
+
+        try:
+            nodelist, blocks = self.resolve_extends(self.template)
+            self.parts = self.compile_nodelist(nodelist, blocks)
+        except CannotFlatten:
+            self.parts = self.compile_nodelist(self.template.nodelist, {}, should_recurse=False)
+
+    def resolve_extends(self, template):
+        """
+        Returns  (nodelist, blocks)  The nodelist of the topmost template in
+                                     the ``{% extends %}`` chain, and the
+                                     ``BlockNode`` each block name resolves to.
+        """
+        nodelist = template.nodelist
+        blocks = {}
+        names = set()
+        while True:
+            extends_nodes = [node for node in nodelist if isinstance(node, ExtendsNode)]
+            if not extends_nodes:
+                return nodelist, blocks
+
+            parent_name = extends_nodes[0].parent_name
+            if parent_name.filters or not isinstance(parent_name.var, six.string_types) or parent_name.var in names:
+                raise CannotFlatten()
+            names.add(parent_name.var)
+
+            for name, block in extends_nodes[0].blocks.items():
+                if any(node.filter_expression.token.startswith('block.')
+                       for node in block.nodelist.get_nodes_by_type(VariableNode)):
+                    raise CannotFlatten()
+                # The most derived template's block wins
+                blocks.setdefault(name, block)
+
+            nodelist = template.engine.get_template(parent_name.var).nodelist
+
+    def compile_nodelist(self, nodelist, blocks, should_recurse=True):
+        """
+        Returns  {list}  Strings for runs of static content, joined, and
+                         the nodes left to render per context.
+        """
+        parts = []
+        for node in nodelist:
+            if isinstance(node, STATIC_NODES):
+                text = node.render(Context()) if not isinstance(node, TextNode) else node.s
+                if parts and isinstance(parts[-1], six.text_type):
+                    parts[-1] += text
+                else:
+                    parts.append(text)
+                continue
+
+            if not should_recurse:
+                parts.append(node)
+                continue
+
+            if isinstance(node, BlockNode):
+                block_parts = self.compile_nodelist(blocks.get(node.name, node).nodelist, blocks)
+            else:
+                block_parts = [self.compile_node(node, blocks)]
+
+            for part in block_parts:
+                if parts and isinstance(part, six.text_type) and isinstance(parts[-1], six.text_type):
+                    parts[-1] += part
+                else:
+                    parts.append(part)
+        return parts
+
+    def compile_node(self, node, blocks):
+        """
+        A copy of ``node``, whose own nodelists are compiled as above. The
+        original may be shared through Django's template cache, so it is
+        left alone.
+        """
+        compiled = copy.copy(node)
+        if isinstance(node, IfNode):
+            compiled.conditions_nodelists = [(condition, self.as_nodelist(nodelist, blocks),)
+                                             for condition, nodelist in node.conditions_nodelists]
+            return compiled
+
+        for attr in node.child_nodelists:
+            nodelist = getattr(node, attr, None)
+            if nodelist is None:
+                continue
+            try:
+                setattr(compiled, attr, self.as_nodelist(nodelist, blocks))
+            except AttributeError:
+                # A read-only property, as some third party tags have
+                return node
+        return compiled
+
+    def as_nodelist(self, nodelist, blocks):
+        return NodeList([TextNode(part) if isinstance(part, six.text_type) else part
+                         for part in self.compile_nodelist(nodelist, blocks)])
+
+    def render(self, context=None):
+        """
+        Accepts a plain dict or a ``Context``, like either flavor of
+        Django template.
+        """
+        if not isinstance(context, BaseContext):
+            context = Context(context or {}, autoescape=getattr(self.template.engine, 'autoescape', True))
+
+        # Mirrors ``django.template.base.Template.render``
+        context.render_context.push()
+        try:
+            if context.template is None:
+                with context.bind_template(self.template):
+                    context.template_name = self.template.name
+                    return self._render(context)
+            else:
+                return self._render(context)
+        finally:
+            context.render_context.pop()
+
+    def _render(self, context):
+        return mark_safe(''.join([
+            part if isinstance(part, six.text_type) else force_text(part.render_annotated(context))
+            for part in self.parts
+        ]))
+
+
+class RenderOnceRepo(object):
+    """
+    The ``RenderOnceTemplate`` for each Sendable class and template name.
+    ``grapevine.sender.ScheduledSendableSender`` clears it after every
+    batch, so templates are compiled once per batch. Anywhere else, such as
+    web processes, templates are compiled afresh every ``REPO_TTL`` seconds
+    so that edits to them are eventually picked up.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Singleton implementation
+        """
+        if not cls._instance:
+            cls._instance = super(RenderOnceRepo, cls).__new__(cls, *args, **kwargs)
+            cls._instance.templates = {}
+            cls._instance.loaded_at = time.time()
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def ensure_fresh(self):
+        ttl = grapevine_settings.REPO_TTL
+        if ttl is not None and time.time() - self.loaded_at >= ttl:
+            self.clear()
+
+    def get_template(self, sendable, template_name=None):
+        key = (sendable.__class__, template_name or sendable.get_template_name(),)
+
+        self.ensure_fresh()
+        with self.lock:
+            template = self.templates.get(key, None)
+        if template is None:
+            template = RenderOnceTemplate(sendable.get_template(template_name))
+            with self.lock:
+                self.templates[key] = template
+
+        return template
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+            self.loaded_at = time.time()
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 # Local Apps
+from grapevine.rendering import RenderOnceRepo
 from grapevine.settings import grapevine_settings
 from grapevine.utils import valid_content_types
 
@@ -10,8 +11,13 @@ class ScheduledSendableSender(object):
     Loops over all ContentTypes and sends each eligible message
     that extend SendableMixin.
     """
-    def __init__(self):
-        pass
+    def __init__(self, batch_size=None):
+        """
+        Arguments:
+        batch_size  {int}   Overrides ``GRAPEVINE['SEND_BATCH_SIZE']`` for
+                            this sender.
+        """
+        self.batch_size = batch_size or grapevine_settings.SEND_BATCH_SIZE
 
     def deliver_messages(self):
         from grapevine import mixins
@@ -28,33 +34,61 @@ class ScheduledSendableSender(object):
 
             if issubclass(content_type_cls, mixins.SendableMixin):
                 num_sendables += 1
-                num_sent += ScheduledSendableSender.process_sendable_model(content_type_cls)
+                num_sent += ScheduledSendableSender.process_sendable_model(content_type_cls,
+                                                                           batch_size=self.batch_size)
 
         # self.get_logger().info("Sent %s messages for %s total Sendable models.", num_sent, num_sendables)
 
         return num_sent, num_sendables
 
     @staticmethod
-    def process_sendable_model(cls):
+    def process_sendable_model(cls, batch_size=None):
         """
         Arguments:
-        cls     {mixed}     A non-abstract Django model that extends one of
-                            Grapevine's SendableMixin classes.
+        cls         {mixed}     A non-abstract Django model that extends one of
+                                Grapevine's SendableMixin classes.
+        batch_size  {int}       How many eligible objects to load at once. Each
+                                batch is fully sent before the next is fetched.
+                                ``None`` loads every eligible object up front.
         """
         # Create a single instance of the class that actually pushes
         # the Sendable's ``send`` button, or queues up that pushing
         sender = grapevine_settings.SENDER_CLASS()
 
         # Loop over all unsent, but eligible
+        # Each batch arrives already claimed by this process, so any number
+        # of processes can run this loop at once without double-sending.
         num_sent = 0
-        sendable_objs = [obj for obj in cls.objects.is_eligible()]
-        for sendable_obj in sendable_objs:
-            # Some objects may have been scheduled for a long time and
-            # require an individual check before sending that would be
-            # too expensive to place into ``all_eligible()``.
-            should_send = sendable_obj.confirm_individual_sendability()
-            if should_send:
-                is_sent = sender.send(sendable_obj)
-                if is_sent:
-                    num_sent += 1
+        for sendable_objs in cls.objects.is_eligible().in_batches(batch_size, should_claim=True):
+            for index, sendable_obj in enumerate(sendable_objs):
+                try:
+                    # Some objects may have been scheduled for a long time and
+                    # require an individual check before sending that would be
+                    # too expensive to place into ``all_eligible()``.
+                    should_send = sendable_obj.confirm_individual_sendability()
+                    if not should_send:
+                        # Let a later run reconsider it
+                        sendable_obj.delete_from_queue()
+                        continue
+
+                    is_sent = sender.send(sendable_obj)
+                    if is_sent:
+                        num_sent += 1
+                except Exception:
+                    # Don't strand the claims we have not gotten to yet
+                    cls.objects.filter(pk__in=[obj.pk for obj in sendable_objs[index:]]).release()
+                    # Nor what the engine was already handed, which may
+                    # already be marked as sent
+                    if hasattr(sender, 'wait'):
+                        sender.wait()
+                    raise
+
+            # Engines that send in the background report back once
+            # they have finished with the batch
+            if hasattr(sender, 'wait'):
+                num_sent += sender.wait()
+
+            # Sendables that ``should_render_once`` compile their
+            # templates afresh for each batch
+            RenderOnceRepo().clear()
         return num_sent
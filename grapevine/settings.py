@@ -21,6 +21,59 @@ DEFAULTS = {
     'SENDER_CLASS': 'grapevine.engines.SynchronousSender',
     'EMAIL_BACKEND': None,
     'DEBUG_EMAIL_ADDRESS': 'test@email.com',
+    # Reuse each backend's connection across sends instead of
+    # opening and closing one per email
+    'POOL_CONNECTIONS': False,
+    # Number of eligible Sendables loaded into memory at once by
+    # the ``send_messages`` scan. ``None`` loads them all at once.
+    'SEND_BATCH_SIZE': 500,
+    # Seconds after which a sender's claim on a message it never sent or
+    # released is dropped, so that another sender can pick the message up.
+    # Senders renew each claim right before sending, and skip messages whose
+    # claim was taken over. ``None`` keeps claims forever.
+    'SEND_CLAIM_LEASE_SECONDS': 3600,
+    # Used by ``grapevine.engines.ThreadedSender``
+    'SENDER_THREADS': 8,
+    'SENDER_BACKEND_CONCURRENCY': {},
+    # Used by ``grapevine.aio.AsyncioSender``
+    'SENDER_ASYNC_CONCURRENCY': 100,
+    # Keep an in-process index of unsubscribed addresses, invalidated
+    # through a version stamp kept in this Django cache
+    'USE_UNSUBSCRIBE_INDEX': False,
+    'UNSUBSCRIBE_INDEX_CACHE': 'default',
+    # How many compiled subject/from/reply-to templates
+    # ``simple_render`` keeps around. ``0`` disables the cache.
+    'TEMPLATE_CACHE_SIZE': 256,
+    # Turns HTML bodies into plain text ones. ``grapevine.utils.lxml_converter``
+    # is much faster, but plainer and requires ``lxml``.
+    'HTML_TO_TEXT_CONVERTER': 'grapevine.utils.html2text_converter',
+    # How many converted text bodies are kept around. ``0`` disables the cache.
+    'TEXT_BODY_CACHE_SIZE': 128,
+    # How long, in seconds, in-process caches of database rows (such as
+    # ``EmailBackend`` records) and of compiled ``should_render_once``
+    # templates are trusted before being reloaded. Saves made in the same
+    # process invalidate them right away. ``None`` trusts them until then,
+    # ``0`` disables them.
+    'REPO_TTL': 300,
+    # Have webhooks append provider payloads to files in this directory
+    # and answer right away, leaving the ``drain_event_spool`` command to
+    # turn them into ``RawEvent`` rows. ``None`` writes them straight to
+    # the database instead.
+    'EVENT_SPOOL_DIR': None,
+    # How many seconds each process appends to a spool file before
+    # starting a new one. Files are drained once nobody writes to them.
+    'EVENT_SPOOL_ROTATE_SECONDS': 10,
+    # How many ``RawEvent`` rows each ``process_raw_events`` worker claims at once
+    'PROCESS_EVENTS_BATCH_SIZE': 100,
+    # Seconds after which a claimed ``RawEvent`` that still isn't processed
+    # is handed to another worker, as the one that claimed it likely died
+    'PROCESS_EVENTS_LEASE_SECONDS': 600,
+    # Processed and broken ``RawEvent`` rows older than this many days are
+    # removed by ``prune_raw_events``. ``None`` keeps them forever.
+    'RAW_EVENT_RETENTION_DAYS': None,
+    # Where ``prune_raw_events`` writes gzipped JSON-lines copies of the rows
+    # it removes. ``None`` removes them without keeping a copy.
+    'RAW_EVENT_ARCHIVE_DIR': None,
 }
 
 # These values, if unspecified, fallback to their
@@ -33,6 +86,7 @@ GLOBAL_DEFAULTS = (
 # List of settings that will be dotted import paths
 IMPORTABLE_SETTINGS = (
     'SENDER_CLASS',
+    'HTML_TO_TEXT_CONVERTER',
 )
 
 
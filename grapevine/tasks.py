@@ -6,8 +6,8 @@ try:
     from celery import shared_task
 
     @shared_task
-    def async_deliver_messages():
-        ScheduledSendableSender().deliver_messages()
+    def async_deliver_messages(batch_size=None):
+        ScheduledSendableSender(batch_size=batch_size).deliver_messages()
 
 except ImportError:
     # No celery? No worries, just no async for you.
@@ -1,10 +1,29 @@
 from __future__ import unicode_literals
+import hashlib
 import re
+import threading
+import time
+from collections import OrderedDict
 
 # Django
 from django.contrib.contenttypes.models import ContentType
 from django.shortcuts import render_to_response
 from django.template import Template, Context, RequestContext
+from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
+
+# 3rd Party
+import html2text
+
+# Local Apps
+from grapevine.settings import grapevine_settings
+
+
+# Standard {{token}} (no spaces)
+UNPOPULATED_PLACEHOLDER_REGEX = re.compile(r'{{[^\s]*}}')
+
+# Strings containing none of these have nothing to render
+TEMPLATE_SYNTAX_MARKERS = ('{{', '{%', '{#',)
 
 
 def render_view(request, template_name, context={}):
@@ -17,23 +36,166 @@ def simple_render(string, context, should_raise=True, should_autoescape=True):
     context: {"key", "value"}, the string "Hello, {{key}}!" would
     be converted to "Hello, value!"
     """
-    string = Template(string).render(Context(context, autoescape=should_autoescape))
+    # What ``Template`` would make of it, ``None`` included
+    string = force_text(string)
+    if not any(marker in string for marker in TEMPLATE_SYNTAX_MARKERS):
+        # Nothing for the template machinery to do, and nothing left
+        # unpopulated. Rendering it would only have marked it safe.
+        return mark_safe(string)
 
-    if should_raise:
-        # No-op if there are no placeholders
-        regex = r'{{[^\s]*}}'  # standard {{token}} (no spaces)
+    string = TemplateRepo().get_template(string).render(Context(context, autoescape=should_autoescape))
 
+    if should_raise:
         # Make sure we populated everything.
-        matches = re.search(regex, string)
+        matches = UNPOPULATED_PLACEHOLDER_REGEX.search(string)
         if matches:
             raise ValueError("You failed to populate everything in `%s` !" % (string,))
 
     return string
 
 
+class LRUCache(object):
+    """
+    A thread-safe mapping that forgets its least recently used entries
+    once it holds more than ``max_size`` of them.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            # Now the most recently used
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value, max_size):
+        if not max_size:
+            return
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries.keys())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TemplateRepo(object):
+    """
+    Compiled ``Template`` objects keyed by their source, so that the handful
+    of distinct subjects and addresses behind a big send are each compiled
+    once. The least recently used are dropped beyond ``TEMPLATE_CACHE_SIZE``.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Singleton implementation
+        """
+        if not cls._instance:
+            cls._instance = super(TemplateRepo, cls).__new__(cls, *args, **kwargs)
+            cls._instance.templates = LRUCache()
+        return cls._instance
+
+    def get_template(self, string):
+        template = self.templates.get(string)
+        if template is None:
+            template = Template(string)
+            self.templates.set(string, template, grapevine_settings.TEMPLATE_CACHE_SIZE)
+        return template
+
+    def clear(self):
+        self.templates.clear()
+
+
+def html_to_text(html):
+    """
+    Converts an HTML body into its plain text alternative with the
+    ``HTML_TO_TEXT_CONVERTER`` setting. Identical HTML is only converted
+    once, however many emails share it.
+    """
+    if not html:
+        return ''
+    return TextBodyRepo().get_text_body(html)
+
+
+def html2text_converter(html):
+    """
+    The default ``HTML_TO_TEXT_CONVERTER``, which produces markdown-y text.
+    """
+    return html2text.HTML2Text().handle(html)
+
+
+# Followed by a line break by ``lxml_converter``
+BLOCK_TAGS = ('address', 'blockquote', 'br', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+              'hr', 'li', 'ol', 'p', 'pre', 'table', 'tr', 'ul',)
+
+
+def lxml_converter(html):
+    """
+    A much faster, if plainer, ``HTML_TO_TEXT_CONVERTER``: just the text,
+    with a line break after each block element. Requires ``lxml``.
+    """
+    from lxml import html as lxml_html
+
+    document = lxml_html.fromstring(html)
+    for element in list(document.iter('script', 'style', 'head')):
+        element.drop_tree()
+    for element in document.iter(*BLOCK_TAGS):
+        element.tail = '\n' + (element.tail or '')
+
+    return document.text_content().strip() + '\n'
+
+
+class TextBodyRepo(object):
+    """
+    Converted text bodies keyed by a hash of their HTML, keeping up to
+    ``TEXT_BODY_CACHE_SIZE`` of the most recently used.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Singleton implementation
+        """
+        if not cls._instance:
+            cls._instance = super(TextBodyRepo, cls).__new__(cls, *args, **kwargs)
+            cls._instance.text_bodies = LRUCache()
+        return cls._instance
+
+    def get_text_body(self, html):
+        key = hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+        text_body = self.text_bodies.get(key)
+        if text_body is None:
+            text_body = grapevine_settings.HTML_TO_TEXT_CONVERTER(html)
+            self.text_bodies.set(key, text_body, grapevine_settings.TEXT_BODY_CACHE_SIZE)
+        return text_body
+
+    def clear(self):
+        self.text_bodies.clear()
+
+
 class ContentTypeRepo(object):
+    """
+    Every ``ContentType``, by pk and by ``(app_label, model)``, loaded lazily
+    and reloaded whenever one is saved or deleted in this process, or once
+    ``REPO_TTL`` seconds have passed.
+    """
     _instance = None
-    ct_map = {}
 
     def __new__(cls, *args, **kwargs):
         """
@@ -41,26 +203,50 @@ class ContentTypeRepo(object):
         """
         if not cls._instance:
             cls._instance = super(ContentTypeRepo, cls).__new__(cls, *args, **kwargs)
-            cls._instance.seed_ct_map()
+            cls._instance.ct_map = {}
+            cls._instance.name_map = {}
+            cls._instance.loaded_at = None
+            cls._instance.lock = threading.Lock()
         return cls._instance
 
+    def ensure_fresh(self):
+        with self.lock:
+            ttl = grapevine_settings.REPO_TTL
+            if self.loaded_at is None or (ttl is not None and time.time() - self.loaded_at >= ttl):
+                self.seed_ct_map()
+
     def seed_ct_map(self):
-        self.ct_map = {}
-        for ct in ContentType.objects.all():
-            self._instance.ct_map[ct.pk] = ct
+        content_types = list(ContentType.objects.all())
+        # Swapped in whole so readers never see a half-built map
+        self.ct_map = dict((ct.pk, ct,) for ct in content_types)
+        self.name_map = dict(((ct.app_label, ct.model,), ct,) for ct in content_types)
+        self.loaded_at = time.time()
+
+    def get_content_types(self):
+        self.ensure_fresh()
+        return list(self.ct_map.values())
 
     def get_content_type_by_id(self, id):
+        self.ensure_fresh()
         return self.ct_map[id]
 
+    def get_content_type_by_name(self, app_label, model):
+        self.ensure_fresh()
+        return self.name_map[(app_label, model.lower(),)]
+
     def get_class_by_id(self, id):
         return self.get_content_type_by_id(id).model_class()
 
+    def clear(self):
+        with self.lock:
+            self.loaded_at = None
+
 
 def valid_content_types():
     """
     Returns an iterator of only valid content types, using the ContentType
     lookup singleton above.
     """
-    for pk, ct in ContentTypeRepo().ct_map.items():
+    for ct in ContentTypeRepo().get_content_types():
         if bool(ct.model_class()):
             yield ct
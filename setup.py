@@ -70,6 +70,11 @@ INSTALL_REQUIRES = [
     "requests",
 ]
 
+EXTRAS_REQUIRE = {
+    # For ``grapevine.aio.AsyncioSender``, on Python 3.5+
+    "async": ["aiohttp"],
+}
+
 setup(
     name="django-grapevine",
     packages=get_packages("grapevine"),
@@ -81,6 +86,7 @@ setup(
     keywords=["django", "email", "sending", "tracking"],
     classifiers=CLASSIFIERS,
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     author="Craig Labenz",
     author_email="craig.labenz@gmail.com",
     license="MIT"
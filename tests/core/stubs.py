@@ -0,0 +1,71 @@
+from __future__ import unicode_literals
+import threading
+import time
+
+# Django
+from django.utils.six.moves import BaseHTTPServer, socketserver
+
+
+class StubProviderServer(object):
+    """
+    A local HTTP server that answers every POST like an email provider's
+    API would, after an artificial ``delay`` to stand in for network latency.
+
+    Usage:
+        with StubProviderServer(delay=0.01) as server:
+            # Point a backend at ``server.url``
+    """
+
+    def __init__(self, delay=0, status_code=200, body=b'{"message": "Queued. Thank you."}'):
+        self.delay = delay
+        self.status_code = status_code
+        self.body = body
+        self.num_requests = 0
+        self.num_connections = 0
+        self.bodies = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s/" % (self.httpd.server_address[1],)
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            # Allows clients to keep their connections alive
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+                with stub.lock:
+                    stub.num_connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                time.sleep(stub.delay)
+                with stub.lock:
+                    stub.num_requests += 1
+                    stub.bodies.append(body)
+
+                self.send_response(stub.status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(stub.body)))
+                self.end_headers()
+                self.wfile.write(stub.body)
+
+            def log_message(self, *args, **kwargs):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
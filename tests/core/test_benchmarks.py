@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+import io
+import mock
+import time
+from unittest import skipUnless
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+# Django
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+# 3rd Party
+import requests
+from grapevine.emails.backends import MailGunEmailBackend
+from grapevine.engines import SynchronousSender
+from grapevine.rendering import RenderOnceRepo
+from grapevine.settings import grapevine_settings
+
+# Local Apps
+from .stubs import StubProviderServer
+from core import models
+
+try:
+    import aiohttp
+    from grapevine.aio import AsyncioSender
+except (ImportError, SyntaxError):
+    # No aiohttp, or no asyncio syntax in this version of Python
+    aiohttp = None
+
+
+class SendingBenchmark(TransactionTestCase):
+    """
+    Not tests so much as a way to keep an eye on throughput. Results are
+    printed rather than asserted, since they depend on the machine.
+    """
+    MAILGUN = "grapevine.emails.backends.MailGunEmailBackend"
+    NUM_MESSAGES = 40
+    # Roughly what a round-trip to a provider's API costs
+    LATENCY = 0.02
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="asadf", email="asdf@asdf.com")
+
+    def make_sendables(self):
+        return [models.WelcomeEmail.objects.create(user=self.user) for i in range(self.NUM_MESSAGES)]
+
+    def report(self, name, num_messages, seconds):
+        print("\n%s: %s messages in %.2fs (%.1f messages/second)" % (
+            name, num_messages, seconds, num_messages / seconds,))
+
+    def run_synchronous(self, server):
+        sendables = self.make_sendables()
+        sender = SynchronousSender()
+
+        start = time.time()
+        for sendable in sendables:
+            sender.send(sendable, backend=self.MAILGUN)
+        return time.time() - start
+
+    def run_asyncio(self, server):
+        sendables = self.make_sendables()
+        # SQLite's in-memory test database can't take concurrent writers
+        sender = AsyncioSender(num_threads=1)
+
+        start = time.time()
+        for sendable in sendables:
+            sender.send(sendable, backend=self.MAILGUN)
+        sender.wait()
+        return time.time() - start
+
+    @skipUnless(aiohttp, "aiohttp is not installed")
+    def test_asyncio_vs_synchronous(self):
+        with StubProviderServer(delay=self.LATENCY) as server, override_settings(MAILGUN_API_URL=server.url):
+            sync_seconds = self.run_synchronous(server)
+            async_seconds = self.run_asyncio(server)
+
+        self.assertEquals(server.num_requests, self.NUM_MESSAGES * 2)
+        self.assertEquals(models.WelcomeEmail.objects.sent().count(), self.NUM_MESSAGES * 2)
+
+        self.report("SynchronousSender", self.NUM_MESSAGES, sync_seconds)
+        self.report("AsyncioSender", self.NUM_MESSAGES, async_seconds)
+
+
+@skipUnless(tracemalloc, "tracemalloc is not available")
+class MimeMemoryBenchmark(TestCase):
+    """
+    Peak memory spent preparing a Mailgun upload of a 5 MB message.
+    """
+    URL = "https://api.mailgun.net/v2/example.com/messages.mime"
+
+    def make_message(self):
+        message = EmailMultiAlternatives(subject="Big", body="Plain " * 100000, to=["big@example.com"])
+        message.attach_alternative("<p>Ünïcode HTML</p>" * 70000, "text/html")
+        message.attach("report.bin", b"\x00" * (2 * 1024 * 1024), "application/octet-stream")
+        return message
+
+    def measure(self, build_file):
+        message = self.make_message()
+
+        tracemalloc.start()
+        try:
+            requests.Request("POST", self.URL, data={"to": "big@example.com"},
+                             files={"message": build_file(message)}).prepare()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def report(self, name, peak):
+        print("\n%s: %.1f MB peak" % (name, peak / (1024.0 * 1024.0),))
+
+    def test_mime_bytes_vs_string(self):
+        string_peak = self.measure(lambda message: io.StringIO(message.message().as_string()))
+        bytes_peak = self.measure(MailGunEmailBackend.get_mime_file)
+
+        self.report("as_string() into StringIO", string_peak)
+        self.report("MIME bytes buffer", bytes_peak)
+        self.assertLess(bytes_peak, string_peak)
+
+
+class RenderingBenchmark(TestCase):
+    """
+    Renders per second of an ``{% extends %}`` based newsletter, with and
+    without ``should_render_once``.
+    """
+    NUM_RENDERS = 500
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="asadf", email="asdf@asdf.com")
+
+    def run_renders(self):
+        start = time.time()
+        for i in range(self.NUM_RENDERS):
+            models.WelcomeEmail(user=self.user).html_body
+        return time.time() - start
+
+    @mock.patch.object(models.WelcomeEmail, 'get_template_name', return_value="emails/newsletter.html")
+    def test_render_once_vs_standard(self, get_template_name):
+        standard_seconds = self.run_renders()
+        with mock.patch.object(grapevine_settings, 'REPO_TTL', None), \
+                mock.patch.object(models.WelcomeEmail, 'should_render_once', True):
+            render_once_seconds = self.run_renders()
+        RenderOnceRepo().clear()
+
+        for name, seconds in (("Standard render", standard_seconds,), ("Render once", render_once_seconds,)):
+            print("\n%s: %s renders in %.2fs (%.1f renders/second)" % (
+                name, self.NUM_RENDERS, seconds, self.NUM_RENDERS / seconds,))
+        self.assertLess(render_once_seconds, standard_seconds / 2)
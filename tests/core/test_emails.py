@@ -1,27 +1,46 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 import datetime
+import gzip
+import json
 import mock
+import os
 import requests
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+from unittest import skipUnless
 
 # Django
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core import mail
 from django.core.mail import EmailMultiAlternatives
+from django.core.management import call_command, CommandError
 from django.core.urlresolvers import reverse
-from django.test import TestCase
-from django.test.utils import override_settings
-from django.utils import timezone
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import six, timezone
 
 # 3rd Party
+from grapevine.engines import BatchSender, ThreadedSender
 from grapevine.generics import EmailSendable
+from grapevine.models import QueuedMessage
 from grapevine.settings import grapevine_settings
 from grapevine.emails.backends import MailGunEmailBackend
+from grapevine.emails.managers import RawEventManager
+from grapevine.emails.jobs import async_process_events, process_raw_events, prune_raw_events
+from grapevine.emails.spool import EventSpool
+from grapevine.emails.utils import BackendRepo, BloomFilter, ConnectionRepo, EventRepo, UnsubscribedRepo
 from grapevine.emails.models import Email, EmailRecipient, \
-    EmailBackend, EmailVariable, UnsubscribedAddress, RawEvent
+    EmailBackend, EmailVariable, Event, EmailEvent, UnsubscribedAddress, RawEvent
 
 # Local Apps
 from .factories import UserFactory, EmailFactory, SendGridEmailFactory
+from .stubs import StubProviderServer
 from core import models
 
 try:
@@ -29,6 +48,14 @@ try:
 except ImportError:
     sendgrid = None
 
+try:
+    import aiohttp
+    import asyncio
+    from grapevine.aio import AsyncioSender
+except (ImportError, SyntaxError):
+    # No aiohttp, or no asyncio syntax in this version of Python
+    aiohttp = None
+
 
 class RecipientsTester(TestCase):
     """
@@ -115,6 +142,53 @@ class RecipientsTester(TestCase):
 
         self.assertEquals(EmailRecipient.objects.filter(email=em).count(), 3)
 
+    def test_bulk_add(self):
+        """
+        However many recipients there are, they are written in one INSERT.
+        """
+        with self.assertNumQueries(1):
+            self.em.add_recipients({
+                'to': ['person%s@polo.com' % (i,) for i in range(50)],
+                'cc': 'Meat Chicken <meat@chicken.com>',
+                'bcc': ['top@secret.com'],
+            })
+
+        self.assertEquals(len(self.em.to), 50)
+        self.assertEquals(len(self.em.cc), 1)
+        self.assertEquals(len(self.em.bcc), 1)
+
+        rec = EmailRecipient.objects.get(email=self.em, type=EmailRecipient.CC)
+        self.assertEquals(rec.name, 'Meat Chicken')
+        self.assertEquals(rec.address, 'meat@chicken.com')
+        self.assertEquals(rec.domain, 'chicken.com')
+        self.assertIsNotNone(rec.created_at)
+
+    def test_cached_recipients(self):
+        """
+        All three recipient lists, and ``__str__``, come from one query.
+        """
+        self.em.add_recipients({'to': 'marco@polo.com', 'cc': 'meat@chicken.com', 'bcc': 'top@secret.com'})
+
+        em = Email.objects.get(pk=self.em.pk)
+        with self.assertNumQueries(1):
+            self.assertEquals(em.to, ['marco@polo.com'])
+            self.assertEquals(em.cc, ['meat@chicken.com'])
+            self.assertEquals(em.bcc, ['top@secret.com'])
+            self.assertIn('marco@polo.com', str(em))
+
+        # Adding recipients refreshes the cache
+        em.add_tos('another@polo.com')
+        self.assertEquals(len(em.to), 2)
+
+    def test_prefetched_recipients(self):
+        other = Email.objects.create(type=models.WelcomeEmail.get_content_type(), to=['meat@chicken.com'])
+        self.em.add_tos('marco@polo.com')
+
+        with self.assertNumQueries(2):
+            emails = [em for em in Email.objects.filter(pk__in=[self.em.pk, other.pk]).
+                      prefetch_related('recipients').order_by('pk')]
+            self.assertEquals([em.to for em in emails], [['marco@polo.com'], ['meat@chicken.com']])
+
 
 class SomeSendable(EmailSendable):
     class Meta:
@@ -165,6 +239,40 @@ class EmailSetUpTester(TestCase):
         self.assertEquals(EmailBackend.objects.all().count(), 1)
         self.assertEquals(EmailBackend.objects.first().path, self.backend_path)
 
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_backend_rows_are_cached(self):
+        BackendRepo().clear()
+        self.addCleanup(BackendRepo().clear)
+
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            backend = Email.extra_transport_data(self.ss, backend=self.backend_path)['backend']
+        with self.assertNumQueries(0):
+            self.assertIs(Email.extra_transport_data(self.ss, backend=self.backend_path)['backend'], backend)
+            self.assertIs(BackendRepo().get_backend(self.backend_path), backend)
+
+        # Saving any backend forgets what was cached
+        backend.name = 'Console'
+        backend.save()
+        with self.assertNumQueries(1):
+            self.assertEquals(BackendRepo().get_backend(self.backend_path).name, 'Console')
+
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_backend_lookup_tolerates_duplicates(self):
+        BackendRepo().clear()
+        self.addCleanup(BackendRepo().clear)
+
+        first = EmailBackend.objects.create(path=self.backend_path)
+        EmailBackend.objects.create(path=self.backend_path)
+        self.assertEquals(BackendRepo().get_backend(self.backend_path).pk, first.pk)
+
+    def test_backend_classes_are_imported_once(self):
+        backend = EmailBackend.objects.create(path='django.core.mail.backends.locmem.EmailBackend')
+        with mock.patch('django.utils.module_loading.import_module', wraps=__import__('importlib').import_module) as import_module:
+            BackendRepo().classes.pop(backend.path, None)
+            self.assertIs(backend.kls, mail.backends.locmem.EmailBackend)
+            self.assertIs(EmailBackend.objects.get(pk=backend.pk).kls, mail.backends.locmem.EmailBackend)
+        self.assertEquals(import_module.call_count, 1)
+
     def test_add_variable(self):
         em = Email.objects.create(type=models.WelcomeEmail.get_content_type())
         email_var = em.add_variable('some_key', 'some variable')
@@ -216,6 +324,250 @@ if sendgrid:
             # Should have removed the unsubscribe link
             self.assertEquals(message.smtpapi.data['filters']['subscriptiontrack']['settings']['enabled'], 0)
 
+        @mock.patch.object(grapevine_settings, 'DEBUG', False)
+        def test_request(self):
+            connection = self.email.backend.get_connection()
+            message = self.email.backend.prepare_message(self.email)
+
+            with StubProviderServer() as server, self.settings(SENDGRID_MAIL_URL=server.url):
+                self.assertTrue(connection.send(message))
+
+            body = six.moves.urllib.parse.parse_qs(server.bodies[0].decode('utf-8'))
+            self.assertEquals(body['subject'], ["LONG TIME NO SEE LOL"])
+            self.assertEquals(body['html'], ["<p>What up homeslice?</p>"])
+            self.assertEquals(body['replyto'], ["homeboy@gmail.com"])
+            self.assertEquals(len(body['to[]']), 3)
+            self.assertEquals(body['bcc[]'], ["alerts@nsa.gov"])
+            self.assertEquals(body['api_user'], ["username-would-go-here"])
+            self.assertIn(self.email.guid, json.loads(body['x-smtpapi'][0])['unique_args'].values())
+            self.assertNotIn('files', ''.join(body.keys()))
+
+        @override_settings(SENDGRID_USERNAME="SG.api-key", SENDGRID_PASSWORD=None)
+        @mock.patch.object(grapevine_settings, 'DEBUG', False)
+        def test_api_key_request(self):
+            connection = self.email.backend.get_connection()
+            message = self.email.backend.prepare_message(self.email)
+
+            url, request_kwargs = connection.get_request(message)
+            self.assertEquals(request_kwargs['headers']['Authorization'], "Bearer SG.api-key")
+
+            body = six.moves.urllib.parse.parse_qs(request_kwargs['data'])
+            self.assertNotIn('api_user', body)
+            self.assertNotIn('api_key', body)
+
+        @override_settings(SENDGRID_USERNAME=None, SENDGRID_PASSWORD="SG.api-key")
+        @mock.patch.object(grapevine_settings, 'DEBUG', False)
+        def test_batch_send(self):
+            """
+            Emails with the same content go out in one request, with a
+            personalization per email.
+            """
+            emails = [SendGridEmailFactory(subject="Newsletter", html_body="<p>News</p>") for i in range(3)]
+            for i, email in enumerate(emails):
+                email.add_tos(['reader%s@news.com' % (i,)])
+            # Different content can't share the request
+            emails.append(SendGridEmailFactory(subject="Something else"))
+            emails[-1].add_tos(['other@news.com'])
+
+            backend = emails[0].backend
+            with StubProviderServer(status_code=202, body=b'') as server, \
+                    self.settings(SENDGRID_V3_MAIL_URL=server.url):
+                self.assertEquals(backend.send_many(emails), 4)
+            ConnectionRepo().close_thread_connections()
+
+            self.assertEquals(server.num_requests, 2)
+            self.assertEquals(Email.objects.filter(status=Email.SENT).count(), 4)
+
+            payloads = sorted([json.loads(body.decode('utf-8')) for body in server.bodies],
+                              key=lambda payload: len(payload['personalizations']))
+            batch = payloads[-1]
+            self.assertEquals(batch['subject'], "Newsletter")
+            self.assertEquals([p['custom_args']['grapevine-guid'] for p in batch['personalizations']],
+                              [email.guid for email in emails[:3]])
+            self.assertEquals([p['to'] for p in batch['personalizations']],
+                              [[{'email': 'reader%s@news.com' % (i,)}] for i in range(3)])
+
+        def test_batches_respect_limits(self):
+            backend = SendGridEmailFactory().backend.get_connection()
+            backend.driver.username = None
+
+            messages = []
+            for i in range(5):
+                email = SendGridEmailFactory(subject="Newsletter", html_body="<p>News</p>")
+                email.add_tos(['reader%s@news.com' % (i,)])
+                messages.append(email.backend.as_message(email))
+
+            self.assertEquals([len(batch) for batch in backend.get_batches(messages)], [5])
+            with mock.patch.object(backend, 'MAX_PERSONALIZATIONS', 2):
+                self.assertEquals([len(batch) for batch in backend.get_batches(messages)], [2, 2, 1])
+
+            # Username/password auth can't use the v3 API
+            backend.driver.username = "username"
+            self.assertEquals([len(batch) for batch in backend.get_batches(messages)], [1, 1, 1, 1, 1])
+
+        @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+        def test_process_event(self):
+            EventRepo().clear()
+            self.addCleanup(EventRepo().clear)
+            Event.objects.create(name="Open")
+            Event.objects.create(name="Unsubscribe", should_stop_sending=True)
+            other = SendGridEmailFactory()
+
+            payload = [
+                {'event': 'open', 'timestamp': 1337966815, 'grapevine-guid': self.email.guid},
+                {'event': 'open', 'timestamp': 1337966815, 'grapevine-guid': self.email.guid},
+                {'event': 'open', 'timestamp': 1337966820, 'grapevine-guid': other.guid},
+                {'event': 'unsubscribe', 'timestamp': 1337966830, 'grapevine-guid': self.email.guid,
+                 'email': 'Marco@Polo.com'},
+                # Unknown event types, unknown guids, and foreign events are skipped
+                {'event': 'processed', 'timestamp': 1337966840, 'grapevine-guid': self.email.guid},
+                {'event': 'open', 'timestamp': 1337966850, 'grapevine-guid': 'not-a-guid'},
+                {'event': 'open', 'timestamp': 1337966860},
+            ]
+            raw_event = RawEvent.objects.create(backend=self.email.backend, payload=json.dumps(payload),
+                                                remote_ip='127.0.0.1')
+            backend = self.email.backend.get_connection()
+
+            with self.assertNumQueries(9):
+                is_processed, time_taken = backend.process_event(raw_event)
+            self.assertTrue(is_processed)
+
+            self.assertEquals(EmailEvent.objects.filter(email=self.email).count(), 2)
+            self.assertEquals(EmailEvent.objects.filter(email=other).count(), 1)
+            self.assertEquals(list(UnsubscribedAddress.objects.values_list('address', 'email')),
+                              [('marco@polo.com', self.email.pk,)])
+            self.assertEquals(Email.objects.get(pk=self.email.pk).log.count('"event": '), 3)
+            self.assertEquals(Email.objects.get(pk=other.pk).log.count('"event": '), 1)
+
+            # Processing the same payload again records nothing new
+            backend.process_event(raw_event)
+            self.assertEquals(EmailEvent.objects.count(), 3)
+            self.assertEquals(UnsubscribedAddress.objects.count(), 1)
+
+
+class UnsubscribedRepoCommitTester(TransactionTestCase):
+
+    def test_version_changes_on_commit(self):
+        version = UnsubscribedRepo.get_version()
+        with transaction.atomic():
+            UnsubscribedAddress.objects.create(address='miguel@polio.com')
+            self.assertEquals(UnsubscribedRepo.get_version(), version)
+        self.assertNotEquals(UnsubscribedRepo.get_version(), version)
+
+    @skipUnless(sendgrid, "sendgrid is not installed")
+    def test_processed_unsubscribes_change_version_on_commit(self):
+        Event.objects.create(name="Unsubscribe", should_stop_sending=True)
+        email = SendGridEmailFactory()
+        payload = [{'event': 'unsubscribe', 'timestamp': 1337966830, 'grapevine-guid': email.guid,
+                    'email': 'marco@polo.com'}]
+        raw_event = RawEvent.objects.create(backend=email.backend, payload=json.dumps(payload),
+                                            remote_ip='127.0.0.1')
+
+        version = UnsubscribedRepo.get_version()
+        with transaction.atomic():
+            email.backend.get_connection().process_event(raw_event)
+            self.assertEquals(UnsubscribedRepo.get_version(), version)
+        self.assertNotEquals(UnsubscribedRepo.get_version(), version)
+
+    def test_rollback_keeps_version(self):
+        version = UnsubscribedRepo.get_version()
+        try:
+            with transaction.atomic():
+                UnsubscribedAddress.objects.create(address='miguel@polio.com')
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEquals(UnsubscribedRepo.get_version(), version)
+
+
+@mock.patch.object(grapevine_settings, 'REPO_TTL', 60)
+class BackendRepoCommitTester(TransactionTestCase):
+
+    backend_path = 'django.core.mail.backends.locmem.EmailBackend'
+
+    def setUp(self):
+        BackendRepo().clear()
+        self.addCleanup(BackendRepo().clear)
+
+    def test_created_backend_is_cached_on_commit(self):
+        with transaction.atomic():
+            backend = BackendRepo().get_backend(self.backend_path)
+            self.assertEquals(BackendRepo().backends, {})
+
+        with self.assertNumQueries(0):
+            self.assertIs(BackendRepo().get_backend(self.backend_path), backend)
+
+    def test_rollback_forgets_created_backend(self):
+        try:
+            with transaction.atomic():
+                BackendRepo().get_backend(self.backend_path)
+                raise ValueError()
+        except ValueError:
+            pass
+
+        backend = BackendRepo().get_backend(self.backend_path)
+        self.assertTrue(EmailBackend.objects.filter(pk=backend.pk).exists())
+
+
+class EventRepoTester(TestCase):
+
+    def setUp(self):
+        EventRepo().clear()
+        self.addCleanup(EventRepo().clear)
+
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_lookups(self):
+        event = Event.objects.create(name="Open")
+        with self.assertNumQueries(1):
+            self.assertEquals(EventRepo()["Open"], event)
+            self.assertEquals(EventRepo().get_event_by_pk(event.pk), event)
+            self.assertRaises(KeyError, EventRepo().get_event_by_name, "Bounce")
+
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_saves_are_seen(self):
+        self.assertRaises(KeyError, EventRepo().get_event_by_name, "Click")
+        Event.objects.create(name="Click")
+        self.assertEquals(EventRepo()["Click"].name, "Click")
+
+    def test_expired_map_is_reloaded(self):
+        with mock.patch.object(grapevine_settings, 'REPO_TTL', 60):
+            EventRepo().ensure_fresh()
+            with self.assertNumQueries(0):
+                EventRepo().ensure_fresh()
+
+            EventRepo().loaded_at -= 61
+            with self.assertNumQueries(1):
+                EventRepo().ensure_fresh()
+
+
+class ConnectionRepoTester(TestCase):
+
+    def setUp(self):
+        ConnectionRepo().close_thread_connections()
+        self.addCleanup(ConnectionRepo().close_thread_connections)
+        self.backend = BackendRepo().get_backend('django.core.mail.backends.smtp.EmailBackend')
+
+    @mock.patch('smtplib.SMTP')
+    def test_idle_smtp_connection_is_reused(self, mocked_smtp):
+        mocked_smtp.return_value.noop.return_value = (250, b'OK')
+
+        connection = ConnectionRepo().get_connection(self.backend)
+        self.assertIs(ConnectionRepo().get_connection(self.backend), connection)
+        self.assertEquals(mocked_smtp.call_count, 1)
+
+    @mock.patch('smtplib.SMTP')
+    def test_dropped_smtp_connection_is_reopened(self, mocked_smtp):
+        """
+        A server that hung up on an idle connection must not cost the next
+        email its send.
+        """
+        connection = ConnectionRepo().get_connection(self.backend)
+        mocked_smtp.return_value.noop.side_effect = smtplib.SMTPServerDisconnected()
+
+        self.assertIsNot(ConnectionRepo().get_connection(self.backend), connection)
+        self.assertEquals(mocked_smtp.call_count, 2)
+        self.assertEquals(len(ConnectionRepo().get_thread_connections()), 1)
+
 
 class UnsubscribedTester(TestCase):
     """
@@ -258,6 +610,81 @@ class UnsubscribedTester(TestCase):
         self._all_unsubscribed(EmailFactory(), self.single_all_unsubscribed_recipients)
         self._all_unsubscribed(EmailFactory(), self.multiple_all_unsubscribed_recipients)
 
+    def test_case_insensitive(self):
+        UnsubscribedAddress.objects.create(address='Shouty McYells <SHOUTY@Yells.com>')
+        self.assertEquals(UnsubscribedAddress.objects.last().address, 'shouty@yells.com')
+
+        email = EmailFactory()
+        email.add_recipients(['Shouty@yells.com', 'LeaveMe@Alone.com', 'miguel@polio.com'])
+
+        message = email.backend.finalize_message(email.backend.as_message(email))
+        self.assertEquals(message.to, ['miguel@polio.com'])
+
+    def test_single_query(self):
+        """
+        Unsubscribes cost one query, regardless of how many recipients
+        or messages there are.
+        """
+        emails = [EmailFactory(), EmailFactory()]
+        for email in emails:
+            email.add_recipients(self.mixed_recipients)
+        messages = [email.backend.as_message(email) for email in emails]
+
+        with self.assertNumQueries(1):
+            messages = emails[0].backend.finalize_messages(messages)
+
+        for message in messages:
+            self.assertEquals(len(message.to), 1)
+            self.assertEquals(len(message.cc), 2)
+            self.assertEquals(len(message.bcc), 1)
+
+    def test_unsubscribe_index(self):
+        """
+        With the in-process index on, recipients nobody unsubscribed
+        cost no query at all.
+        """
+        email = EmailFactory()
+        email.add_recipients(self.mixed_recipients)
+
+        # ``TestCase`` never commits, so run commit hooks straight away
+        with mock.patch.object(grapevine_settings, 'USE_UNSUBSCRIBE_INDEX', True), \
+                mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            # Warm the index
+            email.backend.finalize_message(email.backend.as_message(email))
+
+            message = email.backend.as_message(email)
+            message.to = ['miguel@polio.com']
+            message.cc = []
+            message.bcc = ['you@canemailme.com']
+            with self.assertNumQueries(0):
+                email.backend.finalize_message(message)
+
+            # Positive hits are confirmed against the DB
+            message = email.backend.as_message(email)
+            with self.assertNumQueries(1):
+                message = email.backend.finalize_message(message)
+            self.assertEquals(len(message.to), 1)
+
+            # Changes to the unsubscribe list invalidate the index
+            UnsubscribedAddress.objects.create(address='miguel@polio.com')
+            message = email.backend.finalize_message(email.backend.as_message(email))
+            self.assertEquals(len(message.to), 0)
+
+            UnsubscribedAddress.objects.filter(address='miguel@polio.com').delete()
+            message = email.backend.finalize_message(email.backend.as_message(email))
+            self.assertEquals(len(message.to), 1)
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(capacity=100)
+        for i in range(100):
+            bloom_filter.add('member%s@example.com' % (i,))
+
+        for i in range(100):
+            self.assertIn('member%s@example.com' % (i,), bloom_filter)
+
+        false_positives = [i for i in range(1000) if 'stranger%s@example.com' % (i,) in bloom_filter]
+        self.assertTrue(len(false_positives) < 50)
+
     def _all_unsubscribed(self, email, recipients):
         email.add_recipients(recipients)
 
@@ -297,6 +724,223 @@ class UnsubscribedTester(TestCase):
             self.assertEquals(RawEvent.objects.first().payload, payload)
 
 
+class EventSpoolTester(TestCase):
+
+    PAYLOAD = '[{"event": "open", "timestamp": 1337966815}]'
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+        patcher = mock.patch.object(grapevine_settings, 'EVENT_SPOOL_DIR', self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_webhook_skips_database(self):
+        url = reverse('grapevine:sendgrid-events-webhook')
+        with self.assertNumQueries(0):
+            resp = self.client.post(url, data=self.PAYLOAD, content_type="application/json")
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(RawEvent.objects.count(), 0)
+
+        self.assertEquals(EventSpool().drain(should_drain_all=True), 1)
+        raw_event = RawEvent.objects.get()
+        self.assertEquals(raw_event.payload, self.PAYLOAD)
+        self.assertEquals(raw_event.backend.path, 'grapevine.emails.backends.SendGridEmailBackend')
+        self.assertEquals(os.listdir(self.path), [])
+
+    def test_files_in_use_are_skipped(self):
+        spool = EventSpool(rotate_seconds=60)
+        spool.append('grapevine.emails.backends.SendGridEmailBackend', self.PAYLOAD.encode('utf-8'), '127.0.0.1')
+        self.assertEquals(spool.drain(), 0)
+
+        # Two periods later, nobody can still be writing to it
+        with mock.patch.object(spool, 'get_bucket', return_value=spool.get_bucket() + 2):
+            self.assertEquals(spool.drain(), 1)
+
+    def test_drain_in_batches(self):
+        spool = EventSpool()
+        for i in range(5):
+            spool.append('grapevine.emails.backends.SendGridEmailBackend', self.PAYLOAD, '127.0.0.1')
+        # Cut short by a crash
+        with open(spool.get_filename(spool.get_bucket()), 'ab') as spool_file:
+            spool_file.write(b'{"backend": "grapevine.emai')
+
+        with self.assertNumQueries(7):
+            # A backend lookup and create, then three inserts, within a transaction
+            self.assertEquals(spool.drain(batch_size=2, should_drain_all=True), 5)
+        self.assertEquals(RawEvent.objects.count(), 5)
+
+    def test_interrupted_drains_are_resumed(self):
+        spool = EventSpool()
+        spool.append('grapevine.emails.backends.SendGridEmailBackend', self.PAYLOAD, '127.0.0.1')
+        filename = spool.get_filename(spool.get_bucket())
+        os.rename(filename, filename + spool.DRAINING_SUFFIX)
+
+        self.assertEquals(spool.drain(), 1)
+
+    def test_command(self):
+        EventSpool().append('grapevine.emails.backends.SendGridEmailBackend', self.PAYLOAD, '127.0.0.1')
+        call_command('drain_event_spool', '--all', stdout=six.StringIO())
+        self.assertEquals(RawEvent.objects.count(), 1)
+
+
+class RawEventWorkerTester(TestCase):
+
+    def setUp(self):
+        Event.objects.create(name="Open")
+        self.email = SendGridEmailFactory()
+        self.backend = self.email.backend
+
+    def make_raw_events(self, num):
+        payload = json.dumps([{'event': 'open', 'timestamp': 1337966815, 'grapevine-guid': self.email.guid}])
+        return [RawEvent.objects.create(backend=self.backend, payload=payload, remote_ip='127.0.0.1')
+                for i in range(num)]
+
+    def test_claim_is_exclusive(self):
+        raw_events = self.make_raw_events(3)
+        first, second = RawEvent.objects.claim(2), RawEvent.objects.claim(2)
+
+        self.assertEquals([raw_event.pk for raw_event in first], [raw_event.pk for raw_event in raw_events[:2]])
+        self.assertEquals([raw_event.pk for raw_event in second], [raw_events[2].pk])
+        self.assertEquals(RawEvent.objects.claim(2), [])
+        self.assertEquals(RawEvent.objects.filter(state=RawEvent.QUEUED).exclude(queued_at=None).count(), 3)
+
+    def test_abandoned_claims_are_requeued(self):
+        abandoned, recent = self.make_raw_events(2)
+        RawEvent.objects.claim(2)
+        RawEvent.objects.filter(pk=abandoned.pk).update(queued_at=timezone.now() - datetime.timedelta(hours=1))
+
+        with mock.patch.object(grapevine_settings, 'PROCESS_EVENTS_LEASE_SECONDS', 600):
+            self.assertEquals(process_raw_events(), 1)
+
+        self.assertEquals(RawEvent.objects.get(pk=abandoned.pk).state, RawEvent.PROCESSED)
+        self.assertEquals(RawEvent.objects.get(pk=recent.pk).state, RawEvent.QUEUED)
+
+    def test_lost_claims_are_skipped(self):
+        raw_events = self.make_raw_events(4)
+        RawEvent.objects.claim(2)
+
+        # Another worker read the same rows, but lost the race for the first two
+        with mock.patch.object(RawEventManager, 'unprocessed',
+                               lambda manager: manager.exclude(state=RawEvent.PROCESSED)):
+            claimed = RawEvent.objects.claim(2)
+
+        self.assertEquals([raw_event.pk for raw_event in claimed], [raw_event.pk for raw_event in raw_events[2:]])
+
+    def test_process_in_batches(self):
+        self.make_raw_events(5)
+        with mock.patch.object(EmailBackend, 'kls', new_callable=mock.PropertyMock,
+                               return_value=self.backend.kls) as kls:
+            self.assertEquals(process_raw_events(batch_size=2), 5)
+
+        # One backend instance per batch
+        self.assertEquals(kls.call_count, 3)
+        self.assertEquals(RawEvent.objects.exclude(state=RawEvent.PROCESSED).count(), 0)
+        self.assertEquals(RawEvent.objects.filter(processed_on=None).count(), 0)
+        self.assertEquals(EmailEvent.objects.filter(email=self.email).count(), 5)
+
+    def test_limit(self):
+        self.make_raw_events(3)
+        self.assertEquals(async_process_events(limit=2), 2)
+        self.assertEquals(RawEvent.objects.unprocessed().count(), 1)
+
+    def test_broken_events_release_their_claims(self):
+        broken, raw_event = self.make_raw_events(2)
+        broken.payload = '[{"event": "open", "grapevine-guid": "%s"}]' % (self.email.guid,)
+        broken.save()
+
+        self.assertEquals(process_raw_events(), 2)
+        broken.refresh_from_db()
+        self.assertEquals(broken.state, RawEvent.BROKEN)
+        self.assertIsNotNone(RawEvent.objects.get(pk=raw_event.pk).processed_on)
+
+    @skipUnless(connection.vendor == 'sqlite', "Reads SQLite's query plan")
+    def test_indexes_survive_migrations(self):
+        """
+        The state indexes are made by hand, outside of Django's migration
+        state, so nothing else notices when a table rebuild drops them.
+        """
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, RawEvent._meta.db_table)
+        self.assertIn('emails_rawevent_pending', constraints)
+        self.assertIn('emails_rawevent_queued', constraints)
+
+    def test_pending_lookup_uses_index(self):
+        self.make_raw_events(2)
+        queryset = RawEvent.objects.unprocessed().order_by('pk').values_list('pk', flat=True)
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('emails_rawevent_pending', plan)
+
+    def test_backend_process_events(self):
+        self.make_raw_events(2)
+        other_backend = EmailBackend.objects.create(path='grapevine.emails.backends.MailGunEmailBackend')
+        RawEvent.objects.create(backend=other_backend, payload='[]', remote_ip='127.0.0.1')
+
+        self.assertEquals(self.backend.get_connection().process_events(), 2)
+        self.assertEquals(RawEvent.objects.unprocessed().get().backend, other_backend)
+
+    def test_command(self):
+        self.make_raw_events(2)
+        stdout = six.StringIO()
+        call_command('process_raw_events', '--batch-size', '1', stdout=stdout)
+        self.assertEquals(stdout.getvalue().strip(), "Processed 2 raw events.")
+
+
+class PruneRawEventsTester(TestCase):
+
+    def setUp(self):
+        self.backend = EmailBackend.objects.create(path='grapevine.emails.backends.SendGridEmailBackend')
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def make_raw_event(self, state, days_old):
+        raw_event = RawEvent.objects.create(backend=self.backend, payload='[{"event": "open"}]',
+                                            remote_ip='127.0.0.1', state=state)
+        RawEvent.objects.filter(pk=raw_event.pk).update(
+            created_at=timezone.now() - datetime.timedelta(days=days_old))
+        return raw_event
+
+    def test_prune(self):
+        old = [self.make_raw_event(RawEvent.PROCESSED, 40), self.make_raw_event(RawEvent.BROKEN, 40)]
+        # Too young, or not done with yet
+        kept = [self.make_raw_event(RawEvent.PROCESSED, 10), self.make_raw_event(RawEvent.PENDING, 40),
+                self.make_raw_event(RawEvent.QUEUED, 40)]
+
+        email_event = EmailEvent.objects.create(email=EmailFactory(), event=Event.objects.create(name="Open"),
+                                                raw_event=old[0], happened_at=timezone.now())
+
+        self.assertEquals(prune_raw_events(days=30, archive_dir=self.path, batch_size=1), 2)
+        self.assertEquals(set(RawEvent.objects.values_list('pk', flat=True)), set(raw_event.pk for raw_event in kept))
+
+        # The event outlives its payload
+        email_event.refresh_from_db()
+        self.assertIsNone(email_event.raw_event)
+
+        archive_filename, = os.listdir(self.path)
+        with gzip.open(os.path.join(self.path, archive_filename), 'rb') as archive_file:
+            rows = [json.loads(line.decode('utf-8')) for line in archive_file]
+        self.assertEquals([row['pk'] for row in rows], [raw_event.pk for raw_event in old])
+        self.assertEquals(rows[0]['payload'], '[{"event": "open"}]')
+        self.assertEquals(rows[0]['backend__path'], self.backend.path)
+
+    @mock.patch.object(grapevine_settings, 'RAW_EVENT_RETENTION_DAYS', 30)
+    def test_command(self):
+        self.make_raw_event(RawEvent.PROCESSED, 40)
+        stdout = six.StringIO()
+        call_command('prune_raw_events', stdout=stdout)
+
+        self.assertEquals(stdout.getvalue().strip(), "Removed 1 raw events.")
+        self.assertEquals(RawEvent.objects.count(), 0)
+
+    def test_retention_is_required(self):
+        self.assertRaises(CommandError, call_command, 'prune_raw_events', stdout=six.StringIO())
+
+
 @override_settings(EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend')
 class GrapevineSenderTester(TestCase):
     """
@@ -334,6 +978,14 @@ class GrapevineSenderTester(TestCase):
         # And now the sendable must be considered ineligible
         self.assertEquals(models.WelcomeEmail.objects.is_eligible().count(), 0)
 
+    def test_queued_other_types_are_eligible(self):
+        """
+        A queued message of another type that happens to share our
+        sendable's pk must not hide it.
+        """
+        QueuedMessage.objects.create(message_type=Email.get_content_type(), message_id=self.sendable.pk)
+        self.assertEquals(models.WelcomeEmail.objects.is_eligible().count(), 1)
+
     def test_future_messages_are_ineligible(self):
         """
         Verifies that queued messages are ineligible for sending (other than
@@ -354,6 +1006,58 @@ class GrapevineSenderTester(TestCase):
         self.assertEquals(num_sent, 1)
         self.assertTrue(num_sendables > 0)
 
+    def test_transport_writes(self):
+        """
+        The transport row is written once while it is built and once more
+        after sending.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            transport = self.sendable.as_transport()
+        self.assertEquals(self.get_email_writes(queries), ['INSERT'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(transport.send())
+        self.assertEquals(self.get_email_writes(queries), ['UPDATE'])
+
+        self.assertEquals(models.WelcomeEmail.objects.get(pk=self.sendable.pk).message_id, transport.pk)
+        self.assertEquals(transport.subject, "Welcome to Acme Inc, asadf!")
+        # The transport was available, unsaved, while rendering
+        self.assertIn(transport.guid, self.sendable.get_context()['view_on_site_uri'])
+
+    def test_transport_while_rendering(self):
+        """
+        Sendables render against their transport before it is saved, and
+        only see it saved in ``alter_transport``.
+        """
+        seen = {}
+
+        def compile_context(sendable):
+            seen['rendering'] = (sendable.message.pk, sendable.message.guid,)
+            return {'sendable': sendable, 'user': sendable.user}
+
+        def alter_transport(sendable, transport, **kwargs):
+            seen['altering'] = transport.pk
+            return transport
+
+        with mock.patch.object(models.WelcomeEmail, 'compile_context', autospec=True, side_effect=compile_context), \
+                mock.patch.object(models.WelcomeEmail, 'alter_transport', autospec=True, side_effect=alter_transport):
+            transport = self.sendable.as_transport()
+
+        self.assertEquals(seen['rendering'], (None, transport.guid,))
+        self.assertEquals(seen['altering'], transport.pk)
+
+    def test_transport_queries(self):
+        # Warm up the backend and content type lookups
+        models.WelcomeEmail.objects.create(user=self.user).as_transport()
+
+        # INSERT the email, fetch its backend, INSERT its recipients, UPDATE the sendable
+        with self.assertNumQueries(4):
+            self.sendable.as_transport()
+
+    def get_email_writes(self, queries):
+        return [query['sql'].split()[0] for query in queries
+                if query['sql'].startswith(('INSERT', 'UPDATE',)) and '"emails_email"' in query['sql']]
+
     def test_final_check(self):
         """
         Individual models are able to able to opt-out of being sent according
@@ -373,10 +1077,385 @@ class GrapevineSenderTester(TestCase):
         self.sendable = models.WelcomeEmail.objects.get(pk=self.sendable.pk)
         self.assertTrue(self.sendable.cancelled_at_send_time)
 
+    def test_in_batches(self):
+        """
+        Eligible sendables are walked in ``pk`` order, ``batch_size`` at a time.
+        """
+        for i in range(4):
+            models.WelcomeEmail.objects.create(user=self.user)
+
+        batches = list(models.WelcomeEmail.objects.is_eligible().in_batches(2))
+        self.assertEquals([len(batch) for batch in batches], [2, 2, 1])
+
+        pks = [obj.pk for batch in batches for obj in batch]
+        self.assertEquals(pks, sorted(pks))
+        self.assertEquals(len(set(pks)), 5)
+
+        # No batch size means one big batch
+        batches = list(models.WelcomeEmail.objects.is_eligible().in_batches())
+        self.assertEquals([len(batch) for batch in batches], [5])
+
+    def test_batched_send(self):
+        """
+        Sending batch by batch must not skip rows that shift out of the
+        eligible set as their predecessors are sent.
+        """
+        for i in range(4):
+            models.WelcomeEmail.objects.create(user=self.user)
+
+        num_sent = self.sender.process_sendable_model(models.WelcomeEmail, batch_size=2)
+        self.assertEquals(num_sent, 5)
+        self.assertEquals(models.WelcomeEmail.objects.is_eligible().count(), 0)
+
+    def test_claim_is_exclusive(self):
+        """
+        Only one sender process may hold the claim on a given sendable.
+        """
+        claimed = models.WelcomeEmail.objects.is_eligible().claim()
+        self.assertEquals([obj.pk for obj in claimed], [self.sendable.pk])
+        self.assertEquals(QueuedMessage.objects.count(), 1)
+
+        # A second process working from a stale read comes away empty handed
+        self.assertEquals(models.WelcomeEmail.objects.all().claim(), [])
+        self.assertEquals(models.WelcomeEmail.objects.is_eligible().count(), 0)
+
+        models.WelcomeEmail.objects.all().release()
+        self.assertEquals(QueuedMessage.objects.count(), 0)
+        self.assertEquals(models.WelcomeEmail.objects.is_eligible().count(), 1)
+
+    def test_abandoned_claims_expire(self):
+        """
+        Claims held longer than the lease are taken over by the next sender.
+        """
+        models.WelcomeEmail.objects.is_eligible().claim()
+        QueuedMessage.objects.update(claimed_at=timezone.now() - datetime.timedelta(hours=2))
+
+        with mock.patch.object(grapevine_settings, 'SEND_CLAIM_LEASE_SECONDS', 3600):
+            claimed = models.WelcomeEmail.objects.is_eligible().claim()
+        self.assertEquals([obj.pk for obj in claimed], [self.sendable.pk])
+        self.assertTrue(QueuedMessage.objects.get().claimed_at > timezone.now() - datetime.timedelta(hours=1))
+
+    def test_renewed_claims_are_kept(self):
+        sendable = models.WelcomeEmail.objects.is_eligible().claim()[0]
+        sendable._claimed_at = timezone.now() - datetime.timedelta(hours=2)
+        QueuedMessage.objects.update(claimed_at=sendable._claimed_at)
+
+        self.assertTrue(sendable.renew_claim())
+        with mock.patch.object(grapevine_settings, 'SEND_CLAIM_LEASE_SECONDS', 3600):
+            self.assertEquals(models.WelcomeEmail.objects.is_eligible().claim(), [])
+
+    def test_lost_claims_are_not_sent(self):
+        """
+        A sender that outlived its lease must not send what another sender
+        has since claimed.
+        """
+        sendable = models.WelcomeEmail.objects.is_eligible().claim()[0]
+        QueuedMessage.objects.update(claimed_at=timezone.now() - datetime.timedelta(hours=2))
+        with mock.patch.object(grapevine_settings, 'SEND_CLAIM_LEASE_SECONDS', 3600):
+            models.WelcomeEmail.objects.is_eligible().claim()
+
+        self.assertFalse(sendable.send())
+        self.assertFalse(BatchSender().send(sendable))
+        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(QueuedMessage.objects.count(), 1)
+
+    def test_queued_messages_never_expire(self):
+        """
+        Messages handed to a task queue are not claims, and must not expire.
+        """
+        self.sendable.denote_as_queued()
+
+        with mock.patch.object(grapevine_settings, 'SEND_CLAIM_LEASE_SECONDS', 0):
+            self.assertEquals(models.WelcomeEmail.objects.is_eligible().claim(), [])
+
+    def test_claim_skips_sent(self):
+        """
+        Rows that were sent after being read must not be handed back.
+        """
+        stale_queryset = models.WelcomeEmail.objects.filter(pk=self.sendable.pk)
+        self.sendable.send()
+
+        self.assertEquals(stale_queryset.claim(), [])
+        self.assertEquals(QueuedMessage.objects.count(), 0)
+
+    def test_claimed_elsewhere_are_not_sent(self):
+        other = models.WelcomeEmail.objects.create(user=self.user)
+        models.WelcomeEmail.objects.filter(pk=other.pk).claim()
+
+        num_sent = self.sender.process_sendable_model(models.WelcomeEmail, batch_size=1)
+        self.assertEquals(num_sent, 1)
+        self.assertFalse(models.WelcomeEmail.objects.get(pk=other.pk).is_sent)
+
+    def test_final_check_releases_claim(self):
+        self.user.email = ''
+        self.user.save()
+
+        self.sender.deliver_messages()
+        self.assertEquals(QueuedMessage.objects.count(), 0)
+
+    def test_send_messages_command(self):
+        models.WelcomeEmail.objects.create(user=self.user)
+
+        call_command('send_messages', batch_size=1, stdout=six.StringIO())
+        self.assertEquals(models.WelcomeEmail.objects.is_eligible().count(), 0)
+        self.assertEquals(models.WelcomeEmail.objects.sent().count(), 2)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend')
+class ThreadedSenderTester(TransactionTestCase):
+    """
+    Worker threads use their own DB connections, so they can only see
+    committed rows. SQLite's shared in-memory test database does not
+    tolerate concurrent writers, so tests that really write stick to
+    a single worker thread.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="asadf", email="asdf@asdf.com")
+        self.sendables = [models.WelcomeEmail.objects.create(user=self.user) for i in range(5)]
+
+    def test_send(self):
+        sender = ThreadedSender(num_threads=1)
+        for sendable in self.sendables:
+            self.assertIsNone(sender.send(sendable))
+
+        self.assertEquals(sender.wait(), 5)
+        self.assertEquals(models.WelcomeEmail.objects.sent().count(), 5)
+
+        # The pool shuts down once drained
+        self.assertEquals(sender.threads, [])
+        self.assertEquals(sender.wait(), 0)
+
+    def test_backend_concurrency(self):
+        """
+        No more than the configured number of sends may be in flight
+        against a single backend.
+        """
+        state = {'in_flight': 0, 'max_in_flight': 0}
+        lock = threading.Lock()
+
+        def fake_send(*args, **kwargs):
+            with lock:
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            time.sleep(0.01)
+            with lock:
+                state['in_flight'] -= 1
+            return True
+
+        backend_path = grapevine_settings.EMAIL_BACKEND
+        sender = ThreadedSender(num_threads=4, backend_concurrency={backend_path: 1})
+        self.assertEquals(sender.get_backend_path(self.sendables[0]), backend_path)
+
+        with mock.patch.object(models.WelcomeEmail, 'send', side_effect=fake_send):
+            for sendable in self.sendables:
+                sender.send(sendable)
+            self.assertEquals(sender.wait(), 5)
+
+        self.assertEquals(state['max_in_flight'], 1)
+
+    def test_errors_are_reraised(self):
+        sender = ThreadedSender(num_threads=2)
+        self.sendables[0].denote_as_queued()
+
+        with mock.patch.object(models.WelcomeEmail, 'send', side_effect=ValueError("Boom")):
+            sender.send(self.sendables[0])
+            self.assertRaises(ValueError, sender.wait)
+
+        # The failed sendable's claim was released
+        self.assertEquals(QueuedMessage.objects.count(), 0)
+
+    def test_process_sendable_model(self):
+        from grapevine.sender import ScheduledSendableSender
+
+        with mock.patch.object(grapevine_settings, 'SENDER_CLASS', lambda: ThreadedSender(num_threads=1)):
+            num_sent = ScheduledSendableSender.process_sendable_model(models.WelcomeEmail, batch_size=2)
+
+        self.assertEquals(num_sent, 5)
+        self.assertEquals(QueuedMessage.objects.count(), 0)
+
+
+class BatchSenderTester(TestCase):
+
+    MAILGUN = "grapevine.emails.backends.MailGunEmailBackend"
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="asadf", email="asdf@asdf.com")
+        self.sendables = [models.WelcomeEmail.objects.create(user=self.user) for i in range(5)]
+
+    def test_send(self):
+        sender = BatchSender()
+        for sendable in self.sendables:
+            self.assertIsNone(sender.send(sendable))
+
+        backend_cls = EmailBackend.objects.get(path=grapevine_settings.EMAIL_BACKEND).kls
+        with mock.patch.object(backend_cls, 'send_messages', autospec=True,
+                               side_effect=backend_cls.send_messages) as send_messages:
+            self.assertEquals(sender.wait(), 5)
+
+        # Django's own backends can't say which of a batch went out, so
+        # they're handed one message at a time
+        self.assertEquals(send_messages.call_count, 5)
+        self.assertEquals(len(mail.outbox), 5)
+
+        self.assertEquals(Email.objects.filter(status=Email.SENT, sent_at__isnull=False).count(), 5)
+        self.assertEquals(models.WelcomeEmail.objects.sent().count(), 5)
+        self.assertEquals(sender.wait(), 0)
+
+    def test_error_mid_batch(self):
+        """
+        Sendables handed over before an error are still delivered.
+        """
+        from grapevine.sender import ScheduledSendableSender
+
+        with mock.patch.object(grapevine_settings, 'SENDER_CLASS', BatchSender), \
+                mock.patch.object(models.WelcomeEmail, 'confirm_individual_sendability',
+                                  side_effect=[True, True, ValueError()]):
+            self.assertRaises(ValueError, ScheduledSendableSender.process_sendable_model, models.WelcomeEmail)
+
+        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals([email.status for email in Email.objects.all()], [Email.SENT, Email.SENT])
+        self.assertEquals(models.WelcomeEmail.objects.sent().count(), 2)
+        self.assertEquals(models.WelcomeEmail.objects.is_eligible().count(), 3)
+        self.assertEquals(QueuedMessage.objects.count(), 0)
+
+    def test_partial_failure(self):
+        """
+        Only the messages that didn't go out are marked as failed.
+        """
+        emails = [sendable.as_transport() for sendable in self.sendables[:3]]
+
+        backend_cls = emails[0].backend.kls
+        with mock.patch.object(backend_cls, 'send_messages', side_effect=[1, 0, 1]), \
+                self.assertLogs('grapevine.emails.models', 'WARNING') as logged:
+            self.assertEquals(emails[0].backend.send_many(emails), 2)
+
+        self.assertEquals([Email.objects.get(pk=email.pk).status for email in emails],
+                          [Email.SENT, Email.FAILED, Email.SENT])
+        self.assertEquals(len(logged.output), 1)
+        self.assertIn("Email %s was not sent" % (emails[1].pk,), logged.output[0])
+
+    @mock.patch.object(grapevine_settings, 'DEBUG', False)
+    def test_unsubscribed(self):
+        UnsubscribedAddress.objects.create(address=self.user.email)
+
+        sender = BatchSender()
+        sender.send(self.sendables[0])
+        self.assertEquals(sender.wait(), 0)
+
+        self.assertEquals(Email.objects.get().status, Email.UNSUBSCRIBED)
+        self.assertEquals(len(mail.outbox), 0)
+
+    def test_provider_failure(self):
+        emails = [sendable.as_transport(backend=self.MAILGUN) for sendable in self.sendables[:2]]
+
+        with StubProviderServer(status_code=400, body=b'{"message": "Nope"}') as server, \
+                self.settings(MAILGUN_API_URL=server.url), \
+                self.assertLogs('grapevine.emails.models', 'WARNING'):
+            self.assertEquals(emails[0].backend.send_many(emails, fail_silently=True), 0)
+        ConnectionRepo().close_thread_connections()
+
+        for email in Email.objects.all():
+            self.assertEquals(email.status, Email.FAILED)
+            self.assertIn("Nope", email.log)
+
+    def test_process_sendable_model(self):
+        from grapevine.sender import ScheduledSendableSender
+
+        with mock.patch.object(grapevine_settings, 'SENDER_CLASS', BatchSender):
+            num_sent = ScheduledSendableSender.process_sendable_model(models.WelcomeEmail, batch_size=2)
+
+        self.assertEquals(num_sent, 5)
+        self.assertEquals(len(mail.outbox), 5)
+        self.assertEquals(QueuedMessage.objects.count(), 0)
+
+
+@skipUnless(aiohttp, "aiohttp is not installed")
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend')
+class AsyncioSenderTester(TransactionTestCase):
+
+    MAILGUN = "grapevine.emails.backends.MailGunEmailBackend"
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="asadf", email="asdf@asdf.com")
+        self.sendables = [models.WelcomeEmail.objects.create(user=self.user) for i in range(5)]
+
+    def test_send(self):
+        """
+        Backends that implement ``get_request`` have their provider
+        calls made from the event loop.
+        """
+        sender = AsyncioSender(num_threads=1)
+        with StubProviderServer() as server, override_settings(MAILGUN_API_URL=server.url):
+            for sendable in self.sendables:
+                self.assertIsNone(sender.send(sendable, backend=self.MAILGUN))
+            self.assertEquals(sender.wait(), 5)
+
+        self.assertEquals(server.num_requests, 5)
+        self.assertEquals(Email.objects.filter(status=Email.SENT).count(), 5)
+        self.assertEquals(models.WelcomeEmail.objects.sent().count(), 5)
+
+    def test_async_send_messages(self):
+        emails = [sendable.as_transport(backend=self.MAILGUN) for sendable in self.sendables[:2]]
+        messages = [emails[0].backend.prepare_message(email) for email in emails]
+
+        async def send(connection, loop):
+            async with aiohttp.ClientSession(loop=loop) as session:
+                return await connection.async_send_messages(messages, session)
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with StubProviderServer() as server, override_settings(MAILGUN_API_URL=server.url):
+            connection = emails[0].backend.get_connection()
+            self.assertEquals(loop.run_until_complete(send(connection, loop)), 2)
+
+        self.assertEquals(server.num_requests, 2)
+
+    def test_provider_failure(self):
+        sender = AsyncioSender(num_threads=1)
+        with StubProviderServer(status_code=400, body=b'{"message": "Nope"}') as server, \
+                override_settings(MAILGUN_API_URL=server.url):
+            sender.send(self.sendables[0], backend=self.MAILGUN)
+            self.assertEquals(sender.wait(), 0)
+
+        email = Email.objects.get()
+        self.assertEquals(email.status, Email.SEND_TIME_ERROR)
+
+    def test_timeout(self):
+        """
+        asyncio timeouts carry no message of their own.
+        """
+        async def time_out(connection, email_message, session):
+            raise asyncio.TimeoutError()
+
+        sender = AsyncioSender(num_threads=1)
+        with mock.patch.object(MailGunEmailBackend, 'async_send_message', time_out):
+            sender.send(self.sendables[0], backend=self.MAILGUN)
+            self.assertEquals(sender.wait(), 0)
+
+        email = Email.objects.get()
+        self.assertEquals(email.status, Email.SEND_TIME_ERROR)
+        self.assertIn("TimeoutError", email.log)
+
+    def test_fallback(self):
+        """
+        Other backends are sent start to finish on the thread pool.
+        """
+        sender = AsyncioSender(num_threads=1)
+        for sendable in self.sendables:
+            sender.send(sendable)
+        self.assertEquals(sender.wait(), 5)
+        self.assertEquals(models.WelcomeEmail.objects.sent().count(), 5)
+
 
 @override_settings(EMAIL_BACKEND="grapevine.emails.backends.MailGunEmailBackend")
 class MailgunTester(TestCase):
 
+    def setUp(self):
+        # Pooled connections hold on to the API url they were opened with
+        ConnectionRepo().close_thread_connections()
+        self.addCleanup(ConnectionRepo().close_thread_connections)
+
     def test_base_send(self):
         user = UserFactory()
         we = models.WelcomeEmail.objects.create(user=user)
@@ -394,6 +1473,88 @@ class MailgunTester(TestCase):
         self.assertEquals(we.message_id, 1)
         self.assertEquals(Email.objects.get(pk=1).status, Email.SENT)
 
+    @mock.patch.object(grapevine_settings, 'POOL_CONNECTIONS', True)
+    def test_pooled_connection(self):
+        with StubProviderServer() as server:
+            with self.settings(MAILGUN_API_URL=server.url):
+                for i in range(3):
+                    we = models.WelcomeEmail.objects.create(user=UserFactory())
+                    self.assertTrue(we.send(backend=settings.EMAIL_BACKEND))
+
+                self.assertEquals(server.num_requests, 3)
+                # One keep-alive connection served every send
+                self.assertEquals(server.num_connections, 1)
+
+                connection = list(ConnectionRepo().get_thread_connections().values())[0]
+                self.assertIsNotNone(connection.session)
+                ConnectionRepo().close_thread_connections()
+                self.assertIsNone(connection.session)
+
+    @mock.patch.object(grapevine_settings, 'POOL_CONNECTIONS', False)
+    def test_unpooled_connection(self):
+        with StubProviderServer() as server:
+            with self.settings(MAILGUN_API_URL=server.url):
+                for i in range(2):
+                    we = models.WelcomeEmail.objects.create(user=UserFactory())
+                    self.assertTrue(we.send(backend=settings.EMAIL_BACKEND))
+
+                self.assertEquals(server.num_connections, 2)
+
+    @mock.patch.object(grapevine_settings, 'POOL_CONNECTIONS', True)
+    def test_broken_connection_is_discarded(self):
+        we = models.WelcomeEmail.objects.create(user=UserFactory())
+        with mock.patch.object(MailGunEmailBackend, 'post', side_effect=requests.ConnectionError("Reset")):
+            self.assertFalse(we.send(backend=settings.EMAIL_BACKEND))
+
+        self.assertEquals(Email.objects.get(pk=we.message_id).status, Email.SEND_TIME_ERROR)
+        self.assertEquals(ConnectionRepo().get_thread_connections(), {})
+
+    @mock.patch.object(grapevine_settings, 'DEBUG', False)
+    def test_batch_send(self):
+        emails = []
+        for i in range(3):
+            email = EmailFactory(backend=settings.EMAIL_BACKEND, subject="Newsletter")
+            email.add_tos(['Reader %s <reader%s@news.com>' % (i, i,)])
+            emails.append(email)
+        # Several TO recipients can't be batched, as they'd each get their own copy
+        emails.append(EmailFactory(backend=settings.EMAIL_BACKEND, subject="Newsletter"))
+        emails[-1].add_tos(['one@news.com', 'two@news.com'])
+
+        with StubProviderServer() as server, self.settings(MAILGUN_API_URL=server.url):
+            self.assertEquals(emails[0].backend.send_many(emails), 4)
+        ConnectionRepo().close_thread_connections()
+
+        self.assertEquals(server.num_requests, 2)
+        self.assertEquals(Email.objects.filter(status=Email.SENT).count(), 4)
+
+        batch = [six.moves.urllib.parse.parse_qs(body.decode('utf-8')) for body in server.bodies
+                 if b'recipient-variables' in body][0]
+        self.assertEquals(batch['to'], ['Reader %s <reader%s@news.com>' % (i, i,) for i in range(3)])
+        self.assertEquals(batch['v:grapevine-guid'], ['%recipient.guid%'])
+        self.assertEquals(json.loads(batch['recipient-variables'][0]),
+                          dict(('reader%s@news.com' % (i,), {'guid': emails[i].guid},) for i in range(3)))
+
+    def test_batches_split_on_repeated_recipients(self):
+        backend = MailGunEmailBackend()
+        messages = []
+        for address in ['a@news.com', 'b@news.com', 'A <A@news.com>']:
+            message = EmailMultiAlternatives(subject="Newsletter", body="News", to=[address])
+            message._email = Email().ensure_guid()
+            messages.append(message)
+
+        self.assertEquals([len(batch) for batch in backend.get_batches(messages)], [2, 1])
+        with mock.patch.object(MailGunEmailBackend, 'MAX_BATCH_RECIPIENTS', 1):
+            self.assertEquals([len(batch) for batch in backend.get_batches(messages)], [1, 1, 1])
+
+    def test_mime_file(self):
+        email_message = EmailMultiAlternatives(subject="Olé", body="Ça va? ☃", to=["meat@chicken.com"])
+
+        mime = MailGunEmailBackend.get_mime_file(email_message).read()
+
+        self.assertIsInstance(mime, six.binary_type)
+        self.assertIn(b"Subject: =?utf-8?q?Ol=C3=A9?=", mime)
+        self.assertIn("Ça va? ☃".encode('utf-8'), mime)
+
     def test_prepare_data(self):
         email_message = EmailMultiAlternatives(
             subject="Hello old friend!",
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import mock
+
+# Django
+from django.contrib.auth import get_user_model
+from django.template import Context, Template
+from django.template.loader import get_template
+from django.template.loader_tags import BlockNode, ExtendsNode
+from django.test import TestCase
+
+# 3rd Party
+from grapevine.rendering import RenderOnceRepo, RenderOnceTemplate
+from grapevine.settings import grapevine_settings
+
+# Local Apps
+from core import models
+
+
+class RenderOnceTemplateTester(TestCase):
+
+    SOURCE = ("{% load static %}<h1>Hi {{ name }}</h1>{# Nobody sees this #}<p>Static</p>"
+              "{% if is_vip %}<b>VIP</b>{% endif %}<p>{{ html }}</p>")
+
+    def test_matches_django(self):
+        template = Template(self.SOURCE)
+        render_once = RenderOnceTemplate(template)
+
+        for context in [{'name': 'Marco', 'is_vip': True, 'html': '<i>'}, {'name': 'Polo'}]:
+            self.assertEquals(render_once.render(context), template.render(Context(context)))
+            self.assertEquals(render_once.render(Context(context)), template.render(Context(context)))
+
+    def test_static_fragments_are_joined(self):
+        parts = RenderOnceTemplate(Template(self.SOURCE)).parts
+        self.assertIn("</h1><p>Static</p>", parts)
+        self.assertEquals(len(parts), 7)
+
+    def test_static_fragments_in_tags_are_joined(self):
+        template = Template("{% for i in items %}<b>{# Hidden #}Item</b> {{ i }}{% endfor %}")
+        loop = RenderOnceTemplate(template).parts[0]
+        self.assertEquals(loop.nodelist_loop[0].s, "<b>Item</b> ")
+        # The template itself is left alone
+        self.assertEquals(len(template.nodelist[0].nodelist_loop), 3)
+
+    def test_extends(self):
+        template = get_template("emails/newsletter.html")
+        render_once = RenderOnceTemplate(template)
+
+        context = {'sendable': {'user': "Marco", 'email': "marco@polo.com"}, 'view_on_site_uri': "/view/"}
+        self.assertEquals(render_once.render(context), template.render(context))
+        self.assertFalse([part for part in render_once.parts if isinstance(part, (BlockNode, ExtendsNode,))])
+        # The layout comes out as one fragment, up to the first variable
+        self.assertIn("<title>This week at Acme Inc</title>", render_once.parts[0])
+
+    def test_block_super_is_left_to_django(self):
+        template = Template('{% extends "emails/base.html" %}{% block title %}News | {{ block.super }}{% endblock %}')
+        render_once = RenderOnceTemplate(template)
+
+        self.assertIsInstance(render_once.parts[0], ExtendsNode)
+        self.assertEquals(render_once.render({}), template.render(Context({})))
+        self.assertIn("<title>News | Acme Inc</title>", render_once.render({}))
+
+    def test_dynamic_parent_is_left_to_django(self):
+        template = Template('{% extends parent %}{% block title %}News{% endblock %}')
+        render_once = RenderOnceTemplate(template)
+
+        context = {'parent': "emails/base.html"}
+        self.assertIsInstance(render_once.parts[0], ExtendsNode)
+        self.assertEquals(render_once.render(context), template.render(Context(context)))
+
+
+class RenderOnceSendableTester(TestCase):
+
+    def setUp(self):
+        RenderOnceRepo().clear()
+        self.addCleanup(RenderOnceRepo().clear)
+
+        self.users = [get_user_model().objects.create(username="user%s" % (i,), email="user%s@a.com" % (i,))
+                      for i in range(3)]
+
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_render_once(self):
+        expected = [models.WelcomeEmail(user=user).html_body for user in self.users]
+
+        with mock.patch.object(models.WelcomeEmail, 'should_render_once', True), \
+                mock.patch.object(models.WelcomeEmail, 'get_template',
+                                  autospec=True, side_effect=models.WelcomeEmail.get_template) as get_template:
+            rendered = [models.WelcomeEmail(user=user).html_body for user in self.users]
+
+        self.assertEquals(rendered, expected)
+        self.assertEquals(get_template.call_count, 1)
+
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_cleared_after_each_batch(self):
+        from grapevine.sender import ScheduledSendableSender
+        for user in self.users:
+            models.WelcomeEmail.objects.create(user=user)
+
+        with mock.patch.object(models.WelcomeEmail, 'should_render_once', True), \
+                mock.patch.object(models.WelcomeEmail, 'get_template',
+                                  autospec=True, side_effect=models.WelcomeEmail.get_template) as get_template:
+            ScheduledSendableSender.process_sendable_model(models.WelcomeEmail, batch_size=2)
+
+        self.assertEquals(get_template.call_count, 2)
+        self.assertEquals(RenderOnceRepo().templates, {})
+
+    def test_expired_templates_are_recompiled(self):
+        """
+        Outside of the sender, nothing clears the repo but ``REPO_TTL``.
+        """
+        with mock.patch.object(grapevine_settings, 'REPO_TTL', 60), \
+                mock.patch.object(models.WelcomeEmail, 'should_render_once', True), \
+                mock.patch.object(models.WelcomeEmail, 'get_template',
+                                  autospec=True, side_effect=models.WelcomeEmail.get_template) as get_template:
+            models.WelcomeEmail(user=self.users[0]).html_body
+            models.WelcomeEmail(user=self.users[1]).html_body
+            self.assertEquals(get_template.call_count, 1)
+
+            RenderOnceRepo().loaded_at -= 61
+            models.WelcomeEmail(user=self.users[2]).html_body
+            self.assertEquals(get_template.call_count, 2)
@@ -28,3 +28,9 @@ class TransportTester(TestCase):
         self.tp.html_body = '<p>Peña</p>'
         self.tp.determine_text_body()
         self.assertEquals(self.tp.text_body, 'Peña\n\n')
+
+    def test_existing_text_body_is_kept(self):
+        self.tp.html_body = '<p>Hello</p>'
+        self.tp.text_body = 'Hand written'
+        self.tp.determine_text_body()
+        self.assertEquals(self.tp.text_body, 'Hand written')
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import mock
+from unittest import skipUnless
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+# Django
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.template import Context, Template
+from django.test import TestCase
+from django.utils.safestring import SafeText
+
+# 3rd Party
+from grapevine import utils
+from grapevine.settings import grapevine_settings
+from grapevine.utils import html_to_text, lxml_converter, simple_render, valid_content_types, \
+    ContentTypeRepo, TemplateRepo, TextBodyRepo
+
+# Local Apps
+from core import models
+
+
+class SimpleRenderTester(TestCase):
+
+    def setUp(self):
+        TemplateRepo().clear()
+
+    def test_render(self):
+        self.assertEquals(simple_render("Hello, {{ name }}!", {"name": "Marco"}), "Hello, Marco!")
+        self.assertEquals(simple_render("{% if name %}Hi{% endif %}", {"name": "Marco"}), "Hi")
+
+    def test_unpopulated(self):
+        context = {"name": "{{first_name}}"}
+        self.assertRaises(ValueError, simple_render, "Hello, {{ name }}!", context)
+        self.assertEquals(simple_render("Hello, {{ name }}!", context, should_raise=False), "Hello, {{first_name}}!")
+
+    def test_autoescape(self):
+        self.assertEquals(simple_render("{{ name }}", {"name": "<b>"}), "&lt;b&gt;")
+        self.assertEquals(simple_render("{{ name }}", {"name": "<b>"}, should_autoescape=False), "<b>")
+
+    def test_plain_strings_skip_templates(self):
+        with mock.patch.object(utils, 'Template') as template:
+            self.assertEquals(simple_render("Marco <marco@polo.com>", {}), "Marco <marco@polo.com>")
+        self.assertFalse(template.called)
+
+    def test_plain_strings_render_like_templates(self):
+        for string in ["Marco <marco@polo.com>", None, 42]:
+            rendered = simple_render(string, {})
+            self.assertEquals(rendered, Template(string).render(Context({})))
+            self.assertIsInstance(rendered, SafeText)
+
+    def test_templates_are_compiled_once(self):
+        with mock.patch.object(utils, 'Template', wraps=utils.Template) as template:
+            for name in ["Marco", "Polo", "Marco"]:
+                simple_render("Hello, {{ name }}!", {"name": name})
+        self.assertEquals(template.call_count, 1)
+
+    @mock.patch.object(grapevine_settings, 'TEMPLATE_CACHE_SIZE', 2)
+    def test_least_recently_used_are_dropped(self):
+        for string in ["{{ a }}", "{{ b }}", "{{ a }}", "{{ c }}"]:
+            simple_render(string, {"a": 1, "b": 2, "c": 3})
+
+        self.assertEquals(TemplateRepo().templates.keys(), ["{{ a }}", "{{ c }}"])
+
+
+class HtmlToTextTester(TestCase):
+
+    HTML = '<p>Hello, old friend. Click <a href="http://www.google.com">here</a>.</p>'
+
+    def setUp(self):
+        TextBodyRepo().clear()
+
+    def test_converted_once(self):
+        converter = mock.Mock(return_value="Hello")
+        with mock.patch.object(grapevine_settings, 'HTML_TO_TEXT_CONVERTER', converter):
+            for i in range(3):
+                self.assertEquals(html_to_text(self.HTML), "Hello")
+            self.assertEquals(html_to_text(""), "")
+
+        converter.assert_called_once_with(self.HTML)
+
+    @mock.patch.object(grapevine_settings, 'TEXT_BODY_CACHE_SIZE', 0)
+    def test_cache_disabled(self):
+        converter = mock.Mock(return_value="Hello")
+        with mock.patch.object(grapevine_settings, 'HTML_TO_TEXT_CONVERTER', converter):
+            html_to_text(self.HTML)
+            html_to_text(self.HTML)
+
+        self.assertEquals(converter.call_count, 2)
+
+    def test_from_sendable_converts_once(self):
+        user = get_user_model().objects.create(username="asadf", email="asdf@asdf.com")
+        sendables = [models.WelcomeEmail.objects.create(user=user) for i in range(2)]
+
+        converter = mock.Mock(return_value="Welcome")
+        with mock.patch.object(grapevine_settings, 'HTML_TO_TEXT_CONVERTER', converter):
+            emails = [sendable.as_transport() for sendable in sendables]
+
+        self.assertEquals([email.text_body for email in emails], ["Welcome", "Welcome"])
+        self.assertEquals(converter.call_count, 1)
+
+    @skipUnless(lxml, "lxml is not installed")
+    def test_lxml_converter(self):
+        html = "<html><head><title>T</title></head><body><h1>Peña</h1><p>One<br>Two</p><script>x()</script></body></html>"
+        self.assertEquals(lxml_converter(html), "Peña\nOne\nTwo\n")
+
+
+class ContentTypeRepoTester(TestCase):
+
+    def setUp(self):
+        ContentTypeRepo().clear()
+        self.addCleanup(ContentTypeRepo().clear)
+
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_lookups(self):
+        ct = ContentType.objects.get_for_model(models.WelcomeEmail)
+        with self.assertNumQueries(1):
+            self.assertEquals(ContentTypeRepo().get_content_type_by_id(ct.pk), ct)
+            self.assertEquals(ContentTypeRepo().get_content_type_by_name('core', 'WelcomeEmail'), ct)
+            self.assertEquals(ContentTypeRepo().get_class_by_id(ct.pk), models.WelcomeEmail)
+
+    @mock.patch.object(grapevine_settings, 'REPO_TTL', None)
+    def test_new_content_types_are_seen(self):
+        ContentTypeRepo().get_content_types()
+        ct = ContentType.objects.create(app_label='core', model='gone')
+
+        self.assertEquals(ContentTypeRepo().get_content_type_by_id(ct.pk), ct)
+        # Stale content types have no model class
+        self.assertNotIn(ct, list(valid_content_types()))
@@ -34,6 +34,8 @@ GRAPEVINE = {
     'DEBUG': True,
     'DEBUG_EMAIL_ADDRESS': 'test@djangograpevine.com',
     'SENDER_CLASS': 'grapevine.engines.SynchronousSender',
+    # Rows cached in-process would outlive each test's rolled back transaction
+    'REPO_TTL': 0,
 }
 ######## END GRAPEVINE CONFIGURATION
 